@@ -0,0 +1,275 @@
+import os
+import queue
+import smtplib
+import threading
+import time
+
+
+class EmailChannel:
+    """
+    Sends alerts by email over a single SMTP session that is kept open between messages. The session is opened on the
+    first message and reopened if the server dropped it, so the EHLO/STARTTLS/login handshake is not repeated for every
+    alert. The defaults are the same account used by deviation_notifier.email_alert.
+
+    :param host: SMTP server
+    :type host: str
+    :param port: SMTP port
+    :type port: int
+    :param sender: address the alerts are sent from, also used to log in
+    :type sender: str
+    :param recipient: address the alerts are sent to, by default the sender
+    :type recipient: str
+    :param password: password of the sender, by default the EMAIL_PASS environment variable. No login is done without
+    a password, e.g. for a local SMTP server.
+    :type password: str
+    :param starttls: whether to upgrade the session to TLS
+    :type starttls: bool
+    :param timeout: seconds to wait on the SMTP server before giving up
+    :type timeout: float
+    """
+
+    name = 'email'
+
+    def __init__(self, host='smtp.gmail.com', port=587, sender='biosimulator@gmail.com', recipient=None,
+                 password=None, starttls=True, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipient = recipient if recipient is not None else sender
+        self.password = password if password is not None else os.environ.get('EMAIL_PASS')
+        self.starttls = starttls
+        self.timeout = timeout
+        self.smtp = None
+
+    def connect(self):
+        """
+        Opens the SMTP session.
+        :return: None
+        """
+        smtp_obj = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        smtp_obj.ehlo()
+        if self.starttls:
+            smtp_obj.starttls()
+            smtp_obj.ehlo()
+        if self.password:
+            smtp_obj.login(self.sender, self.password)
+        self.smtp = smtp_obj
+
+    def send(self, subject, body):
+        """
+        Sends one email, reconnecting once if the open session turns out to be closed.
+        :param subject: subject of the email
+        :type subject: str
+        :param body: text of the email
+        :type body: str
+        :return: None
+        """
+        for attempt in range(2):
+            if self.smtp is None:
+                self.connect()
+            try:
+                self.smtp.sendmail(self.sender, self.recipient, f'Subject: {subject}\n\n{body}')
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.smtp = None
+                if attempt:
+                    raise
+
+    def close(self):
+        """
+        Ends the SMTP session.
+        :return: None
+        """
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.smtp = None
+
+
+class SmsChannel:
+    """
+    Sends alerts by text through Twilio with one client that is reused for every message. The defaults are the same
+    account used by deviation_notifier.text_alert.
+
+    :param to: phone number the alerts are sent to, by default the PHONE environment variable
+    :type to: str
+    :param from_: Twilio phone number the alerts are sent from
+    :type from_: str
+    :param timeout: seconds to wait on Twilio before giving up
+    :type timeout: float
+    :param client: an existing Twilio client, by default one is created from the TWILIO_SID and TWILIO_TOKEN
+    environment variables on the first message
+    """
+
+    name = 'sms'
+
+    def __init__(self, to=None, from_='+14154814546', timeout=10.0, client=None):
+        self.to = to if to is not None else os.environ.get('PHONE')
+        self.from_ = from_
+        self.timeout = timeout
+        self.client = client
+
+    def send(self, subject, body):
+        """
+        Sends one text message.
+        :param subject: not used for texts
+        :type subject: str
+        :param body: text of the message
+        :type body: str
+        :return: None
+        """
+        if self.client is None:
+            from twilio.rest import Client
+            from twilio.http.http_client import TwilioHttpClient
+
+            self.client = Client(os.environ.get('TWILIO_SID'), os.environ.get('TWILIO_TOKEN'),
+                                 http_client=TwilioHttpClient(timeout=self.timeout))
+        self.client.messages.create(to=self.to, from_=self.from_, body=body)
+
+    def close(self):
+        """
+        Twilio clients do not hold a session open, so there is nothing to close.
+        :return: None
+        """
+
+
+def format_alerts(alerts):
+    """
+    Writes one message for a group of deviations. A single deviation uses the same text as email_alert.
+    :param alerts: the reactor, failing parameter and start time of each deviation
+    :type alerts: list of tuples
+    :return: the text of the message
+    :rtype: str
+    """
+    lines = []
+    for reactor, label, start in alerts:
+        prefix = f'{reactor}: ' if reactor else ''
+        lines.append(f'{prefix}Deviation with {label} at {start}')
+    return '\n'.join(lines)
+
+
+class AlertDispatcher:
+    """
+    Delivers alerts from a background thread so sending an email or text never blocks the simulation or detection
+    loop. Alerts are put on a queue by submit and the worker waits coalesce seconds after the first alert for any
+    others, so several parameters failing at the same time are sent as one message. A message that fails to send on a
+    channel is retried with an exponential backoff.
+
+    :param channels: the channels every message is sent on, e.g. EmailChannel and SmsChannel
+    :type channels: list
+    :param coalesce: seconds to wait for more alerts before sending a message
+    :type coalesce: float
+    :param retries: number of times a failed message is retried on each channel
+    :type retries: int
+    :param backoff: seconds to wait before the first retry, doubled for every further retry
+    :type backoff: float
+    :param max_backoff: the longest wait between two retries in seconds
+    :type max_backoff: float
+    """
+
+    def __init__(self, channels, coalesce=1.0, retries=3, backoff=0.5, max_backoff=30.0):
+        self.channels = list(channels)
+        self.coalesce = coalesce
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queue = queue.Queue()
+        self.thread = None
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        """
+        Starts the background worker.
+        :return: the dispatcher so it can be created and started in one line
+        :rtype: AlertDispatcher
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.work, name='alert-dispatcher', daemon=True)
+            self.thread.start()
+        return self
+
+    def submit(self, reactor, label, start):
+        """
+        Queues an alert without waiting for it to be sent. This has the same arguments as the alert of the
+        NotifierService so it can be passed in directly.
+        :param reactor: name of the reactor
+        :type reactor: str
+        :param label: the failing parameter written as it appears in the reactor's csv file
+        :type label: str
+        :param start: start time of the deviation
+        :type start: datetime.datetime object
+        :return: None
+        """
+        self.queue.put((reactor, label, start))
+
+    def stop(self, timeout=None):
+        """
+        Sends any queued alerts, stops the worker and closes the channels.
+        :param timeout: seconds to wait for the worker to finish
+        :type timeout: float
+        :return: None
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+
+    def work(self):
+        """
+        Runs in the background thread, grouping the queued alerts into messages and sending them.
+        :return: None
+        """
+        running = True
+        while running:
+            alert = self.queue.get()
+            if alert is None:
+                break
+            batch = [alert]
+            deadline = time.monotonic() + self.coalesce
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    alert = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if alert is None:
+                    running = False
+                    break
+                batch.append(alert)
+            self.deliver(batch)
+
+        for channel in self.channels:
+            channel.close()
+
+    def deliver(self, batch):
+        """
+        Sends one message for a group of alerts on every channel.
+        :param batch: the reactor, failing parameter and start time of each deviation
+        :type batch: list of tuples
+        :return: None
+        """
+        body = format_alerts(batch)
+        for channel in self.channels:
+            if self.send(channel, 'Deviation Notifier', body):
+                self.sent += 1
+            else:
+                self.failed += 1
+
+    def send(self, channel, subject, body):
+        """
+        Sends a message on one channel, retrying with an exponential backoff if it fails.
+        :return: True if the message was sent, otherwise False
+        :rtype: bool
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                channel.send(subject, body)
+                return True
+            except Exception as error:
+                print(f'{channel.name} alert failed ({attempt + 1}/{self.retries + 1}): {error}')
+                if attempt < self.retries:
+                    time.sleep(min(self.backoff * 2 ** attempt, self.max_backoff))
+        return False
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import datetime
+import gzip
+import json
+import os
+import zlib
+import numpy as np
+from bioreactor import parse_duration
+from deviation_notifier import read_csv
+from runlog import VALUE_LABELS, from_epoch_ns, to_epoch_ns
+
+# index of every archived run, each run has its own index of its chunks next to its data
+INDEX = 'index.json'
+# minutes of a run stored in each chunk
+CHUNK_MINUTES = 60
+# the most decimals a process value is stored with as a scaled integer, values with more are stored as floats
+MAX_DECIMALS = 6
+NS_PER_MINUTE = 60 * 10 ** 9
+
+
+def encode_column(values):
+    """
+    Compresses a column of a chunk. The logged values have a fixed number of decimals, so they are stored as the
+    differences between consecutive values scaled to integers, in the smallest integer type that holds them, which
+    compresses several times better than the floats. Values that cannot be scaled exactly are stored as floats.
+
+    :param values: the values of the column
+    :type values: numpy array of floats or int64
+    :return: the compressed column and the data type and number of decimals needed to decode it, None decimals for
+    floats
+    :rtype: tuple containing bytes, a str and an int
+    """
+    if values.dtype == np.int64:
+        scaled, decimals = values, 0
+    else:
+        for decimals in range(MAX_DECIMALS + 1):
+            scaled = np.round(values * 10 ** decimals)
+            if np.array_equal(scaled / 10 ** decimals, values) and np.all(np.abs(scaled) < 2 ** 53):
+                scaled = scaled.astype(np.int64)
+                break
+        else:
+            return zlib.compress(values.astype(np.float64).tobytes()), 'float64', None
+    differences = np.diff(scaled, prepend=0)
+    largest = int(np.abs(differences).max()) if differences.size else 0
+    dtype = next(dtype for dtype in ('int8', 'int16', 'int32', 'int64') if largest <= np.iinfo(dtype).max)
+    return zlib.compress(differences.astype(dtype).tobytes()), dtype, decimals
+
+
+def decode_column(data, dtype, decimals):
+    """
+    Reverses encode_column.
+    :return: the values of the column, as int64 when they had no decimals (e.g. the timestamps)
+    :rtype: numpy array
+    """
+    values = np.frombuffer(zlib.decompress(data), dtype=dtype)
+    if decimals is None:
+        return values
+    values = np.cumsum(values, dtype=np.int64)
+    return values / 10 ** decimals if decimals else values
+
+
+def write_json(data, file):
+    """
+    Writes a json file through a temporary file so a reader never sees it half written. A file name ending in .gz is
+    compressed.
+
+    :param data: the data to write
+    :param file: path of the json file
+    :type file: str
+    :return: None
+    """
+    with (gzip.open if file.endswith('.gz') else open)(file + '.tmp', 'wt') as json_file:
+        json.dump(data, json_file, separators=(',', ':'))
+    os.replace(file + '.tmp', file)
+
+
+def overlaps(low, high, bounds):
+    """
+    :param low: lower end of a range, None for no lower end
+    :param high: upper end of a range, None for no upper end
+    :param bounds: the smallest and largest value of a chunk or run
+    :type bounds: list of two floats
+    :return: True if any value of the chunk or run can fall in the range
+    :rtype: bool
+    """
+    return (low is None or bounds[1] >= low) and (high is None or bounds[0] <= high)
+
+
+def may_match(entry, low, high, values):
+    """
+    :param entry: the index entry of a run or chunk with its EFT range and the minimum and maximum of its columns
+    :type entry: dict
+    :param low: first EFT in minutes, None for no lower end
+    :param high: last EFT in minutes, None for no upper end
+    :param values: the range of values of each filtered column
+    :type values: dict of header to tuple
+    :return: True if any row of the run or chunk can fall in the EFT range and every value range, a column the run
+    does not have never matches
+    :rtype: bool
+    """
+    return overlaps(low, high, entry['eft']) and all(
+        label in entry['min'] and overlaps(*limits, (entry['min'][label], entry['max'][label]))
+        for label, limits in values.items())
+
+
+class Archive:
+    """
+    Stores completed runs for years of suite history in a compact form that can be queried without reading whole runs.
+    Each run is split into chunks of chunk_minutes of EFT and every column of a chunk is compressed separately (see
+    encode_column) into a single data file per run, so a query only reads and decompresses the columns and chunks it
+    asks for. The archive is partitioned into a directory per reactor holding a data file and an index for every run
+    (<archive>/<reactor>/<run start>.dat and .json.gz). The index of the runs (reactor, start time, EFT range and the
+    smallest and largest value of every column) lets a query skip whole runs, and the index of each run holds the EFT
+    range, minimum and maximum and the position of every column of each chunk, so only the chunks that can hold
+    matching rows are read.
+
+    :param directory: directory of the archive, which is created when the first run is added
+    :type directory: str
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = None
+        self.chunks_read = 0
+
+    def runs(self):
+        """
+        :return: the index entry of every archived run, ordered by reactor and start time
+        :rtype: list of dicts
+        """
+        if self.index is None:
+            path = os.path.join(self.directory, INDEX)
+            if os.path.exists(path):
+                with open(path) as json_file:
+                    self.index = json.load(json_file)
+            else:
+                self.index = []
+        return self.index
+
+    def add(self, file, reactor=None, chunk_minutes=CHUNK_MINUTES):
+        """
+        Archives a completed run, replacing the run if it was archived before. The columns are matched to
+        VALUE_LABELS regardless of case (older recordings spell e.g. 'Feed pump [ml/hr]'), and process values the file
+        does not have are listed as missing in the index of the run.
+
+        :param file: the reactor's csv file or binary run log
+        :type file: str
+        :param reactor: name of the reactor, by default the file name without its extension
+        :type reactor: str
+        :param chunk_minutes: minutes of EFT stored in each chunk
+        :type chunk_minutes: int
+        :return: the index entry of the run
+        :rtype: dict
+        """
+        reactor = reactor if reactor is not None else os.path.splitext(os.path.basename(file))[0]
+        data = read_csv(file)
+        timestamps = data['Timestamp'].to_numpy('datetime64[ns]').view(np.int64)
+        if not timestamps.size:
+            raise ValueError(f'{file} has no rows to archive')
+        start = from_epoch_ns(int(timestamps[0]))
+        run = start.strftime('%Y%m%dT%H%M%S')
+        path = os.path.join(reactor, run)
+        os.makedirs(os.path.join(self.directory, reactor), exist_ok=True)
+
+        minutes = (timestamps - timestamps[0]) / NS_PER_MINUTE
+        numbers = (minutes // chunk_minutes).astype(int)
+        boundaries = np.flatnonzero(np.diff(numbers)) + 1
+        headers = {header.lower(): header for header in data.columns}
+        values = {label: data[headers[label.lower()]].to_numpy(dtype=float) for label in VALUE_LABELS
+                  if label.lower() in headers}
+        chunks = []
+        with open(os.path.join(self.directory, path + '.dat'), 'wb') as data_file:
+            for rows in np.split(np.arange(len(timestamps)), boundaries):
+                columns = {'Timestamp': timestamps[rows]}
+                columns.update((label, column[rows]) for label, column in values.items())
+                chunk = {'rows': len(rows), 'eft': [float(minutes[rows[0]]), float(minutes[rows[-1]])],
+                         'min': {label: float(column[rows].min()) for label, column in values.items()},
+                         'max': {label: float(column[rows].max()) for label, column in values.items()},
+                         'columns': {}}
+                for label, column in columns.items():
+                    encoded, dtype, decimals = encode_column(column)
+                    chunk['columns'][label] = [data_file.tell(), len(encoded), dtype, decimals]
+                    data_file.write(encoded)
+                chunks.append(chunk)
+        write_json({'reactor': reactor, 'run': run, 'chunk_minutes': chunk_minutes, 'chunks': chunks},
+                   os.path.join(self.directory, path + '.json.gz'))
+
+        entry = {'reactor': reactor, 'run': run, 'path': path, 'start': str(start),
+                 'end': str(from_epoch_ns(int(timestamps[-1]))), 'rows': len(timestamps),
+                 'eft': [0.0, float(minutes[-1])], 'source': os.path.basename(file),
+                 'missing': [label for label in VALUE_LABELS if label not in values],
+                 'min': {label: min(chunk['min'][label] for chunk in chunks) for label in values},
+                 'max': {label: max(chunk['max'][label] for chunk in chunks) for label in values}}
+        runs = [other for other in self.runs() if (other['reactor'], other['run']) != (reactor, run)]
+        runs.append(entry)
+        runs.sort(key=lambda other: (other['reactor'], other['run']))
+        self.index = runs
+        write_json(runs, os.path.join(self.directory, INDEX))
+        return entry
+
+    def query(self, columns, reactors=None, eft=None, since=None, until=None, values=None):
+        """
+        Reads columns of the archived runs, e.g. the pH of dg1 and dg2 between an EFT of 20 and 30 hours with
+        archive.query(['pH'], ['dg1', 'dg2'], (timedelta(hours=20), timedelta(hours=30))). Only the chunks that
+        can hold matching rows are read.
+
+        :param columns: headers of the process values to read
+        :type columns: list of str
+        :param reactors: names of the reactors to read, by default every reactor
+        :type reactors: list of str
+        :param eft: the first and last EFT to read, either can be None for an open range, by default the whole run
+        :type eft: tuple of datetime.timedelta objects
+        :param since: only read runs started at or after this time
+        :type since: datetime.datetime object
+        :param until: only read runs started at or before this time
+        :type until: datetime.datetime object
+        :param values: only read rows whose value of a column is within a range, e.g. {'pH': (None, 7.1)}; the
+        columns do not have to be read themselves
+        :type values: dict of header to tuple
+        :return: for every run with matching rows, its reactor, run and start time, the Timestamp (datetime64), the
+        EFT in hours and each requested column, all NaN for a column the run does not have
+        :rtype: list of dicts
+        """
+        unknown = set(columns).union(values or ()) - set(VALUE_LABELS)
+        if unknown:
+            raise ValueError(f'unknown columns: {", ".join(sorted(unknown))}')
+        low, high = (None, None) if eft is None else \
+            tuple(None if bound is None else bound.total_seconds() / 60 for bound in eft)
+        values = values or {}
+
+        results = []
+        for run in self.runs():
+            if reactors is not None and run['reactor'] not in reactors:
+                continue
+            start = datetime.datetime.fromisoformat(run['start'])
+            if (since is not None and start < since) or (until is not None and start > until):
+                continue
+            if not may_match(run, low, high, values):
+                continue
+
+            with gzip.open(os.path.join(self.directory, run['path'] + '.json.gz'), 'rt') as json_file:
+                chunks = [chunk for chunk in json.load(json_file)['chunks'] if may_match(chunk, low, high, values)]
+            if not chunks:
+                continue
+            with open(os.path.join(self.directory, run['path'] + '.dat'), 'rb') as data_file:
+                parts = [self.read_chunk(data_file, chunk, columns, values, to_epoch_ns(start), low, high)
+                         for chunk in chunks]
+            parts = [part for part in parts if len(part['Timestamp'])]
+            if parts:
+                result = {'reactor': run['reactor'], 'run': run['run'], 'start': start}
+                for name in parts[0]:
+                    result[name] = np.concatenate([part[name] for part in parts])
+                result['Timestamp'] = result['Timestamp'].astype('datetime64[ns]')
+                results.append(result)
+        return results
+
+    def read_chunk(self, data_file, chunk, columns, values, start_ns, low, high):
+        """
+        Reads the rows of a chunk that match a query, only decompressing the columns the query needs.
+        :return: the Timestamp (epoch ns), EFT in hours and each requested column of the matching rows
+        :rtype: dict
+        """
+        self.chunks_read += 1
+
+        def column(label):
+            if label not in chunk['columns']:
+                return np.full(chunk['rows'], np.nan)
+            offset, size, dtype, decimals = chunk['columns'][label]
+            data_file.seek(offset)
+            return decode_column(data_file.read(size), dtype, decimals).astype(float, copy=False)
+
+        offset, size, dtype, decimals = chunk['columns']['Timestamp']
+        data_file.seek(offset)
+        timestamps = decode_column(data_file.read(size), dtype, decimals)
+        minutes = (timestamps - start_ns) / NS_PER_MINUTE
+        keep = np.ones(len(timestamps), dtype=bool)
+        if low is not None:
+            keep &= minutes >= low
+        if high is not None:
+            keep &= minutes <= high
+        read = {}
+        for label, (lowest, highest) in values.items():
+            read[label] = column(label)
+            if lowest is not None:
+                keep &= read[label] >= lowest
+            if highest is not None:
+                keep &= read[label] <= highest
+        part = {'Timestamp': timestamps[keep], 'EFT': minutes[keep] / 60}
+        for label in columns:
+            part[label] = (read[label] if label in read else column(label))[keep]
+        return part
+
+
+def parse_range(text):
+    """
+    Reads a range of values written as low:high, either of which can be left out.
+
+    :param text: the range, e.g. 7.1:7.3, :7.1 or 7.3:
+    :type text: str
+    :return: the lower and upper end, None for an open end
+    :rtype: tuple
+    """
+    try:
+        low, high = text.split(':')
+        return (float(low) if low else None), (float(high) if high else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid range {text!r}, expected e.g. 7.1:7.3, :7.1 or 7.3:')
+
+
+def main(argv=None):
+    """
+    Command line entry point, e.g.
+    python archive.py add history/ dg1.csv dg2.csv
+    python archive.py query history/ pH --reactors dg1 dg2 --eft 20h 30h --csv ph.csv
+    :param argv: command line arguments, by default sys.argv
+    :type argv: list
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Archive completed reactor runs and query them')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    add = subparsers.add_parser('add', help='archive completed runs')
+    add.add_argument('archive', help='directory of the archive')
+    add.add_argument('files', nargs='+', help='reactor csv files or binary run logs')
+    add.add_argument('--chunk-minutes', type=int, default=CHUNK_MINUTES,
+                     help=f'minutes of EFT in each chunk (default {CHUNK_MINUTES})')
+    runs = subparsers.add_parser('runs', help='list the archived runs')
+    runs.add_argument('archive', help='directory of the archive')
+    query = subparsers.add_parser('query', help='read columns of the archived runs')
+    query.add_argument('archive', help='directory of the archive')
+    query.add_argument('columns', nargs='+', help='process values to read, e.g. pH or "Temp [C]"')
+    query.add_argument('--reactors', nargs='+', default=None, help='reactors to read (default all)')
+    query.add_argument('--eft', nargs=2, type=parse_duration, default=None, metavar=('FROM', 'TO'),
+                       help='EFT range to read, e.g. 20h 30h (default the whole run)')
+    query.add_argument('--where', nargs=2, action='append', default=[], metavar=('COLUMN', 'RANGE'),
+                       help='only rows with a value in a range, e.g. pH :7.1 (can be repeated)')
+    query.add_argument('--csv', help='write the rows to this csv file')
+    args = parser.parse_args(argv)
+
+    archive = Archive(args.archive)
+    if args.command == 'add':
+        for file in args.files:
+            entry = archive.add(file, chunk_minutes=args.chunk_minutes)
+            missing = f', missing {", ".join(entry["missing"])}' if entry['missing'] else ''
+            print(f'archived {file} as {entry["path"]} ({entry["rows"]} rows{missing})')
+    elif args.command == 'runs':
+        for run in archive.runs():
+            print(f'{run["reactor"]} {run["start"]} to {run["end"]} ({run["eft"][1] / 60:.1f} h, {run["rows"]} rows)')
+    else:
+        values = {column: parse_range(limits) for column, limits in args.where}
+        results = archive.query(args.columns, args.reactors, args.eft, values=values)
+        rows = sum(len(result['Timestamp']) for result in results)
+        print(f'{rows} row(s) from {len(results)} run(s), {archive.chunks_read} chunk(s) read')
+        if args.csv:
+            with open(args.csv, 'w', newline='') as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(['reactor', 'run', 'Timestamp', 'EFT [h]'] + args.columns)
+                for result in results:
+                    for row in zip(result['Timestamp'].astype(str), result['EFT'],
+                                   *(result[column] for column in args.columns)):
+                        writer.writerow([result['reactor'], result['run']] + list(row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+from deviation_notifier import (ALLOWANCE, FIXED_LOGS, LABELS, PH_LIMITS, PUMP_SPECS, PRE_RAMP_ALLOWANCE, SETPOINTS,
+                                read_csv, run_starts)
+
+# columns of the report in the order they are written to the csv
+REPORT_HEADERS = ['file', 'reactor', 'parameter', 'start', 'end', 'duration [min]', 'alerted', 'alert time']
+
+
+def ramp_index(agitation):
+    """
+    Finds the row where the agitation ramps up from 1000 to 1500 rpm, using the same rule as the agitation function.
+
+    :param agitation: the recorded values of the motor
+    :type agitation: numpy array
+    :return: index of the row where the ramp is detected, otherwise None
+    """
+    ramps = np.flatnonzero((np.abs(agitation[1:] - 1500) < 10) & (np.abs(agitation[:-1] - agitation[1:]) > 50))
+    if ramps.size:
+        return int(ramps[0]) + 1
+    return None
+
+
+def rpm_setpoints(agitation):
+    """
+    Finds the agitation setpoint of every row as the DeviationDetector sees it. The setpoint changes to 1500 rpm on
+    the row the ramp is detected on for the pH and pumps, but only on the next row for the agitation itself.
+
+    :param agitation: the recorded values of the motor
+    :type agitation: numpy array
+    :return: the setpoint before and after the ramp detection of every row
+    :rtype: tuple of numpy arrays
+    """
+    rpm_before = np.full(agitation.size, 1000)
+    rpm_after = np.full(agitation.size, 1000)
+    ramp = ramp_index(agitation)
+    if ramp is not None:
+        rpm_before[ramp + 1:] = 1500
+        rpm_after[ramp:] = 1500
+    return rpm_before, rpm_after
+
+
+def elapsed(timestamps, starts):
+    """
+    Time since the start of the run each row belongs to.
+
+    :param timestamps: the recorded timestamps
+    :type timestamps: numpy array of datetime64
+    :param starts: index where the run of every row began, -1 for rows that are not in a run
+    :type starts: numpy array of ints
+    :return: the time since the start of the run, zero for rows that are not in a run
+    :rtype: numpy array of timedelta64
+    """
+    return np.where(starts >= 0, timestamps - timestamps[np.maximum(starts, 0)], np.timedelta64(0, 'ns'))
+
+
+def alert_rows(notify):
+    """
+    Applies the notification rules of the DeviationDetector to a parameter: an alert is sent the first time its
+    deviation has persisted past the allowance, and another one only after FIXED_LOGS logs without it.
+
+    :param notify: whether the deviation of the parameter had persisted past its allowance on each row
+    :type notify: numpy array of bools
+    :return: the rows an alert is sent on
+    :rtype: list of ints
+    """
+    candidates = np.flatnonzero(notify)
+    quiet = np.cumsum(~notify)
+    rows = []
+    position = 0
+    while position < candidates.size:
+        row = int(candidates[position])
+        rows.append(row)
+        # the parameter is counted as fixed on the log after FIXED_LOGS logs without the deviation
+        fixed = np.searchsorted(quiet, quiet[row] + FIXED_LOGS + 1)
+        if fixed >= notify.size:
+            break
+        position = np.searchsorted(candidates, fixed, side='right')
+    return rows
+
+
+def match_headers(data):
+    """
+    Renames the columns of a recording whose headers only differ from LABELS in case, e.g. the 'Feed pump [ml/hr]' of
+    older recordings, and finds the checked parameters the recording does not have at all.
+
+    :param data: the reactor's csv as returned by read_csv
+    :type data: pandas dataframe
+    :return: the data with the headers of LABELS and the headers of the parameters that cannot be checked
+    :rtype: tuple containing a pandas dataframe and a list of str
+    """
+    labels = {label.lower(): label for label in LABELS}
+    data = data.rename(columns={header: labels[header.lower()] for header in data.columns
+                                if header.lower() in labels and header not in LABELS})
+    missing = [label for label in LABELS if label != 'DO [%]' and label not in data]
+    return data, missing
+
+
+def check_run(data):
+    """
+    Applies the rules of the DeviationDetector to a whole run in one vectorized pass. Parameters without a column in
+    the data are not checked (see match_headers).
+
+    :param data: the reactor's csv as returned by read_csv
+    :type data: pandas dataframe
+    :return: for every checked parameter, the index where the deviation each row belongs to began (-1 for rows without
+    a deviation), whether the row is deviating, and the rows an alert is sent on
+    :rtype: dict of tuples
+    """
+    timestamps = data['Timestamp'].to_numpy(dtype='datetime64[ns]')
+    size = timestamps.size
+    allowed = np.timedelta64(ALLOWANCE, 'm')
+
+    # the agitation setpoint is read before the ramp is detected, the pH and pumps use the setpoint after it
+    if 'Agitation [rpm]' in data:
+        rpm_before, rpm_after = rpm_setpoints(data['Agitation [rpm]'].to_numpy(dtype=float))
+    else:
+        rpm_before = rpm_after = np.full(size, 1000)
+
+    results = {}
+    for label in LABELS:
+        if label not in data or label == 'DO [%]':
+            continue
+        values = data[label].to_numpy(dtype=float)
+        if label == 'Agitation [rpm]':
+            tolerance = SETPOINTS[label][1]
+            starts = np.where(rpm_before == 1000, run_starts(np.abs(1000 - values) > tolerance),
+                              run_starts(np.abs(1500 - values) > tolerance))
+        elif label == 'pH':
+            low = np.where(rpm_after == 1000, run_starts(values < PH_LIMITS[1000][0]),
+                           run_starts(values < PH_LIMITS[1500][0]))
+            high = np.where(rpm_after == 1000, run_starts(values > PH_LIMITS[1000][1]),
+                            run_starts(values > PH_LIMITS[1500][1]))
+            starts = np.where(low > 0, low, np.where(high >= 0, high, low))
+        elif label in PUMP_SPECS:
+            setpoint, tolerance = SETPOINTS[label]
+            off = values == 0
+            out = ~off & (np.abs(setpoint - values) > tolerance)
+            off_starts = run_starts(off)
+            allowance = np.where(off, np.where((off_starts == 0) | (rpm_after == 1000), PRE_RAMP_ALLOWANCE,
+                                               PUMP_SPECS[label]['off']),
+                                 np.where(out, ALLOWANCE, PUMP_SPECS[label]['on']))
+            starts = np.where(off, off_starts, np.where(out, run_starts(out), run_starts(~off)))
+            notify = elapsed(timestamps, starts) > allowance.astype('timedelta64[m]')
+            # a pump sequence is only a deviation while out of tolerance or once it outlasts its allowance
+            results[label] = (starts, out | notify, alert_rows(notify))
+            continue
+        else:
+            setpoint, tolerance = SETPOINTS[label]
+            starts = run_starts(np.abs(setpoint - values) > tolerance)
+        # a deviation that has been occurring since the first value is not reported
+        notify = (starts > 0) & (elapsed(timestamps, starts) > allowed)
+        results[label] = (starts, starts >= 0, alert_rows(notify))
+    return results
+
+
+def deviation_episodes(data, name='dg1'):
+    """
+    Lists every deviation episode of a whole run. An episode is a stretch of deviating rows that belong to the same
+    sequence, e.g. the temperature staying out of its tolerance or a pump staying off longer than it is allowed to.
+
+    :param data: the reactor's csv as returned by read_csv
+    :type data: pandas dataframe
+    :param name: name of the reactor
+    :type name: str
+    :return: the parameter, start and end time, duration in minutes, and the time an alert would have been sent (None
+    if it would not have alerted) of every episode in the order they started
+    :rtype: list of dicts
+    """
+    if not len(data):
+        return []
+    timestamps = data['Timestamp'].to_numpy(dtype='datetime64[ns]')
+    episodes = []
+    for label, (starts, deviating, alerts) in check_run(data).items():
+        rows = np.flatnonzero(deviating)
+        if not rows.size:
+            continue
+        # rows belong to the same episode while they share a start and are consecutive
+        breaks = np.flatnonzero((np.diff(rows) != 1) | (np.diff(starts[rows]) != 0)) + 1
+        firsts = rows[np.concatenate(([0], breaks))]
+        lasts = rows[np.concatenate((breaks - 1, [rows.size - 1]))]
+        alerts = np.asarray(alerts, dtype=int)
+        for first, last, position in zip(firsts, lasts, np.searchsorted(alerts, firsts)):
+            start = timestamps[starts[first]]
+            alert = alerts[position] if position < alerts.size and alerts[position] <= last else None
+            episodes.append({'reactor': name, 'parameter': label, 'start': start.astype('datetime64[us]').item(),
+                             'end': timestamps[last].astype('datetime64[us]').item(),
+                             'duration [min]': float((timestamps[last] - start) / np.timedelta64(1, 'm')),
+                             'alerted': alert is not None,
+                             'alert time': timestamps[alert].astype('datetime64[us]').item()
+                             if alert is not None else None})
+    episodes.sort(key=lambda episode: (episode['start'], LABELS.index(episode['parameter'])))
+    return episodes
+
+
+def analyze_file(file):
+    """
+    Reads a historical run log and lists its deviation episodes. Errors are returned rather than raised so one
+    unreadable file does not stop the analysis of an archive.
+
+    :param file: path of a reactor's csv file or binary run log
+    :type file: str
+    :return: the file, the number of rows, its episodes, the error message if the file could not be analyzed and the
+    parameters that could not be checked because the file does not have them
+    :rtype: tuple
+    """
+    name = os.path.splitext(os.path.basename(file))[0]
+    try:
+        data, missing = match_headers(read_csv(file))
+        episodes = deviation_episodes(data, name)
+    except Exception as error:
+        return file, 0, [], f'{type(error).__name__}: {error}', []
+    return file, len(data), [dict(file=file, **episode) for episode in episodes], None, missing
+
+
+def find_files(paths, pattern='*.csv'):
+    """
+    Expands the files, directories and glob patterns given on the command line.
+
+    :param paths: files, directories containing run logs, or glob patterns
+    :type paths: list of str
+    :param pattern: glob pattern of the run logs inside a directory
+    :type pattern: str
+    :return: the run logs in sorted order
+    :rtype: list of str
+    """
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            files.update(glob.glob(os.path.join(path, '**', pattern), recursive=True))
+        elif glob.has_magic(path):
+            files.update(glob.glob(path, recursive=True))
+        else:
+            files.add(path)
+    return sorted(files)
+
+
+def analyze(files, processes=None, chunksize=4):
+    """
+    Analyzes the run logs across a pool of processes.
+
+    :param files: paths of the run logs
+    :type files: list of str
+    :param processes: number of worker processes, by default one per core
+    :type processes: int
+    :param chunksize: number of files handed to a worker at once
+    :type chunksize: int
+    :return: the result of analyze_file for every file in the order of the files
+    :rtype: list of tuples
+    """
+    if processes == 1 or len(files) < 2:
+        return [analyze_file(file) for file in files]
+    with multiprocessing.Pool(processes) as pool:
+        return list(pool.imap(analyze_file, files, chunksize=chunksize))
+
+
+def write_csv(episodes, file):
+    """
+    Writes the deviation episodes to a csv report.
+    :param episodes: the episodes returned by analyze_file
+    :type episodes: list of dicts
+    :param file: path of the report
+    :type file: str
+    :return: None
+    """
+    with open(file, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, REPORT_HEADERS)
+        writer.writeheader()
+        for episode in episodes:
+            writer.writerow({key: '' if value is None else value for key, value in episode.items()})
+
+
+def main(argv=None):
+    """
+    Command line entry point, e.g. python batch_report.py archive/ --csv report.csv --json report.json
+    :param argv: command line arguments, by default sys.argv
+    :type argv: list
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Report every deviation in a set of historical run logs')
+    parser.add_argument('paths', nargs='+', help='run logs, directories containing them, or glob patterns')
+    parser.add_argument('--pattern', default='*.csv', help='glob pattern of the run logs in a directory')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default one per core)')
+    parser.add_argument('--csv', help='write every deviation episode to this csv file')
+    parser.add_argument('--json', help='write every deviation episode, unreadable file and missing column to this '
+                                       'json file')
+    args = parser.parse_args(argv)
+
+    files = find_files(args.paths, args.pattern)
+    start = time.perf_counter()
+    results = analyze(files, args.processes)
+    seconds = time.perf_counter() - start
+
+    episodes = [episode for _, _, file_episodes, _, _ in results for episode in file_episodes]
+    errors = {file: error for file, _, _, error, _ in results if error is not None}
+    missing = {file: labels for file, _, _, _, labels in results if labels}
+    for file, error in errors.items():
+        print(f'could not analyze {file}: {error}')
+    for file, labels in missing.items():
+        print(f'{file} has no {", ".join(labels)} column, which was not checked')
+    rows = sum(rows for _, rows, _, _, _ in results)
+    alerted = sum(episode['alerted'] for episode in episodes)
+    print(f'{len(episodes)} deviation episode(s), {alerted} alerted, in {len(files) - len(errors)} file(s)')
+    print(f'analyzed {rows} rows in {seconds:.1f} s ({rows / seconds if seconds else 0:.0f} rows/s)')
+
+    if args.csv:
+        write_csv(episodes, args.csv)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'episodes': episodes, 'errors': errors, 'missing': missing}, json_file, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
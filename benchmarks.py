@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+import deviation_notifier
+from bioreactor import Reactor
+from deviation_notifier import PH_LIMITS, LogTail, check_constants, check_pumps, check_pH, run_starts
+from plotdata import ColumnCache
+
+# EFT of the history in minutes used for the benchmarks that depend on the length of the run
+HISTORY = {'1h': 60, '24h': 24 * 60, '68h': 68 * 60 - 1}
+# the most repeats per benchmark, so the rows logged while timing (up to 50 refreshes of 5 rows per repeat) never run
+# past the end of a run
+MAX_REPEAT = 50
+
+
+def measure(function, repeat=5, number=1):
+    """
+    Times a function the same way as timeit, keeping the fastest of several repeats since slower repeats are caused by
+    other processes rather than the code being measured.
+
+    :param function: the function to time, called without arguments
+    :type function: function
+    :param repeat: number of times the measurement is repeated
+    :type repeat: int
+    :param number: number of calls per measurement
+    :type number: int
+    :return: seconds per call
+    :rtype: float
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings)
+
+
+def start_reactor(directory, minutes, seed):
+    """
+    Creates a reactor in the directory and logs the given number of minutes of its run.
+
+    :return: the reactor, which is still running
+    :rtype: Reactor
+    """
+    reactor = Reactor(name='bench', flush_rows=1, seed=seed)
+    reactor.file = os.path.join(directory, reactor.file)
+    reactor.start_run()
+    reactor.create_csv()
+    for _ in range(minutes):
+        reactor.log_data()
+    return reactor
+
+
+def bench_log_data(directory, seed, repeat):
+    """
+    Ticks of Reactor.log_data at different lengths of the log, which should not depend on the length. The rows logged
+    while timing end at the length of the log.
+    """
+    results = {}
+    number = 4
+    for name, minutes in HISTORY.items():
+        reactor = start_reactor(directory, max(0, minutes - repeat * number), seed)
+        results[f'log_data@{name}'] = measure(reactor.log_data, repeat=repeat, number=number)
+        reactor.close()
+    return results
+
+
+def bench_check_deviations(directory, seed, repeat):
+    """
+    Latency of check_deviations for the newest row at different lengths of the run, as the median over 10 rows per
+    repeat.
+    """
+    results = {}
+    samples = 10 * repeat
+    for name, minutes in HISTORY.items():
+        reactor = start_reactor(directory, max(0, minutes - samples - 1), seed)
+        deviation_notifier.monitors.clear()
+        deviation_notifier.check_deviations(reactor.file)
+        timings = []
+        for _ in range(samples):
+            reactor.log_data()
+            start = time.perf_counter()
+            deviation_notifier.check_deviations(reactor.file)
+            timings.append(time.perf_counter() - start)
+        results[f'check_deviations@{name}'] = float(np.median(timings))
+        reactor.close()
+    deviation_notifier.monitors.clear()
+    return results
+
+
+def bench_kernels(seed, repeat):
+    """
+    The vectorized detector kernels on synthetic series the length of a full run.
+    """
+    rng = np.random.default_rng(seed)
+    size = HISTORY['68h']
+    temp = 32 + rng.uniform(-0.16, 0.16, size)
+    temp[-100:] += np.linspace(0, 5, 100)
+    pump = np.where(rng.uniform(size=size) < 0.7, 0.0, 40.0)
+    pump[-30:] = 40.0
+    pH = 7.2 + rng.uniform(-0.0036, 0.0036, size)
+    pH[-40:] += np.linspace(0, 0.1, 40)
+
+    return {
+        'check_constants': measure(lambda: check_constants(temp, 32, 2), repeat=repeat, number=100),
+        'check_pumps': measure(lambda: check_pumps('Feed Pump [ml/hr]', pump, 40, 3, rpm=1500), repeat=repeat,
+                               number=100),
+        'check_pH': measure(lambda: check_pH(pH, max_ph=PH_LIMITS[1500][1]), repeat=repeat, number=100),
+        'run_starts': measure(lambda: run_starts(pump == 0), repeat=repeat, number=100),
+    }
+
+
+def bench_plot_data(directory, seed, repeat):
+    """
+    The data preparation of BioreactorSimulator.update_graph: reading a full run into the column cache, adding the
+    rows of a single refresh (5 rows) to it, and selecting the points a plot draws.
+    """
+    samples = 10 * repeat
+    reactor = start_reactor(directory, max(0, HISTORY['68h'] - 5 * samples), seed)
+
+    def full_read():
+        ColumnCache().extend(LogTail(reactor.file).read())
+
+    results = {'update_graph_full@68h': measure(full_read, repeat=repeat)}
+    tail = LogTail(reactor.file)
+    cache = ColumnCache()
+    cache.extend(tail.read())
+    timings = []
+    for _ in range(samples):
+        for _ in range(5):
+            reactor.log_data()
+        start = time.perf_counter()
+        cache.extend(tail.read())
+        timings.append(time.perf_counter() - start)
+    results['update_graph_refresh@68h'] = float(np.median(timings))
+    # the points CustomPlot draws for the whole run and for a 2 h window on a 1000 pixel wide plot
+    results['plot_view_full@68h'] = measure(lambda: cache.pyramid.view(cache, 'pH', width=1000), repeat=repeat,
+                                            number=100)
+    results['plot_view_zoom@68h'] = measure(lambda: cache.pyramid.view(cache, 'pH', 30, 32, width=1000),
+                                            repeat=repeat, number=100)
+    reactor.close()
+    return results
+
+
+def run_benchmarks(seed=0, repeat=5):
+    """
+    Runs every benchmark in a temporary directory.
+
+    :param seed: seed of the simulated runs and synthetic series
+    :type seed: int
+    :param repeat: number of repeats per benchmark, at most MAX_REPEAT
+    :type repeat: int
+    :return: seconds per call of every benchmark
+    :rtype: dict
+    """
+    if not 1 <= repeat <= MAX_REPEAT:
+        raise ValueError(f'repeat must be between 1 and {MAX_REPEAT}')
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        results.update(bench_log_data(directory, seed, repeat))
+        results.update(bench_check_deviations(directory, seed, repeat))
+        results.update(bench_kernels(seed, repeat))
+        results.update(bench_plot_data(directory, seed, repeat))
+    return results
+
+
+def parse_repeat(text):
+    """
+    Reads the number of repeats per benchmark.
+
+    :param text: a number from 1 to MAX_REPEAT
+    :type text: str
+    :return: the number of repeats
+    :rtype: int
+    """
+    try:
+        repeat = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid number of repeats {text!r}')
+    if not 1 <= repeat <= MAX_REPEAT:
+        raise argparse.ArgumentTypeError(f'the number of repeats must be between 1 and {MAX_REPEAT}')
+    return repeat
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the results against a stored baseline.
+
+    :param results: seconds per call of every benchmark
+    :type results: dict
+    :param baseline: the results of an earlier run
+    :type baseline: dict
+    :param threshold: allowed slowdown as a fraction of the baseline, e.g. 0.25 for 25 %
+    :type threshold: float
+    :return: the benchmarks that are slower than the baseline by more than the threshold with their ratio
+    :rtype: dict
+    """
+    regressions = {}
+    for name, seconds in results.items():
+        if name in baseline and baseline[name] > 0:
+            ratio = seconds / baseline[name]
+            if ratio > 1 + threshold:
+                regressions[name] = ratio
+    return regressions
+
+
+def main(argv=None):
+    """
+    Command line entry point, e.g. python benchmarks.py --json results.json --baseline baseline.json
+    :param argv: command line arguments, by default sys.argv
+    :type argv: list
+    :return: exit code, 1 if a benchmark regressed
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the simulation, detection and plotting hot paths')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the simulated runs (default 0)')
+    parser.add_argument('--repeat', type=parse_repeat, default=5,
+                        help=f'repeats per benchmark, at most {MAX_REPEAT} (default 5)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against the results stored in this file')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown against the baseline as a fraction (default 0.25)')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.seed, args.repeat)
+    for name, seconds in results.items():
+        print(f'{name:<28} {seconds * 1e6:12.1f} µs')
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'python': platform.python_version(), 'seed': args.seed, 'results': results}, json_file,
+                      indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as json_file:
+            baseline = json.load(json_file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, ratio in regressions.items():
+            print(f'REGRESSION {name}: {ratio:.2f}x the baseline')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
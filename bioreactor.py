@@ -1,7 +1,31 @@
-import random
 import datetime
 import csv
 import math
+import time
+import os
+import re
+import shutil
+import argparse
+import numpy as np
+from runlog import VALUE_LABELS, BinaryRunLog
+from ringbuffer import RingBuffer, ring_name
+from recipe import DEFAULT, Recipe
+import metrics
+
+# number of rows of equipment noise generated at once for the 8 process values
+NOISE_BLOCK = 1024
+# relative equipment noise of each logged process value, the pH needs less noise than the other parameters to be more
+# realistic and pumps shouldn't have equipment noise i.e. 'off' should hold a steady 0 value
+NOISE_BANDS = (0.005, 0.005, 0.005, 0.005, 0.0005, 0, 0, 0)
+HEADERS = ['Timestamp', *VALUE_LABELS, '_EFT']
+# the attributes of a Reactor that change during a run and are saved by a snapshot
+STATE = ('pH', 'temp', 'agitation', 'airflow', 'DO', 'feed_pump', 'base_pump', 'antifoam_pump', 'feed_triggered',
+         'feeding', 'spiking', 'last_feed', 'fixed_motor', 'fixed_airflow', 'antifoam_deviation', 'agitation_deviation',
+         'feed_deviation', 'base_deviation', 'airflow_deviation', 'temp_deviation', 'active', 'start_time',
+         'timestamp', 'eft', 'minute')
+MINUTE = datetime.timedelta(minutes=1)
+# the mechanical deviations, each one is set on a Reactor as <deviation>_deviation
+DEVIATIONS = ('antifoam', 'agitation', 'feed', 'base', 'airflow', 'temp')
 
 
 class Reactor:
@@ -48,16 +72,34 @@ class Reactor:
     :type agitation: int
     :param DO: the starting dissolved oxygen of the reactor in %
     :type DO: int
+    :param flush_rows: number of logged rows to buffer before they are flushed to the csv file, None to disable
+    :type flush_rows: int
+    :param flush_ms: maximum number of milliseconds logged rows are buffered before being flushed, None to disable
+    :type flush_ms: float
+    :param binary_log: whether to also write the run to a memory mapped binary log (see the runlog module)
+    :type binary_log: bool
+    :param seed: seed of the reactor's equipment noise, a fixed seed replays the exact same values
+    :type seed: int
+    :param recipe: the process timing of the run, by default the timing described above
+    :type recipe: recipe.Recipe
+    :param shared_memory: whether to also publish every row to a shared memory ring buffer named after the reactor,
+    which other processes can follow without reading the csv file (see the ringbuffer module)
+    :type shared_memory: bool
+    :param csv_log: whether to write the run to the csv file, which can be turned off when the rows are only consumed
+    from the ring buffer
+    :type csv_log: bool
     """
 
-    def __init__(self, name):
+    def __init__(self, name, flush_rows=1, flush_ms=None, binary_log=False, seed=None, recipe=None,
+                 shared_memory=False, csv_log=True):
         self.name = name
         self.pH = 7.20
         self.temp = 32.0
         self.agitation = 1000
         self.airflow = 60
         self.DO = 100
-        self.final_eft = datetime.timedelta(hours=68)
+        self.recipe = recipe if recipe is not None else DEFAULT
+        self.final_eft = datetime.timedelta(minutes=self.recipe.final_eft)
         self.active = False
         self.start_time = None
         self.file = name + '.csv'
@@ -82,6 +124,37 @@ class Reactor:
         self.fixed_motor = 0
         self.fixed_airflow = 0
 
+        # the simulation clock is kept in memory so the csv never has to be read back while logging, the controllers
+        # read the recipe by the EFT in whole minutes
+        self.timestamp = None
+        self.eft = datetime.timedelta(0)
+        self.minute = 0
+
+        # the csv file stays open for the whole run and rows are flushed according to the flush policy
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self.csvfile = None
+        self.writer = None
+        self.pending_rows = 0
+        self.last_flush = None
+
+        # optional fixed width binary copy of the csv that readers can memory map instead of parsing text
+        self.binary_file = name + '.bin' if binary_log else None
+        self.run_log = None
+
+        # optional ring buffer the rows are published to for consumers in other processes
+        self.csv_log = csv_log
+        self.ring_name = ring_name(name) if shared_memory else None
+        self.ring = None
+
+        # every reactor owns its noise generator and hands out rows of a pre-generated block of noise, the state of
+        # the generator before the block was drawn is kept so a snapshot can redraw the block instead of storing it
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.noise_block = []
+        self.noise_index = 0
+        self.block_state = None
+
     def start_run(self):
         """
         Activates the run and creates the fermentation start time.
@@ -89,83 +162,411 @@ class Reactor:
         """
         self.active = True
         self.start_time = datetime.datetime.now()
+        self.timestamp = self.start_time
+        self.eft = datetime.timedelta(0)
+        self.minute = 0
 
     def end_run(self):
         """
-        Once the final_eft time has been reached, the run will not be active.
+        Once the final_eft time has been reached, the run will not be active and the csv file is closed.
         :return: None
         """
         self.active = False
+        self.close()
 
-    def create_csv(self):
+    def flush(self):
         """
-        Creates the csv file for the reactor instance with column headers and the first row of data values.
+        Writes any buffered rows to the reactor's csv file so they are visible to other readers.
         :return: None
         """
-        with open(self.file, 'w+', newline='') as csvfile:
-            writer = csv.writer(csvfile, delimiter=',')
-            headers = ['Timestamp', 'Agitation [rpm]', 'Airflow [mL/s]', 'DO [%]', 'Temp [C]', 'pH',
-                       'Feed Pump [ml/hr]',
-                       'Base Pump [mL/hr]', 'Antifoam Pump [mL/hr]', '_EFT']
-            writer.writerow(headers)
-            first_values = [self.start_time]
-            for parameter in [self.agitation, self.airflow, self.DO, self.temp, self.pH, self.feed_pump, self.base_pump,
-                              self.antifoam_pump]:
-                if parameter == self.antifoam_pump or parameter == self.base_pump or parameter == self.feed_pump:
-                    first_values.append(parameter)
-                else:
-                    first_values.append(round(random.uniform(0.9995 * parameter, 1.0005 * parameter), 2))
+        if self.csvfile is not None:
+            self.csvfile.flush()
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """
+        Flushes and closes the reactor's csv file and logs. Calling this more than once has no effect.
+        :return: None
+        """
+        if self.csvfile is not None:
+            self.flush()
+            self.csvfile.close()
+            self.csvfile = None
+            self.writer = None
+        if self.run_log is not None:
+            self.run_log.close()
+            self.run_log = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def flush_due(self):
+        """
+        Checks the flush policy to see if the buffered rows should be written to the csv file.
+        :return: True if either the row count or the time since the last flush has been exceeded, otherwise False
+        """
+        if self.flush_rows is not None and self.pending_rows >= self.flush_rows:
+            return True
+        if self.flush_ms is not None and (time.monotonic() - self.last_flush) * 1000 >= self.flush_ms:
+            return True
+        return False
+
+    def next_noise(self):
+        """
+        Hands out the next row of equipment noise, generating a new block of NOISE_BLOCK rows when the current one
+        has been used up.
+        :return: one uniform value in [-1, 1) for each of the 8 process values
+        :rtype: list of floats
+        """
+        if self.noise_index >= len(self.noise_block):
+            self.draw_noise_block()
+        noise = self.noise_block[self.noise_index]
+        self.noise_index += 1
+        return noise
+
+    def take_noise(self, count):
+        """
+        Hands out the next rows of equipment noise at once, which are the same rows count calls of next_noise would
+        hand out.
+        :param count: number of rows
+        :type count: int
+        :return: one uniform value in [-1, 1) for each of the 8 process values of every row
+        :rtype: numpy array of shape (count, 8)
+        """
+        rows = []
+        while len(rows) < count:
+            if self.noise_index >= len(self.noise_block):
+                self.draw_noise_block()
+            end = min(len(self.noise_block), self.noise_index + count - len(rows))
+            rows.extend(self.noise_block[self.noise_index:end])
+            self.noise_index = end
+        return np.array(rows, dtype=float).reshape(count, len(NOISE_BANDS))
+
+    def draw_noise_block(self):
+        """
+        Generates the next block of NOISE_BLOCK rows of equipment noise.
+        :return: None
+        """
+        self.block_state = self.rng.bit_generator.state
+        self.noise_block = self.rng.uniform(-1, 1, size=(NOISE_BLOCK, len(NOISE_BANDS))).tolist()
+        self.noise_index = 0
+
+    def snapshot(self):
+        """
+        Saves the full state of the reactor: the process values, the feed and deviation flags, the clock, the state of
+        the noise generator and how far the logs have been written. The logged rows are flushed first so the csv file
+        holds every row up to the snapshot. The snapshot only holds plain values, so it can be pickled and sent to
+        other processes.
+        :return: the state of the reactor
+        :rtype: dict
+        """
+        self.flush()
+        state = {attribute: getattr(self, attribute) for attribute in STATE}
+        state['rng'] = self.rng.bit_generator.state
+        state['block_rng'] = self.block_state if self.noise_block else None
+        state['noise_index'] = self.noise_index
+        state['file'] = self.file
+        state['offset'] = os.path.getsize(self.file) if self.csvfile is not None else None
+        state['ring'] = self.ring is not None
+        state['binary_file'] = self.binary_file
+        state['binary_rows'] = self.run_log.count if self.run_log is not None else None
+        if self.run_log is not None:
+            self.run_log.flush()
+        return state
+
+    def restore(self, state):
+        """
+        Puts the reactor back into the state of a snapshot. The logs are cut back to the rows that were logged at the
+        time of the snapshot, or, if the reactor logs to other files than the snapshot (a fork), they start as a copy
+        of the snapshot's logs up to that point. The ring buffer cannot be cut back, so it is created again and its
+        readers start over with the rows logged after the restore. A reactor without a csv log (csv_log=False) leaves
+        the csv files alone.
+
+        :param state: a snapshot of this or another reactor
+        :type state: dict
+        :return: None
+        """
+        self.close()
+        for attribute in STATE:
+            setattr(self, attribute, state[attribute])
+
+        self.noise_block = []
+        self.block_state = state['block_rng']
+        if self.block_state is not None:
+            self.rng.bit_generator.state = self.block_state
+            self.noise_block = self.rng.uniform(-1, 1, size=(NOISE_BLOCK, len(NOISE_BANDS))).tolist()
+        self.rng.bit_generator.state = state['rng']
+        self.noise_index = state['noise_index']
+
+        if state['offset'] is not None and self.csv_log:
+            if os.path.abspath(self.file) != os.path.abspath(state['file']):
+                with open(state['file'], 'rb') as source, open(self.file, 'wb') as target:
+                    target.write(source.read(state['offset']))
+            else:
+                os.truncate(self.file, state['offset'])
+            self.csvfile = open(self.file, 'a', newline='')
+            self.writer = csv.writer(self.csvfile, delimiter=',')
+            self.flush()
+
+        if state['binary_rows'] is not None and self.binary_file is not None:
+            if os.path.abspath(self.binary_file) != os.path.abspath(state['binary_file']):
+                shutil.copyfile(state['binary_file'], self.binary_file)
+            self.run_log = BinaryRunLog(self.binary_file, capacity=self.recipe.final_eft + 1)
+            self.run_log.open(state['binary_rows'])
+
+        if state.get('ring') and self.ring_name is not None:
+            self.open_ring()
+
+    def fork(self, name, file=None, seed=None):
+        """
+        Creates an independent branch of the reactor from its current state, which continues the run in its own logs.
+        This lets many what-if scenarios share the simulation of the run up to the point they differ.
+
+        :param name: name of the branch
+        :type name: str
+        :param file: path of the branch's csv file, by default the name with a .csv extension
+        :type file: str
+        :param seed: a new seed for the branch's equipment noise, by default the branch gets the same noise as the
+        reactor would have so only the scenario makes the branches differ
+        :type seed: int
+        :return: the branch
+        :rtype: Reactor
+        """
+        return Reactor.from_snapshot(self.snapshot(), name, file, seed, flush_rows=self.flush_rows,
+                                     flush_ms=self.flush_ms, recipe=self.recipe,
+                                     shared_memory=self.ring_name is not None)
+
+    @classmethod
+    def from_snapshot(cls, state, name, file=None, seed=None, **kwargs):
+        """
+        Creates a reactor in the state of a snapshot, e.g. in another process.
+
+        :param state: the snapshot
+        :type state: dict
+        :param name: name of the new reactor
+        :type name: str
+        :param file: path of its csv file, by default the name with a .csv extension
+        :type file: str
+        :param seed: a new seed for its equipment noise, by default the noise continues from the snapshot
+        :type seed: int
+        :param kwargs: the other arguments of Reactor, the binary log is kept if the snapshot had one and the csv file
+        unless csv_log is given
+        :return: the reactor
+        :rtype: Reactor
+        """
+        kwargs.setdefault('csv_log', state['offset'] is not None)
+        reactor = cls(name, binary_log=state['binary_rows'] is not None, **kwargs)
+        if file is not None:
+            reactor.file = file
+            if reactor.binary_file is not None:
+                reactor.binary_file = os.path.splitext(file)[0] + '.bin'
+        reactor.restore(state)
+        if seed is not None:
+            reactor.seed = seed
+            reactor.rng = np.random.default_rng(seed)
+            reactor.noise_block = []
+            reactor.noise_index = 0
+        return reactor
+
+    def open_ring(self):
+        """
+        Creates the reactor's shared memory ring buffer for the run.
+        :return: None
+        """
+        self.ring = RingBuffer(self.ring_name)
+        self.ring.create(self.start_time)
 
-            writer.writerow(first_values)
-            csvfile.close()
+    def create_csv(self):
+        """
+        Creates the csv file for the reactor instance with column headers and the first row of data values. The file is
+        kept open for the rest of the run so every logged row is appended without reopening it. The binary log and
+        ring buffer are created along with it when they are enabled.
+        :return: the first row of values in the same order as the csv headers
+        :rtype: list
+        """
+        self.close()
+        if self.csv_log:
+            self.csvfile = open(self.file, 'w', newline='')
+            self.writer = csv.writer(self.csvfile, delimiter=',')
+            self.writer.writerow(HEADERS)
+        first_values = [self.start_time]
+        parameters = [self.agitation, self.airflow, self.DO, self.temp, self.pH, self.feed_pump, self.base_pump,
+                      self.antifoam_pump]
+        for parameter, band, noise in zip(parameters, NOISE_BANDS, self.next_noise()):
+            if band:  # the first row has the same ±0.05% noise on every parameter other than the pumps
+                first_values.append(round(parameter * (1 + 0.0005 * noise), 2))
+            else:
+                first_values.append(parameter)
+
+        if self.writer is not None:
+            self.writer.writerow(first_values)
+        if self.binary_file is not None:
+            # one row for every minute of the run plus the first row
+            self.run_log = BinaryRunLog(self.binary_file, capacity=self.recipe.final_eft + 1)
+            self.run_log.create(self.start_time)
+            self.run_log.append(self.start_time, first_values[1:])
+        if self.ring_name is not None:
+            self.open_ring()
+            self.ring.append(self.start_time, first_values[1:])
+        self.timestamp = self.start_time
+        self.eft = datetime.timedelta(0)
+        self.minute = 0
+        self.flush()
+        return first_values
 
     def log_data(self):
         """
         If the run is still active, this calls all the methods that declare the value of each parameter and logs
         a single row of data to the reactor's csv file. Every time a new row of data is logged to the csv, it is counted
         as an EFT of one minute. When the current EFT has reached the final EFT, this will call the end_run method and
-        finish the fermentation run.
-        :return: None
+        finish the fermentation run. The cost of logging a row does not depend on how many rows are already in the csv.
+        :return: the logged row of values in the same order as the csv headers, otherwise None once the run has ended
+        :rtype: list
         """
         values = []
-        lines = open(self.file).readlines()
-        last_timestamp_str = lines[-1].split(',')[0]
-        last_timestamp = datetime.datetime.strptime(last_timestamp_str, '%Y-%m-%d %H:%M:%S.%f')
-        current_timestamp = last_timestamp + datetime.timedelta(minutes=1)
+        current_timestamp = self.timestamp + datetime.timedelta(minutes=1)
         current_eft = current_timestamp - self.start_time
+        minute = self.minute + 1
 
-        if current_eft < self.final_eft:
+        if minute < self.recipe.final_eft:
             values.append(current_timestamp)
-            self.initial_DO(current_eft)
-            self.first_pulse(current_eft)
-            self.feed_spike(current_eft)
-            self.feed_controller(current_eft)
+            self.initial_DO(minute)
+            self.first_pulse(minute)
+            self.feed_spike(minute)
+            self.feed_controller(minute)
             self.base_controller()
             self.motor_controller()
-            self.antifoam_controller(current_eft)
+            self.antifoam_controller(minute)
             self.airflow_controller()
             self.temp_controller()
 
             # add all the parameter values to the 'value' list that will be used to append data to the csv file
-            for parameter in [self.agitation, self.airflow, self.DO, self.temp, self.pH, self.feed_pump, self.base_pump,
-                              self.antifoam_pump]:
-
-                if parameter == self.pH:  # pH needs less noise than other parameters to be more realistic
-                    values.append(round(random.uniform(0.9995 * parameter, 1.0005 * parameter), 4))
-                # pumps shouldn't have equipment noise i.e. 'off' should hold a steady 0 value
-                elif parameter == self.antifoam_pump or parameter == self.base_pump or parameter == self.feed_pump:
+            parameters = [self.agitation, self.airflow, self.DO, self.temp, self.pH, self.feed_pump, self.base_pump,
+                          self.antifoam_pump]
+            for column, (parameter, band, noise) in enumerate(zip(parameters, NOISE_BANDS, self.next_noise())):
+                if not band:
                     values.append(parameter)
                 else:
-                    values.append(round(random.uniform(0.995 * parameter, 1.005 * parameter), 2))
+                    values.append(round(parameter * (1 + band * noise), 4 if column == 4 else 2))
             values.append(current_eft)
 
-            with open(self.file, 'a', newline='') as csvfile:
-                writer = csv.writer(csvfile, delimiter=',')
-                writer.writerow(values)
-                csvfile.close()
+            if self.writer is not None:
+                self.writer.writerow(values)
+            if self.run_log is not None:
+                self.run_log.append(current_timestamp, values[1:-1])
+            if self.ring is not None:
+                self.ring.append(current_timestamp, values[1:-1])
+            self.timestamp = current_timestamp
+            self.eft = current_eft
+            self.minute = minute
+            self.pending_rows += 1
+            if self.flush_due():
+                self.flush()
+            return values
 
         else:
             self.end_run()
+            return None
+
+    def quiet_minutes(self, limit=None):
+        """
+        Counts the minutes ahead in which no controller changes the state of the reactor, i.e. the rows only follow
+        the recipe's tables (the lag phase DO curve and the antifoam schedule) plus equipment noise. A stretch ends at
+        the next event: the first pulse, a feed spike, or the end of the run. There are no quiet minutes while a
+        deviation is set, the reactor is feeding, spiking or dosing base, or the DO has to be corrected after a fixed
+        motor or airflow deviation.
+
+        :param limit: the last minute that may be counted, by default the last minute of the run
+        :type limit: int
+        :return: the number of quiet minutes after the current one
+        :rtype: int
+        """
+        if not self.active or self.feeding or self.spiking or self.fixed_motor or self.fixed_airflow or \
+                any(getattr(self, deviation + '_deviation') is not None for deviation in DEVIATIONS):
+            return 0
+        if not 7.20 <= self.pH <= (7.22 if self.feed_triggered else 7.27):
+            return 0
+        last = self.recipe.final_eft - 1 if limit is None else min(limit, self.recipe.final_eft - 1)
+        # the minutes ahead are checked in growing windows, so a call just before an event stays cheap
+        count = 0
+        window = 16
+        while self.minute + count < last:
+            minutes = np.arange(self.minute + count + 1, min(last, self.minute + count + window) + 1)
+            quiet = np.ones(minutes.size, dtype=bool)
+            if not self.feed_triggered:
+                quiet &= ~self.recipe.first_pulse[minutes]
+            if self.last_feed is not None:
+                interval = self.recipe.spike_interval[minutes]
+                quiet &= ~((interval > 0) & (minutes > self.last_feed + interval))
+            if not quiet.all():
+                return count + int(np.argmin(quiet))
+            count += minutes.size
+            window *= 4
+        return count
+
+    def fast_forward(self, limit=None):
+        """
+        Logs the quiet minutes ahead (see quiet_minutes) in bulk instead of stepping the controllers through every
+        minute. The rows are computed in closed form and get the same equipment noise, so they are the rows log_data
+        would have logged. The row of the next event is left to log_data, and a deviation set between calls ends the
+        fast forward.
+
+        :param limit: the last minute that may be logged, by default the last minute of the run
+        :type limit: int
+        :return: the logged rows in the same order as the csv headers, an empty list if the next minute is not quiet
+        :rtype: list of lists
+        """
+        count = self.quiet_minutes(limit)
+        if not count:
+            return []
+        minutes = np.arange(self.minute + 1, self.minute + count + 1)
+        parameters = np.empty((count, 5))
+        parameters[:, 0] = 1500 if self.feed_triggered else 1000
+        parameters[:, 1] = 60
+        # the DO follows the baseline until the end of the lag phase and then holds its last value
+        baseline = self.recipe.baseline_DO[minutes]
+        latest = np.maximum.accumulate(np.where(np.isnan(baseline), -1, np.arange(count)))
+        parameters[:, 2] = np.where(latest >= 0, baseline[np.maximum(latest, 0)], self.DO)
+        parameters[:, 3] = 32
+        parameters[:, 4] = self.pH
+        noisy = parameters * (1 + np.array(NOISE_BANDS[:5]) * self.take_noise(count)[:, :5])
+        noisy[:, :4] = np.round(noisy[:, :4], 2)
+        noisy[:, 4] = np.round(noisy[:, 4], 4)
+        antifoam = self.recipe.antifoam[minutes].astype(int).tolist()
+
+        rows = []
+        timestamp = self.timestamp
+        eft = self.eft
+        for values, pump in zip(noisy.tolist(), antifoam):
+            timestamp += MINUTE
+            eft += MINUTE
+            values.extend((0, 0, pump, eft))
+            values.insert(0, timestamp)
+            rows.append(values)
+        if self.writer is not None:
+            self.writer.writerows(rows)
+        if self.run_log is not None or self.ring is not None:
+            for row in rows:
+                if self.run_log is not None:
+                    self.run_log.append(row[0], row[1:-1])
+                if self.ring is not None:
+                    self.ring.append(row[0], row[1:-1])
+
+        self.agitation = 1500 if self.feed_triggered else 1000
+        self.airflow = 60
+        self.DO = float(parameters[-1, 2])
+        self.temp = 32
+        self.feed_pump = 0
+        self.base_pump = 0
+        self.antifoam_pump = antifoam[-1]
+        self.timestamp = rows[-1][0]
+        self.eft = rows[-1][-1]
+        self.minute += count
+        self.pending_rows += count
+        if self.flush_due():
+            self.flush()
+        return rows
 
     def first_pulse(self, eft):
         """
@@ -173,12 +574,12 @@ class Reactor:
         starving and in need of glucose. This first pulse spikes higher/longer than all subsequent feed spikes to ensure
         the cells are requiring glucose and feed is not prematurely introduced to the reactor. This function is only
         active after an EFT of 9 hours (around the time the actual first feed spike would occur).
-        :param eft: current Elapsed Fermentation Time (EFT)
-        :type eft: datetime.timedelta object
+        :param eft: current Elapsed Fermentation Time (EFT) in minutes
+        :type eft: int
         :return: None
         """
 
-        if datetime.timedelta(hours=9) < eft and not self.feeding and not self.feed_triggered and \
+        if self.recipe.first_pulse[eft] and not self.feeding and not self.feed_triggered and \
                 not self.feed_deviation == 'on':
             if self.pH < 8:
                 self.pH += 0.002
@@ -193,8 +594,8 @@ class Reactor:
         less likely to occur and will have less of a negative impact. Feed triggers occur more during the middle of the
         run when the cells are in the stationary phase of the growth curve. Towards the end of the run the cells begin
         to die (death phrase) and they do not require glucose as frequently.
-        :param eft: current Elapsed Fermentation Time (EFT)
-        :type eft: datetime.timedelta object
+        :param eft: current Elapsed Fermentation Time (EFT) in minutes
+        :type eft: int
         :return: None
         """
 
@@ -208,49 +609,33 @@ class Reactor:
                 self.DO += 0.3
 
         elif self.last_feed is not None:  # feeding is not a constant intervals throughout the entire run
-            if datetime.timedelta(hours=15) < eft < datetime.timedelta(hours=30):
-                if eft > self.last_feed + datetime.timedelta(hours=1, minutes=30) or self.spiking:
-                    self.spiking = True
-                    self.last_feed = eft
-
-            elif datetime.timedelta(hours=30) < eft < datetime.timedelta(hours=55):
-                if eft > self.last_feed + datetime.timedelta(minutes=30) or self.spiking:
-                    self.spiking = True
-                    self.last_feed = eft
-
-            elif datetime.timedelta(hours=55) < eft < datetime.timedelta(hours=66):
-                if eft > self.last_feed + datetime.timedelta(hours=2) or self.spiking:
-                    self.spiking = True
-                    self.last_feed = eft
+            interval = self.recipe.spike_interval[eft]
+            if interval and (eft > self.last_feed + interval or self.spiking):
+                self.spiking = True
+                self.last_feed = eft
 
     def initial_DO(self, eft):
         """
         Adjusts the DO values of the reactor to replicate the trends of the initial lag and growth phases.
-        :param eft: current Elapsed Fermentation Time (EFT)
-        :type eft: datetime.timedelta object
+        :param eft: current Elapsed Fermentation Time (EFT) in minutes
+        :type eft: int
         :return: None
         """
-        if eft < datetime.timedelta(hours=7, minutes=36):
-            int_eft = eft.total_seconds() / 3600
-            self.DO = -math.exp(int_eft - 3.5) + 100
+        baseline = self.recipe.baseline_DO[eft]
+        if not np.isnan(baseline):  # the baseline ends with the growth phase
+            self.DO = float(baseline)
 
     def antifoam_controller(self, eft):
         """
         Controls the antifoam pump data including operating under normal conditions or if a deviation causes the pump to
         be on or off.
-        :param eft: current EFT
-        :type eft: datetime.timedelta object
+        :param eft: current EFT in minutes
+        :type eft: int
         :return: None
         """
         if self.antifoam_deviation is None:
-            for hour in range(10, 68, 3):
-                # turn pump on every 3 hours
-                if datetime.timedelta(hours=hour) <= eft <= datetime.timedelta(hours=hour, minutes=10):
-                    self.antifoam_pump = 1
-                    break
-                # turn pump off every 3 hours and 10 minutes
-                else:
-                    self.antifoam_pump = 0
+            # turn pump on every 3 hours for 10 minutes
+            self.antifoam_pump = 1 if self.recipe.antifoam[eft] else 0
 
         elif self.antifoam_deviation == 'on':
             self.antifoam_pump = 1
@@ -336,6 +721,8 @@ class Reactor:
         spikes. The feed is acidic which decreases the pH and provides the cells a carbon source to consume. This is an
         aerobic fermentation so when the cells are consuming glucose the cells are using oxygen so the DO value
         decreases.
+        :param eft: current Elapsed Fermentation Time (EFT) in minutes
+        :type eft: int
         :return: None
         """
         # disable feeding if a base deviation is causing the pH to rise (which would normally trigger the feed) in order
@@ -357,14 +744,7 @@ class Reactor:
             elif (7.19 < self.pH > 7.22 or self.feeding) and self.feed_triggered:
                 self.pH -= 0.002
                 if self.DO > 0:
-                    if eft > datetime.timedelta(hours=50):
-                        self.DO -= 0.1
-                    elif eft > datetime.timedelta(hours=45):
-                        self.DO -= 0.2
-                    elif eft > datetime.timedelta(hours=25):
-                        self.DO -= 0.25
-                    else:
-                        self.DO -= 0.5
+                    self.DO -= float(self.recipe.DO_uptake[eft])
                 self.feed_pump = 40
                 self.feeding = True
                 self.spiking = False
@@ -406,3 +786,194 @@ class Reactor:
 
         elif self.base_deviation == 'off':
             self.base_pump = 0
+
+
+def parse_duration(text):
+    """
+    Converts an EFT written as a combination of days, hours and minutes (e.g. '68h', '1d12h', '90m') into a
+    timedelta. A plain number is read as minutes.
+
+    :param text: the duration to convert
+    :type text: str
+    :return: the duration
+    :rtype: datetime.timedelta object
+    """
+    if re.fullmatch(r'\d+(\.\d+)?', text):
+        return datetime.timedelta(minutes=float(text))
+    parts = re.findall(r'(\d+(?:\.\d+)?)([dhm])', text)
+    if not parts or ''.join(number + unit for number, unit in parts) != text:
+        raise argparse.ArgumentTypeError(f'invalid duration {text!r}, expected e.g. 68h, 1d12h or 90m')
+    units = {'d': 'days', 'h': 'hours', 'm': 'minutes'}
+    return sum((datetime.timedelta(**{units[unit]: float(number)}) for number, unit in parts), datetime.timedelta(0))
+
+
+def parse_speed(text):
+    """
+    Reads the speed of a headless run, either 'max' to run as fast as possible or a speed-up factor over real time.
+
+    :param text: 'max' or a positive number
+    :type text: str
+    :return: the speed-up factor, None for 'max'
+    :rtype: float
+    """
+    if text == 'max':
+        return None
+    try:
+        speed = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid speed {text!r}, expected max or a speed-up factor')
+    if speed <= 0:
+        raise argparse.ArgumentTypeError('the speed-up factor must be positive')
+    return speed
+
+
+def parse_reactors(text):
+    """
+    Reads the number of reactors of a headless run.
+
+    :param text: a positive whole number
+    :type text: str
+    :return: the number of reactors
+    :rtype: int
+    """
+    try:
+        reactors = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid number of reactors {text!r}')
+    if reactors < 1:
+        raise argparse.ArgumentTypeError('at least one reactor must be simulated')
+    return reactors
+
+
+def run_headless(reactors=1, until=None, speed=None, flush_rows=60, directory='.', detect=True, seed=None,
+                 recipe=None, shared_memory=False, csv_log=True, fast_forward=False):
+    """
+    Runs one or more reactors without the GUI and checks every logged row for deviations. Rows are written to the csv
+    files in batches of flush_rows and the detectors are fed the logged rows directly, so nothing is read back from
+    disk. With a speed-up factor, one simulated minute takes 60 / speed seconds of wall time; otherwise the reactors
+    run as fast as the CPU allows.
+
+    :param reactors: number of reactors to simulate, at least one, which are named dg1, dg2, ...
+    :type reactors: int
+    :param until: EFT to stop the run at, by default the final EFT of the reactors
+    :type until: datetime.timedelta object
+    :param speed: speed-up factor over real time, None to run as fast as possible
+    :type speed: float
+    :param flush_rows: number of rows buffered before being written to each csv file
+    :type flush_rows: int
+    :param directory: directory the csv files are written to
+    :type directory: str
+    :param detect: whether to check the logged rows for deviations
+    :type detect: bool
+    :param seed: seed of the first reactor's equipment noise, the following reactors use seed + 1, seed + 2, ...
+    :type seed: int
+    :param recipe: the process timing of every reactor, by default the timing described in the Reactor docstring
+    :type recipe: recipe.Recipe
+    :param shared_memory: whether every reactor also publishes its rows to a shared memory ring buffer
+    :type shared_memory: bool
+    :param csv_log: whether the rows are written to the csv files
+    :type csv_log: bool
+    :param fast_forward: whether to log the quiet stretches of the runs in bulk (see Reactor.fast_forward), which
+    needs the reactors to run as fast as possible
+    :type fast_forward: bool
+    :return: the number of simulated minutes, the number of alerts and the wall time in seconds
+    :rtype: tuple
+    """
+    if fast_forward and speed is not None:
+        raise ValueError('A fast forward run cannot follow a speed-up factor')
+    if reactors < 1:
+        raise ValueError('At least one reactor must be simulated')
+    if detect:
+        from deviation_notifier import DeviationDetector
+
+    os.makedirs(directory, exist_ok=True)
+    run = []
+    for number in range(1, reactors + 1):
+        reactor = Reactor(name=f'dg{number}', flush_rows=flush_rows, seed=None if seed is None else seed + number - 1,
+                          recipe=recipe, shared_memory=shared_memory, csv_log=csv_log)
+        reactor.file = os.path.join(directory, reactor.file)
+        reactor.start_run()
+        reactor.create_csv()
+        run.append((reactor, DeviationDetector(reactor.name) if detect else None))
+    if until is None:
+        until = run[0][0].final_eft
+    # the last minute that is logged, the first one at or after until
+    last_minute = math.ceil(until / datetime.timedelta(minutes=1))
+
+    minutes = 0
+    alerts = 0
+    start = time.perf_counter()
+    while any(reactor.active and reactor.eft < until for reactor, _ in run):
+        for reactor, detector in run:
+            if not reactor.active or reactor.eft >= until:
+                continue
+            rows = reactor.fast_forward(last_minute) if fast_forward else []
+            if not rows:
+                values = reactor.log_data()
+                if values is None:
+                    continue
+                rows = [values]
+            minutes += len(rows)
+            if detector is not None:
+                for values in rows:
+                    for label, deviation_start in detector.update(dict(zip(HEADERS, values))):
+                        alerts += 1
+                        print(f'{reactor.name}: {label} deviation at {deviation_start}')
+
+        if speed is not None:
+            ahead = start + run[0][0].eft.total_seconds() / speed - time.perf_counter()
+            if ahead > 0:
+                time.sleep(ahead)
+
+    for reactor, _ in run:
+        reactor.close()
+    return minutes, alerts, time.perf_counter() - start
+
+
+def main(argv=None):
+    """
+    Command line entry point for running reactors without the GUI, e.g.
+    python -m bioreactor run --reactors 10 --until 68h --speed max
+    :param argv: command line arguments, by default sys.argv
+    :type argv: list
+    :return: None
+    """
+    parser = argparse.ArgumentParser(prog='bioreactor', description='Bioreactor simulator')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    run = subparsers.add_parser('run', help='simulate reactors headless without the GUI')
+    run.add_argument('--reactors', type=parse_reactors, default=1, help='number of reactors to simulate (default 1)')
+    run.add_argument('--until', type=parse_duration, default=None,
+                     help='EFT to stop at, e.g. 68h or 1d12h (default the final EFT)')
+    run.add_argument('--speed', type=parse_speed, default=None,
+                     help="'max' or a speed-up factor over real time, e.g. 60 (default max)")
+    run.add_argument('--flush-rows', type=int, default=60, help='rows buffered per csv write (default 60)')
+    run.add_argument('--directory', default='.', help='directory for the reactor csv files (default .)')
+    run.add_argument('--no-detect', dest='detect', action='store_false', help='do not check for deviations')
+    run.add_argument('--seed', type=int, default=None, help='seed of the equipment noise for reproducible runs')
+    run.add_argument('--recipe', type=Recipe.load, default=None,
+                     help='json (or yaml) file with the process timing of the run (default the built-in recipe)')
+    run.add_argument('--shared-memory', action='store_true',
+                     help='publish the rows to shared memory ring buffers named bioreactor_<reactor>')
+    run.add_argument('--no-csv', dest='csv_log', action='store_false', help='do not write the csv files')
+    run.add_argument('--fast-forward', action='store_true',
+                     help='log the stretches between process events in bulk (only with --speed max)')
+    metrics.add_arguments(run)
+    args = parser.parse_args(argv)
+    if args.fast_forward and args.speed is not None:
+        parser.error('--fast-forward can only be used with --speed max')
+
+    stop_metrics = metrics.start(args)
+    try:
+        minutes, alerts, seconds = run_headless(args.reactors, args.until, args.speed, args.flush_rows,
+                                                args.directory, args.detect, args.seed, args.recipe,
+                                                args.shared_memory, args.csv_log, args.fast_forward)
+    finally:
+        stop_metrics()
+    rate = minutes / seconds if seconds > 0 else float('inf')
+    print(f'simulated {minutes} reactor-minutes across {args.reactors} reactor(s) in {seconds:.2f} s '
+          f'({rate:.0f} simulated-minutes/s, {alerts} alert(s))')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import multiprocessing
+import random
+import time
+from functools import partial
+import numpy as np
+from bioreactor import Reactor, HEADERS
+from deviation_notifier import ALLOWANCE, PUMP_SPECS, DeviationDetector, load_drift
+
+# the deviation buttons of the simulatorpyqt module and the parameter each one should be detected on
+DEVIATIONS = {'Feed On': 'Feed Pump [ml/hr]', 'Feed Off': 'Feed Pump [ml/hr]', 'Base On': 'Base Pump [mL/hr]',
+              'Base Off': 'Base Pump [mL/hr]', 'Agitation Up': 'Agitation [rpm]', 'Agitation Down': 'Agitation [rpm]',
+              'Antifoam On': 'Antifoam Pump [mL/hr]', 'Antifoam Off': 'Antifoam Pump [mL/hr]',
+              'Airflow Up': 'Airflow [mL/s]', 'Airflow Down': 'Airflow [mL/s]', 'Temp Up': 'Temp [C]',
+              'Temp Down': 'Temp [C]'}
+# minutes simulated after a deviation is fixed to catch late alerts
+AFTER_FIX = 60
+# the minutes a deviation has to last before the fixed tolerances can alert on it: the minutes the reactor's controllers
+# take to move a drifting parameter out of its tolerance plus the allowance it may then stay out, or the allowance a
+# pump may stay on or off. Scenarios that are fixed sooner and not detected are undetectable rather than missed
+MIN_DURATIONS = {'Feed On': ALLOWANCE, 'Feed Off': PUMP_SPECS['Feed Pump [ml/hr]']['off'], 'Base On': ALLOWANCE,
+                 'Base Off': PUMP_SPECS['Base Pump [mL/hr]']['off'], 'Agitation Up': 2 + ALLOWANCE,
+                 'Agitation Down': 2 + ALLOWANCE, 'Antifoam On': PUMP_SPECS['Antifoam Pump [mL/hr]']['on'],
+                 'Antifoam Off': PUMP_SPECS['Antifoam Pump [mL/hr]']['off'], 'Airflow Up': 30 + ALLOWANCE,
+                 'Airflow Down': 30 + ALLOWANCE, 'Temp Up': 20 + ALLOWANCE, 'Temp Down': 20 + ALLOWANCE}
+
+
+def generate_scenarios(count, seed=0, min_onset=60, max_duration=600):
+    """
+    Generates randomized fault injection scenarios. Every scenario introduces one deviation at a random EFT and fixes
+    it after a random duration.
+
+    :param count: number of scenarios
+    :type count: int
+    :param seed: seed of the scenario generator
+    :type seed: int
+    :param min_onset: earliest EFT in minutes a deviation can start
+    :type min_onset: int
+    :param max_duration: longest a deviation can last in minutes
+    :type max_duration: int
+    :return: the scenarios, each with an id, seed for the reactor's noise, deviation, onset and fix EFT in minutes
+    :rtype: list of dicts
+    """
+    rng = random.Random(seed)
+    final = 68 * 60
+    scenarios = []
+    for number in range(count):
+        onset = rng.randrange(min_onset, final - 10)
+        duration = rng.randint(5, max_duration)
+        scenarios.append({'id': number, 'seed': rng.getrandbits(32), 'deviation': rng.choice(list(DEVIATIONS)),
+                          'onset': onset, 'fix': min(onset + duration, final)})
+    return scenarios
+
+
+def run_scenario(scenario, drift=None):
+    """
+    Runs a single scenario headless through a Reactor and a DeviationDetector. The reactor does not write a csv
+    file, the detector is handed every row as it is logged.
+
+    :param scenario: one of the scenarios from generate_scenarios
+    :type scenario: dict
+    :param drift: the drift charts of the detector, see deviation_notifier.DeviationDetector
+    :type drift: dict of label to dict
+    :return: the scenario along with the EFT in minutes and parameter of every alert
+    :rtype: dict
+    """
+    parameter, deviation = scenario['deviation'].lower().split()
+    alerts = []
+    reactor = Reactor(name='campaign', seed=scenario['seed'], csv_log=False)
+    reactor.start_run()
+    reactor.create_csv()
+    detector = DeviationDetector(reactor.name, drift)
+    end = scenario['fix'] + AFTER_FIX
+
+    minute = 0
+    while reactor.active and minute < end:
+        minute += 1
+        if minute == scenario['onset']:
+            setattr(reactor, parameter + '_deviation', deviation)
+        elif minute == scenario['fix']:
+            setattr(reactor, parameter + '_deviation', None)
+        values = reactor.log_data()
+        if values is None:
+            break
+        for label, start in detector.update(dict(zip(HEADERS, values))):
+            alerts.append((minute, label))
+    reactor.close()
+    return dict(scenario, alerts=alerts)
+
+
+def classify(result):
+    """
+    Sorts the alerts of a scenario. The first alert on the deviating parameter between the onset and the fix is the
+    detection, alerts on any parameter before the onset are false alarms, and alerts on other parameters after the
+    onset are knock-on effects of the deviation (e.g. the pH during a feed deviation). A scenario without a detection is
+    late if the deviating parameter was only alerted after the fix, undetectable if it was fixed within its
+    MIN_DURATIONS, and missed otherwise.
+
+    :param result: a scenario returned by run_scenario
+    :type result: dict
+    :return: the outcome ('detected', 'late', 'undetectable' or 'missed'), the detection delay in minutes (None unless
+    it was detected), the false alarm parameters and the knock-on parameters
+    :rtype: tuple
+    """
+    expected = DEVIATIONS[result['deviation']]
+    delay = None
+    late = False
+    false_alarms = []
+    knock_on = []
+    for minute, label in result['alerts']:
+        if minute < result['onset']:
+            false_alarms.append(label)
+        elif label != expected:
+            knock_on.append(label)
+        elif minute >= result['fix']:
+            late = True
+        elif delay is None:
+            delay = minute - result['onset']
+    if delay is not None:
+        outcome = 'detected'
+    elif late:
+        outcome = 'late'
+    elif result['fix'] - result['onset'] <= MIN_DURATIONS[result['deviation']]:
+        outcome = 'undetectable'
+    else:
+        outcome = 'missed'
+    return outcome, delay, false_alarms, knock_on
+
+
+def summarize(results):
+    """
+    Aggregates the results of a campaign per deviation. The missed alert rate leaves out the undetectable scenarios,
+    and the late alerts are counted on their own.
+
+    :param results: the scenarios returned by run_scenario
+    :type results: list of dicts
+    :return: for every deviation, the number of scenarios, the number of late and undetectable scenarios, missed alert
+    rate, detection delay percentiles and false alarms, plus the false alarm rate of every parameter over all scenarios
+    :rtype: dict
+    """
+    summary = {'deviations': {}, 'false_alarms': {}}
+    for name in DEVIATIONS:
+        summary['deviations'][name] = {'scenarios': 0, 'detected': 0, 'late': 0, 'undetectable': 0, 'missed': 0,
+                                       'delays': [], 'false_alarms': 0, 'knock_on': 0}
+    false_alarms = {}
+    for result in results:
+        outcome, delay, false, knock_on = classify(result)
+        stats = summary['deviations'][result['deviation']]
+        stats['scenarios'] += 1
+        stats[outcome] += 1
+        stats['false_alarms'] += len(false)
+        stats['knock_on'] += len(knock_on)
+        if delay is not None:
+            stats['delays'].append(delay)
+        for label in false:
+            false_alarms[label] = false_alarms.get(label, 0) + 1
+
+    for stats in summary['deviations'].values():
+        delays = stats.pop('delays')
+        detectable = stats['scenarios'] - stats['undetectable']
+        stats['missed_rate'] = stats['missed'] / detectable if detectable else None
+        for percentile in (50, 90, 99):
+            stats[f'delay_p{percentile}'] = float(np.percentile(delays, percentile)) if delays else None
+    # false alarms per scenario, since every scenario is normal before the onset of its deviation
+    summary['false_alarms'] = {label: count / len(results) for label, count in sorted(false_alarms.items())}
+    summary['scenarios_with_false_alarm'] = sum(1 for result in results if classify(result)[2]) / len(results) \
+        if results else 0
+    return summary
+
+
+def run_campaign(scenarios, processes=None, chunksize=4, drift=None):
+    """
+    Runs the scenarios across a pool of processes.
+
+    :param scenarios: the scenarios from generate_scenarios
+    :type scenarios: list of dicts
+    :param processes: number of worker processes, by default one per core
+    :type processes: int
+    :param chunksize: number of scenarios handed to a worker at once
+    :type chunksize: int
+    :param drift: the drift charts of the detector, see deviation_notifier.DeviationDetector
+    :type drift: dict of label to dict
+    :return: the results of every scenario
+    :rtype: list of dicts
+    """
+    if processes == 1:
+        return [run_scenario(scenario, drift) for scenario in scenarios]
+    with multiprocessing.Pool(processes) as pool:
+        return list(pool.imap_unordered(partial(run_scenario, drift=drift), scenarios, chunksize=chunksize))
+
+
+def main(argv=None):
+    """
+    Command line entry point, e.g. python campaign.py --scenarios 1000 --json campaign.json
+    :param argv: command line arguments, by default sys.argv
+    :type argv: list
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Monte Carlo fault injection campaign for the deviation notifier')
+    parser.add_argument('--scenarios', type=int, default=100, help='number of scenarios (default 100)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the scenario generator (default 0)')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default one per core)')
+    parser.add_argument('--max-duration', type=int, default=600, help='longest deviation in minutes (default 600)')
+    parser.add_argument('--json', help='write the summary and every scenario result to this file')
+    parser.add_argument('--drift', nargs='?', const='', default=None, metavar='JSON',
+                        help='also alert on slow drifts with CUSUM/EWMA charts, optionally configured per parameter in '
+                             'a json file (default deviation_notifier.DRIFT_SPECS)')
+    args = parser.parse_args(argv)
+
+    scenarios = generate_scenarios(args.scenarios, args.seed, max_duration=args.max_duration)
+    start = time.perf_counter()
+    results = run_campaign(scenarios, args.processes, drift=load_drift(args.drift))
+    seconds = time.perf_counter() - start
+    summary = summarize(results)
+
+    print(f'{"deviation":<16}{"runs":>6}{"short":>7}{"missed":>8}{"late":>6}{"p50":>7}{"p90":>7}{"p99":>7}{"false":>7}'
+          f'{"knock-on":>10}')
+    for name, stats in summary['deviations'].items():
+        delays = ''.join(f'{stats[key]:>7.0f}' if stats[key] is not None else f'{"-":>7}'
+                         for key in ('delay_p50', 'delay_p90', 'delay_p99'))
+        missed = f'{stats["missed_rate"]:>8.1%}' if stats['missed_rate'] is not None else f'{"-":>8}'
+        print(f'{name:<16}{stats["scenarios"]:>6}{stats["undetectable"]:>7}{missed}{stats["late"]:>6}{delays}'
+              f'{stats["false_alarms"]:>7}{stats["knock_on"]:>10}')
+    print(f'{summary["scenarios_with_false_alarm"]:.1%} of scenarios had a false alarm before the onset')
+    print(f'ran {len(results)} scenarios in {seconds:.1f} s ({len(results) / seconds:.1f} scenarios/s)')
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'summary': summary, 'results': sorted(results, key=lambda result: result['id'])}, json_file,
+                      indent=2)
+
+
+if __name__ == '__main__':
+    main()
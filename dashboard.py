@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+
+import argparse
+import math
+import os
+import sys
+from functools import partial
+import pyqtgraph as pg
+from PyQt5.QtWidgets import *
+from PyQt5.QtCore import *
+import metrics
+from bioreactor import Reactor
+from plotdata import ColumnCache
+from simulatorpyqt import BioreactorSimulator, SimulationWorker
+
+# the trends drawn as sparklines on every tile
+SPARKLINES = ('DO [%]', 'pH')
+
+
+class SuiteWorker(QObject):
+    """
+    Runs the SimulationWorkers of a whole suite on one thread with a single timer, so the number of reactors does not
+    add threads or timers. Each worker keeps its own command queue, row buffer and deviation signal.
+
+    :param workers: the workers of the reactors
+    :type workers: list of SimulationWorker
+    :param interval: milliseconds between logged rows
+    :type interval: int
+    """
+
+    def __init__(self, workers, interval=20):
+        super(SuiteWorker, self).__init__()
+        self.workers = workers
+        self.interval = interval
+        self.timer = None
+
+    @pyqtSlot()
+    def start(self):
+        """
+        Starts the run of every reactor and the shared timer. Called on the worker thread so the timer belongs to it.
+        :return: None
+        """
+        for worker in self.workers:
+            worker.begin()
+        tick = self.tick
+        if metrics.enabled():
+            tick = metrics.timed(tick, 'dashboard_tick', budget=self.interval / 1000)
+        self.timer = QTimer()
+        self.timer.timeout.connect(tick)
+        self.timer.start(self.interval)
+
+    @pyqtSlot()
+    def stop(self):
+        """
+        Stops the timer and closes the logs of every reactor.
+        :return: None
+        """
+        if self.timer is not None:
+            self.timer.stop()
+        for worker in self.workers:
+            worker.stop()
+
+    def tick(self):
+        """
+        Logs a row of every reactor that is still running.
+        :return: None
+        """
+        for worker in self.workers:
+            if worker.reactor.active:
+                worker.tick()
+
+
+class ReactorTile(QFrame):
+    """
+    A compact view of one reactor for the dashboard: its name, alarm state and a sparkline of each of the SPARKLINES.
+    The sparklines are drawn from the cache's decimation pyramid at the width of the tile and ignore the mouse, so a
+    click anywhere on the tile opens the detailed view.
+
+    :param name: name of the reactor
+    :type name: str
+    :param on_click: called with the name of the reactor when the tile is clicked
+    :type on_click: function
+    """
+
+    def __init__(self, name, on_click, *args, **kwargs):
+        super(ReactorTile, self).__init__(*args, **kwargs)
+        self.name = name
+        self.on_click = on_click
+        self.setFrameShape(QFrame.Box)
+        self.setCursor(Qt.PointingHandCursor)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.setSpacing(2)
+        self.title = QLabel(name)
+        self.status = QLabel('OK')
+        header = QHBoxLayout()
+        header.addWidget(self.title)
+        header.addStretch()
+        header.addWidget(self.status)
+        layout.addLayout(header)
+
+        self.plots = {}
+        self.curves = {}
+        for label in SPARKLINES:
+            plot = pg.PlotWidget()
+            plot.setMouseEnabled(False, False)
+            plot.hideButtons()
+            plot.hideAxis('bottom')
+            plot.getAxis('left').setWidth(36)
+            plot.setMinimumHeight(50)
+            plot.setMenuEnabled(False)
+            plot.setAttribute(Qt.WA_TransparentForMouseEvents)
+            plot.setToolTip(label)
+            self.plots[label] = plot
+            self.curves[label] = plot.plot()
+            layout.addWidget(plot)
+        self.setLayout(layout)
+        self.set_alarm(None)
+
+    def mousePressEvent(self, event):
+        """
+        Opens the detailed view of the reactor.
+        :param event: a QMouseEvent object
+        :return: None
+        """
+        self.on_click(self.name)
+
+    def set_alarm(self, text):
+        """
+        Shows the alarm state of the reactor.
+        :param text: the latest deviation, None if the reactor has not deviated
+        :type text: str
+        :return: None
+        """
+        self.status.setText('OK' if text is None else text)
+        self.setStyleSheet('' if text is None else 'ReactorTile { border: 2px solid red; } QLabel { color: red; }')
+
+    def draw(self, cache):
+        """
+        Redraws the sparklines from the reactor's cached columns.
+        :param cache: the columns of the reactor's run
+        :type cache: ColumnCache
+        :return: None
+        """
+        for label, curve in self.curves.items():
+            curve.setData(*cache.pyramid.view(cache, label, width=self.plots[label].width()))
+
+
+class Dashboard(QMainWindow):
+    """
+    Shows a whole fermentation suite as a grid of ReactorTiles. All reactors are simulated by one SuiteWorker thread,
+    and one render timer takes the rows every reactor logged since the last frame into its cache and redraws only the
+    tiles that received rows or raised an alarm, so the cost of a frame follows what changed rather than the number of
+    tanks. Clicking a tile opens the two-plot BioreactorSimulator view of that reactor, which shares its cache and
+    worker. The runs begin with start().
+
+    :param reactors: the reactors of the suite, their runs are started by the dashboard
+    :type reactors: list of bioreactor.Reactor
+    :param interval: milliseconds between logged rows
+    :type interval: int
+    :param refresh: milliseconds between frames
+    :type refresh: int
+    :param columns: number of tiles per row, by default the grid is about 16:9
+    :type columns: int
+    """
+
+    def __init__(self, reactors, interval=20, refresh=250, columns=None, *args, **kwargs):
+        super(Dashboard, self).__init__(*args, **kwargs)
+        self.setWindowTitle('Bioreactor Suite')
+        self.workers = {reactor.name: SimulationWorker(reactor) for reactor in reactors}
+        self.caches = {name: ColumnCache() for name in self.workers}
+        self.tiles = {}
+        self.details = {}
+        self.dirty = set()
+
+        columns = columns or max(1, math.ceil(math.sqrt(len(reactors) * 16 / 9)))
+        layout = QGridLayout()
+        layout.setSpacing(4)
+        for index, name in enumerate(self.workers):
+            self.tiles[name] = ReactorTile(name, self.open_detail)
+            layout.addWidget(self.tiles[name], index // columns, index % columns)
+            self.workers[name].deviation.connect(partial(self.alarm, name))
+        main = QWidget()
+        main.setLayout(layout)
+        self.setCentralWidget(main)
+        self.show()
+
+        self.suite = SuiteWorker(list(self.workers.values()), interval)
+        self.suite_thread = QThread()
+        self.suite.moveToThread(self.suite_thread)
+        self.suite_thread.started.connect(self.suite.start)
+        self.refresh = refresh
+        self.render_timer = QTimer()
+
+    def start(self):
+        """
+        Starts the runs on the suite's thread and the render timer.
+        :return: None
+        """
+        render = self.render
+        if metrics.enabled():
+            render = metrics.timed(render, 'dashboard_render', budget=self.refresh / 1000)
+        self.render_timer.timeout.connect(render)
+        self.suite_thread.start()
+        self.render_timer.start(self.refresh)
+
+    def alarm(self, name, label, start):
+        """
+        Marks the tile of a reactor with a deviation found by its worker.
+        :param name: name of the reactor
+        :type name: str
+        :param label: the failing parameter
+        :type label: str
+        :param start: start time of the deviation
+        :type start: datetime.datetime object
+        :return: None
+        """
+        self.tiles[name].set_alarm(f'{label} since {start:%H:%M}')
+
+    def render(self):
+        """
+        Takes the rows every reactor logged since the last frame into its cache and redraws the tiles that changed.
+        :return: the number of tiles redrawn
+        :rtype: int
+        """
+        for name, worker in self.workers.items():
+            if self.caches[name].extend(worker.drain()):
+                self.dirty.add(name)
+        for name in self.dirty:
+            self.tiles[name].draw(self.caches[name])
+        redrawn = len(self.dirty)
+        self.dirty.clear()
+        return redrawn
+
+    def open_detail(self, name):
+        """
+        Opens the detailed view of a reactor, or brings it to the front if it is already open.
+        :param name: name of the reactor
+        :type name: str
+        :return: None
+        """
+        detail = self.details.get(name)
+        if detail is None or not detail.isVisible():
+            detail = BioreactorSimulator(worker=self.workers[name], cache=self.caches[name])
+            self.details[name] = detail
+        detail.raise_()
+        detail.activateWindow()
+
+    def closeEvent(self, event):
+        """
+        Closes the detailed views, stops the suite and waits for its thread to finish before the window closes.
+        :param event: a QCloseEvent object
+        :return: None
+        """
+        self.render_timer.stop()
+        for detail in self.details.values():
+            detail.close()
+        if self.suite_thread.isRunning():
+            QMetaObject.invokeMethod(self.suite, 'stop', Qt.BlockingQueuedConnection)
+            self.suite_thread.quit()
+            self.suite_thread.wait()
+        super(Dashboard, self).closeEvent(event)
+
+
+def main(argv=None):
+    """
+    Command line entry point, e.g. python dashboard.py --reactors 24
+    :param argv: command line arguments, by default sys.argv
+    :type argv: list
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Dashboard of a simulated fermentation suite')
+    parser.add_argument('--reactors', type=int, default=24, help='number of reactors to simulate (default 24)')
+    parser.add_argument('--columns', type=int, default=None, help='tiles per row (default about 16:9)')
+    parser.add_argument('--interval', type=int, default=20, help='milliseconds between logged rows (default 20)')
+    parser.add_argument('--refresh', type=int, default=250, help='milliseconds between frames (default 250)')
+    parser.add_argument('--directory', default='.', help='directory for the reactor csv files (default .)')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the equipment noise for reproducible runs')
+    args = parser.parse_args(argv)
+
+    # set BIOREACTOR_METRICS_PORT to time the ticks and frames and serve the metrics on that local port
+    if os.environ.get('BIOREACTOR_METRICS_PORT'):
+        metrics.enable()
+        metrics.serve(int(os.environ['BIOREACTOR_METRICS_PORT']))
+    os.makedirs(args.directory, exist_ok=True)
+    reactors = []
+    for number in range(1, args.reactors + 1):
+        reactor = Reactor(name=f'dg{number}', flush_rows=60,
+                          seed=None if args.seed is None else args.seed + number - 1)
+        reactor.file = os.path.join(args.directory, reactor.file)
+        reactors.append(reactor)
+
+    app = QApplication(sys.argv[:1])
+    dashboard = Dashboard(reactors, args.interval, args.refresh, args.columns)
+    dashboard.start()
+    sys.exit(app.exec_())
+
+
+if __name__ == '__main__':
+    main()
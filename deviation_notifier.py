@@ -1,27 +1,195 @@
 import pandas as pd
+import numpy as np
 import datetime
+import json
+import math
 import os
+import csv
 import smtplib
 from twilio.rest import Client
-
-notified = {}
-rpm = 1000
-
-
-def read_csv():
+import runlog
+
+# the headers of the process values in the order the reactor writes them to its csv file
+LABELS = runlog.VALUE_LABELS
+PUMP_SPECS = {'Base Pump [mL/hr]': {'on': 5, 'off': 310}, 'Feed Pump [ml/hr]': {'on': 50, 'off': 310},
+              'Antifoam Pump [mL/hr]': {'on': 20, 'off': 180}}
+# a pump is allowed to stay off this long before the agitation ramp, which is the longest allowance of any parameter
+PRE_RAMP_ALLOWANCE = 660
+# setpoint and tolerance of every parameter checked by the DeviationDetector, the agitation setpoint follows the ramp
+SETPOINTS = {'Agitation [rpm]': (1000, 10), 'Airflow [mL/s]': (60, 3), 'Temp [C]': (32, 2), 'pH': (7.20, 0.2),
+             'Feed Pump [ml/hr]': (40, 3), 'Base Pump [mL/hr]': (35, 3), 'Antifoam Pump [mL/hr]': (1, 0.5)}
+# minutes a parameter may stay out of its tolerance before it is notified
+ALLOWANCE = 5
+# lowest and highest pH allowed at each agitation setpoint, the high limit leaves room for the pH rise of a starvation
+# before the feed starts and for the feed spikes after the ramp
+PH_LIMITS = {1000: (7.195, 7.27), 1500: (7.195, 7.22)}
+# a notified parameter is counted as fixed once this many logs (not necessarily consecutive) are without the deviation
+FIXED_LOGS = 120
+# the drift charts of DeviationDetector(drift=DRIFT_SPECS), sigma is the standard deviation of the equipment noise
+# around the setpoint. These thresholds gave no false alarm in 30 simulated runs and catch the 0.1 per minute temp and
+# airflow drifts within about 4 minutes instead of the 25 minutes it takes to leave the tolerance for 5 minutes
+DRIFT_SPECS = {'Temp [C]': {'chart': 'cusum', 'sigma': 0.092, 'allowance': 1.0, 'threshold': 5.0},
+               'Airflow [mL/s]': {'chart': 'cusum', 'sigma': 0.173, 'allowance': 1.0, 'threshold': 5.0}}
+
+
+def read_csv(file='dg1.csv'):
     """
-    Reads the contents of the reactor's csv file.
+    Reads the contents of the reactor's csv file. A binary run log (.bin) written next to the csv is read through its
+    memory map instead of being parsed.
 
+    :param file: path of the reactor's csv file or binary run log
+    :type file: str
     :return: a pandas dataframe of the reactor's csv
     """
+    if file.endswith('.bin'):
+        return runlog.to_dataframe(file)
     dtype = {'Timestamp': 'str', 'Agitation [rpm]': 'float', 'Airflow [mL/s]': 'float', 'DO [%]': 'float',
              'Temp [C]': 'float', 'pH': 'float', 'Feed Pump [ml/hr]': 'float', 'Base Pump [mL/hr]': 'float',
              'Antifoam Pump [mL/hr]': 'float'}
-    data = pd.read_csv('dg1.csv', dtype=dtype, parse_dates=['Timestamp'], low_memory=False, na_filter=False)
+    data = pd.read_csv(file, dtype=dtype, parse_dates=['Timestamp'], low_memory=False, na_filter=False)
 
     return data
 
 
+def parse_timestamp(value):
+    """
+    Converts a timestamp string written by the reactor back into a datetime object. The microseconds are left out of
+    the string when they happen to be zero.
+
+    :param value: the timestamp as it is written in the reactor's csv file
+    :type value: str
+    :return: the parsed timestamp
+    :rtype: datetime.datetime
+    """
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
+    except ValueError:
+        return datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+
+class LogTail:
+    """
+    Reads a reactor's csv file incrementally. Each call to read only parses the rows that were appended since the
+    previous call, so the cost of a read does not grow with the length of the run. A partially written last line is
+    left for the next read. If the file is recreated or truncated (a new run was started), the tail starts over from
+    the beginning of the file and restarted is set to True for that read. A new run is recognized by the header and
+    first row of the file, so it is also found when the new file has already grown past the offset of the old one.
+
+    :param file: path of the reactor's csv file
+    :type file: str
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.offset = 0
+        self.header = None
+        self.rows_read = 0
+        self.restarted = False
+        self.stat = None
+        self.head = None
+
+    def changed(self):
+        """
+        Checks if the csv file was written to since the last call, so a poll of a file that has not changed does not
+        open it.
+        :return: True if the size or modification time of the file changed, otherwise False
+        """
+        try:
+            stat = os.stat(self.file)
+        except OSError:
+            return False
+        stat = (stat.st_size, stat.st_mtime_ns)
+        if stat == self.stat:
+            return False
+        self.stat = stat
+        return True
+
+    def read(self):
+        """
+        Parses the rows that were appended to the csv file since the last read.
+
+        :return: each new row as a dictionary of header to value with a datetime.datetime Timestamp and float process
+        values
+        :rtype: list
+        """
+        self.restarted = False
+        try:
+            csvfile = open(self.file, 'rb')
+        except OSError:
+            return []
+        with csvfile:
+            size = os.fstat(csvfile.fileno()).st_size
+            head = csvfile.readline() + csvfile.readline()
+            if size < self.offset or (self.head is not None and head != self.head):
+                self.offset = 0
+                self.header = None
+                self.rows_read = 0
+                self.restarted = True
+                self.head = None
+            if size == self.offset:
+                return []
+            csvfile.seek(self.offset)
+            chunk = csvfile.read(size - self.offset)
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            return []
+        self.offset += end
+        # the header and first row of the run, once both have been read
+        if self.head is None and head.count(b'\n') == 2 and len(head) <= self.offset:
+            self.head = head
+
+        rows = []
+        for fields in csv.reader(chunk[:end].decode().splitlines()):
+            if not fields:
+                continue
+            if self.header is None:
+                self.header = fields
+                continue
+            row = dict(zip(self.header, fields))
+            for label, value in row.items():
+                if label == 'Timestamp':
+                    row[label] = parse_timestamp(value)
+                elif label != '_EFT':
+                    row[label] = float(value)
+            rows.append(row)
+        self.rows_read += len(rows)
+        return rows
+
+
+def run_start(mask):
+    """
+    Finds where the run of True values at the end of a boolean mask began by locating the last False value.
+
+    :param mask: a condition evaluated for every recorded value, the last value is expected to be True
+    :type mask: numpy array of bools
+    :return: index where the trailing run of True values began
+    :rtype: int
+    """
+    breaks = np.flatnonzero(~mask)
+    if breaks.size:
+        return int(breaks[-1]) + 1
+    return 0
+
+
+def run_starts(mask):
+    """
+    Finds, for every value of a boolean mask, where the run of True values it belongs to began. This applies the same
+    backwards search as run_start to every index of a whole run at once, which is used for retrospective analysis. A
+    2D mask (e.g. one row per candidate tolerance) is searched along its last axis.
+
+    :param mask: a condition evaluated for every recorded value
+    :type mask: numpy array of bools
+    :return: the index where the run of each True value began and -1 for every False value
+    :rtype: numpy array of ints
+    """
+    mask = np.asarray(mask, dtype=bool)
+    positions = np.broadcast_to(np.arange(mask.shape[-1]), mask.shape)
+    begins = mask.copy()
+    begins[..., 1:] &= ~mask[..., :-1]
+    starts = np.maximum.accumulate(np.where(begins, positions, -1), axis=-1) if mask.size else positions
+    return np.where(mask, starts, -1)
+
+
 def check_constants(data, setpoint, tolerance):
     """
     Checks if all constant parameters (temp, airflow, and agitation) are within their tolerance range and if not,
@@ -36,17 +204,17 @@ def check_constants(data, setpoint, tolerance):
     :type tolerance: float
     :return: Index where current deviation began occurring, otherwise None
     """
-    if abs(setpoint - data.iat[-1]) > tolerance:
-        for idx in reversed(data.index):
-            if abs(setpoint - data.iat[idx]) > tolerance:
-                continue
-            else:
-                return idx + 1
-    else:
-        return None
+    values = np.asarray(data, dtype=float)
+    out = np.abs(setpoint - values) > tolerance
+    if out[-1]:
+        start = run_start(out)
+        # a deviation that has been occurring since the first value is not reported
+        if start != 0:
+            return start
+    return None
 
 
-def check_pumps(pump, data, setpoint, tolerance):
+def check_pumps(pump, data, setpoint, tolerance, rpm=1000):
     """
     Checks for one out of three different possible pump deviations each time this function is called. These deviations
     include how long a pump has been off, how long a pump has been on, and whether or not the pump flow rate is within
@@ -62,44 +230,26 @@ def check_pumps(pump, data, setpoint, tolerance):
     :param tolerance: a numerical amount the parameter is allowed to deviate from the setpoint before it is accepted to
     be out of the operating range in order to accommodate equipment noise
     :type tolerance: float
+    :param rpm: the current agitation setpoint, which determines how long a pump is allowed to be off
+    :type rpm: int
     :return: index of the Pandas Series where the current sequence began and the number of minutes the current sequence
     is allowed to persist
     :rtype: tuple containing two ints
     """
-    global rpm
-    pump_specs = {'Base Pump [mL/hr]': {'on': 5, 'off': 310}, 'Feed Pump [ml/hr]': {'on': 50, 'off': 310},
-                  'Antifoam Pump [mL/hr]': {'on': 20, 'off': 180}}
+    values = np.asarray(data, dtype=float)
+    off = values == 0
+    if off[-1]:  # checks how long a pump has been inactive
+        start = run_start(off)
+        if start == 0 or rpm == 1000:
+            return start, PRE_RAMP_ALLOWANCE
+        return start, PUMP_SPECS[pump]['off']
 
-    if data.iat[-1] == 0:  # checks how long a pump has been inactive
-        for idx in reversed(data.index):
-            if data.iat[idx] == 0:
-                if idx == 0:
-                    return idx, 660
-                continue
-            else:
-                if rpm == 1000:
-                    return idx + 1, 660
-                elif rpm == 1500:
-                    return idx + 1, pump_specs[pump]['off']
+    out = (np.abs(setpoint - values) > tolerance) & ~off
+    if out[-1]:  # checks how long a pump has been out of the tolerance range
+        return run_start(out), ALLOWANCE
 
-    else:
-        if abs(setpoint - data.iat[-1]) > tolerance:  # checks how long a pump has been out of the tolerance range
-            for idx in reversed(data.index):
-                if abs(setpoint - data.iat[idx]) > tolerance and data.iat[idx] != 0:
-                    if idx == 0:
-                        return idx, 5
-                    continue
-                else:
-                    return idx + 1, 5
-
-        else:  # check how long a pump has been running
-            for idx in reversed(data.index):
-                if data.iat[idx] != 0:
-                    if idx == 0:
-                        return idx, pump_specs[pump]['on']
-                    continue
-                else:
-                    return idx + 1, pump_specs[pump]['on']
+    # check how long a pump has been running
+    return run_start(~off), PUMP_SPECS[pump]['on']
 
 
 def agitation(data):
@@ -120,7 +270,7 @@ def agitation(data):
     return False
 
 
-def check_pH(data, max_ph, min_ph=7.195):
+def check_pH(data, max_ph, min_ph=PH_LIMITS[1000][0]):
     """
     Checks the pH of the reactor and makes sure its within the allowed range of the pH (pH will rise during a
     starvation).
@@ -133,23 +283,21 @@ def check_pH(data, max_ph, min_ph=7.195):
     :type min_ph: float
     :return: Index of the Pandas Series where the deviation first began, otherwise if no deviation is found, None
     """
-    if data.iat[-1] < min_ph:
-        for idx in reversed(data.index):
-            if data.iat[idx] < min_ph:
-                continue
-            else:
-                return idx + 1
-    elif data.iat[-1] > max_ph:
-        for idx in reversed(data.index):
-            if data.iat[idx] > max_ph:
-                continue
-            else:
-                return idx + 1
+    values = np.asarray(data, dtype=float)
+    if values[-1] < min_ph:
+        out = values < min_ph
+    elif values[-1] > max_ph:
+        out = values > max_ph
     else:
         return None
+    start = run_start(out)
+    # a deviation that has been occurring since the first value is not reported
+    if start != 0:
+        return start
+    return None
 
 
-def check_time(timestamps, index, minutes=5):
+def check_time(timestamps, index, minutes=ALLOWANCE):
     """
     This function is used to check the length of time a parameter has been running at its current conditions and whether
     or not it has exceeded the amount of time it is allowed to run at these conditions. In the case of pH, temperature,
@@ -214,62 +362,405 @@ def text_alert(param, time):
         body=f'Deviation with {param} at {time} ')
 
 
-def check_deviations():
+class RunTracker:
+    """
+    Keeps track of the current run of consecutive rows that meet a condition, i.e. the row and timestamp where the
+    condition started being met. This replaces walking the history backwards to find where a sequence began.
     """
-    This is the main function of this module and it splits the Pandas Dataframe into its individual Series and sends
-    each Pandas Series and any necessary arguments to the corresponding helper function. If it is determined necessary
-    to notify the fermentation associate, this calls email_alert and text_alert to do so.
 
-    :return: None
+    def __init__(self):
+        self.active = False
+        self.start_index = None
+        self.start_time = None
+
+    def update(self, condition, index, timestamp):
+        """
+        Extends the current run if the condition is met, starts a new run if it was not met on the previous row, and
+        otherwise ends the run.
+
+        :param condition: whether the newest row meets the condition
+        :type condition: bool
+        :param index: row number of the newest row
+        :type index: int
+        :param timestamp: timestamp of the newest row
+        :type timestamp: datetime.datetime
+        :return: None
+        """
+        if condition:
+            if not self.active:
+                self.active = True
+                self.start_index = index
+                self.start_time = timestamp
+        else:
+            self.active = False
+
+
+class Cusum:
+    """
+    A two-sided CUSUM chart of a parameter. The sums of the standardized deviations from the setpoint beyond the
+    allowance are accumulated in either direction and the chart alarms once one of them reaches the threshold, so a
+    small but persistent shift is caught long before it leaves a fixed tolerance. Each sum is capped at the threshold
+    which keeps the chart alarming while the shift lasts and lets it clear on the first row after the parameter
+    returns to its setpoint. The start of a deviation is where the alarming sum last rose from zero.
+
+    :param sigma: standard deviation of the parameter's equipment noise
+    :type sigma: float
+    :param allowance: shift in sigmas that is not accumulated, about half of the smallest shift worth detecting
+    :type allowance: float
+    :param threshold: sum in sigmas at which the chart alarms
+    :type threshold: float
     """
-    global rpm, notified
-    # the setpoints of each parameter at index 0 along with the tolerated amount it is allowed to deviate
-    setpoints = {'Agitation [rpm]': (rpm, 10), 'Airflow [mL/s]': (60, 3), 'Temp [C]': (32, 2),
-                 'pH': (7.20, 0.2), 'Feed Pump [ml/hr]': (40, 3), 'Base Pump [mL/hr]': (35, 3),
-                 'Antifoam Pump [mL/hr]': (1, 0.5)}
-    data = read_csv()
-
-    for label, content in data.iteritems():
-        notify = None
-        if label in setpoints.keys():
-            deviation_idx = None
-            setpoint, tolerance = setpoints[label]
-
-            if rpm == 1000 and agitation(content):
-                rpm = 1500
-
-            # check temp, airflow and agitation
-            if 'temp' in label.lower() or 'airflow' in label.lower() or 'agitation' in label.lower():
-                deviation_idx = check_constants(content, setpoint, tolerance)
-
-            # check pH
-            elif 'ph' in label.lower():
-                if rpm == 1500:
-                    deviation_idx = check_pH(content, max_ph=7.22)
-                else:
-                    deviation_idx = check_pH(content, max_ph=7.27)
-
-            if deviation_idx is not None or 'pump' in label.lower():
-                # pumps must call check_time function every time new data is logged because there are 3 ways a pump can
-                # deviate that have different time dependencies
-
-                if 'pump' in label.lower():
-                    # print(f'{label}   {check_pumps(label, content, setpoint, tolerance)}')
-                    deviation_idx, time_allowance = check_pumps(label, content, setpoint, tolerance)
-                    notify = check_time(data["Timestamp"], deviation_idx, minutes=time_allowance)
-                else:
-                    notify = check_time(data["Timestamp"], deviation_idx)
-
-                if notify and label not in notified.keys():
-                    notified[label] = 0
-                    # email_alert(label, data["Timestamp"][deviation_idx])  # uncomment to send email alerts
-                    # text_alert(label, data["Timestamp"][deviation_idx])  # uncomment to send text alerts
-                    print(f'{label} deviation at {data["Timestamp"][deviation_idx]}')
-
-            if label in notified.keys() and not notify:
-                notified[label] += 1
-                # if deviation doesn't occur again in the next 120 data logs (120 mins) it is counted as fixed
-                # NOTE: does not have to be a consecutive 120 logs
-                if notified[label] > 120:
-                    del notified[label]
 
+    def __init__(self, sigma, allowance=1.0, threshold=5.0):
+        self.sigma = sigma
+        self.allowance = allowance
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self, target=None):
+        """
+        Clears the sums, e.g. when the setpoint changes.
+        :param target: the new setpoint
+        :type target: float
+        :return: None
+        """
+        self.target = target
+        self.high = 0.0
+        self.low = 0.0
+        self.high_run = RunTracker()
+        self.low_run = RunTracker()
+
+    def update(self, value, target, index, timestamp):
+        """
+        Adds the newest value of the parameter to the chart.
+
+        :param value: the newest value of the parameter
+        :type value: float
+        :param target: the current setpoint of the parameter
+        :type target: float
+        :param index: row number of the newest row
+        :type index: int
+        :param timestamp: timestamp of the newest row
+        :type timestamp: datetime.datetime
+        :return: start time of the drift if the chart alarms, otherwise None
+        """
+        if target != self.target:
+            self.reset(target)
+        deviation = (value - target) / self.sigma
+        self.high = min(max(0.0, self.high + deviation - self.allowance), self.threshold)
+        self.low = min(max(0.0, self.low - deviation - self.allowance), self.threshold)
+        self.high_run.update(self.high > 0, index, timestamp)
+        self.low_run.update(self.low > 0, index, timestamp)
+        if self.high >= self.threshold:
+            return self.high_run.start_time
+        if self.low >= self.threshold:
+            return self.low_run.start_time
+        return None
+
+
+class Ewma:
+    """
+    An EWMA control chart of a parameter. The exponentially weighted moving average of the values alarms once it is
+    further from the setpoint than limit times its own standard deviation, which averages the equipment noise out of a
+    slow drift. The start of a deviation is where the average last crossed the setpoint.
+
+    :param sigma: standard deviation of the parameter's equipment noise
+    :type sigma: float
+    :param weight: weight of the newest value, smaller weights average over more rows
+    :type weight: float
+    :param limit: distance from the setpoint in standard deviations of the average at which the chart alarms
+    :type limit: float
+    """
+
+    def __init__(self, sigma, weight=0.2, limit=4.0):
+        self.sigma = sigma
+        self.weight = weight
+        self.limit = limit
+        self.reset()
+
+    def reset(self, target=None):
+        """
+        Restarts the average at the setpoint, e.g. when the setpoint changes.
+        :param target: the new setpoint
+        :type target: float
+        :return: None
+        """
+        self.target = target
+        self.average = target
+        self.high_run = RunTracker()
+        self.low_run = RunTracker()
+
+    def update(self, value, target, index, timestamp):
+        """
+        Adds the newest value of the parameter to the chart.
+
+        :param value: the newest value of the parameter
+        :type value: float
+        :param target: the current setpoint of the parameter
+        :type target: float
+        :param index: row number of the newest row
+        :type index: int
+        :param timestamp: timestamp of the newest row
+        :type timestamp: datetime.datetime
+        :return: start time of the drift if the chart alarms, otherwise None
+        """
+        if target != self.target:
+            self.reset(target)
+        self.average = self.weight * value + (1 - self.weight) * self.average
+        self.high_run.update(self.average > target, index, timestamp)
+        self.low_run.update(self.average < target, index, timestamp)
+        if abs(self.average - target) > self.limit * self.sigma * math.sqrt(self.weight / (2 - self.weight)):
+            return self.high_run.start_time if self.average > target else self.low_run.start_time
+        return None
+
+
+# the drift charts a spec of DeviationDetector's drift argument can name
+CHARTS = {'cusum': Cusum, 'ewma': Ewma}
+
+
+def load_drift(file):
+    """
+    Reads the drift charts for a DeviationDetector from the command line option of the notifier service or campaign.
+
+    :param file: a json file of label to chart spec, '' for DRIFT_SPECS, or None to not watch drift
+    :type file: str
+    :return: the drift charts of every parameter to watch, or None
+    :rtype: dict
+    """
+    if file is None:
+        return None
+    if not file:
+        return DRIFT_SPECS
+    with open(file) as json_file:
+        specs = json.load(json_file)
+    for label, spec in specs.items():
+        if label not in LABELS or spec.get('chart', 'cusum') not in CHARTS:
+            raise ValueError(f'invalid drift chart for {label}: {spec}')
+    return specs
+
+
+class DeviationDetector:
+    """
+    A streaming version of the checks done by check_constants, check_pumps, check_pH and check_time. The detector is
+    fed one row at a time and keeps the run-length state of every parameter, so each row is checked in constant time
+    and the memory used does not depend on the length of the run. Every parameter gets one RunTracker per condition it
+    can be in (e.g. out of tolerance at 1000 rpm and at 1500 rpm) so a setpoint change after the agitation ramp gives
+    the same start index a full rescan of the history would.
+
+    Optionally, parameters can also be watched by a drift chart (Cusum or Ewma) which alerts on a slow drift before
+    the parameter leaves its tolerance. A drift alert goes through the same notifications as a deviation, with the
+    start time estimated by the chart.
+
+    :param name: name of the reactor being monitored
+    :type name: str
+    :param drift: the chart of every parameter to watch for drift, e.g. DRIFT_SPECS, by default no drift is watched.
+    Each spec names the chart (cusum or ewma) and gives the keyword arguments of its class
+    :type drift: dict of label to dict
+    """
+
+    def __init__(self, name='dg1', drift=None):
+        self.name = name
+        self.rpm = 1000
+        self.notified = {}
+        self.index = -1
+        self.last_agitation = None
+        self.timestamp = None
+
+        self.agitation_runs = {1000: RunTracker(), 1500: RunTracker()}
+        self.constant_runs = {'Airflow [mL/s]': RunTracker(), 'Temp [C]': RunTracker()}
+        self.low_pH = {rpm: RunTracker() for rpm in PH_LIMITS}
+        self.high_pH = {rpm: RunTracker() for rpm in PH_LIMITS}
+        self.pump_runs = {pump: {'off': RunTracker(), 'out': RunTracker(), 'on': RunTracker()} for pump in PUMP_SPECS}
+        self.drift = {}
+        for label, spec in (drift or {}).items():
+            spec = dict(spec)
+            self.drift[label] = CHARTS[spec.pop('chart', 'cusum')](**spec)
+        self.drift_starts = {}
+
+    def update(self, row):
+        """
+        Checks a single new row of reactor data and determines which parameters the fermentation associate needs to
+        be notified about. Notifications follow the same rules as check_deviations: a parameter is only notified once
+        and is counted as fixed after FIXED_LOGS logs without the deviation.
+
+        :param row: the newest row of data keyed by the csv headers with a datetime.datetime Timestamp
+        :type row: dict
+        :return: the failing parameters along with the start time of each deviation
+        :rtype: list of tuples containing the header and a datetime.datetime object
+        """
+        self.index += 1
+        index = self.index
+        timestamp = row['Timestamp']
+        self.timestamp = timestamp
+        # the agitation setpoint is read before a ramp on this row is detected
+        rpm_setpoint = self.rpm
+
+        value = row.get('Agitation [rpm]')
+        if value is not None:
+            tolerance = SETPOINTS['Agitation [rpm]'][1]
+            for rpm, run in self.agitation_runs.items():
+                run.update(abs(rpm - value) > tolerance, index, timestamp)
+            if self.rpm == 1000 and self.last_agitation is not None and abs(value - 1500) < 10 and \
+                    abs(self.last_agitation - value) > 50:
+                self.rpm = 1500
+            self.last_agitation = value
+        for label, run in self.constant_runs.items():
+            if label in row:
+                setpoint, tolerance = SETPOINTS[label]
+                run.update(abs(setpoint - row[label]) > tolerance, index, timestamp)
+        if 'pH' in row:
+            for rpm, (low, high) in PH_LIMITS.items():
+                self.low_pH[rpm].update(row['pH'] < low, index, timestamp)
+                self.high_pH[rpm].update(row['pH'] > high, index, timestamp)
+        for pump, runs in self.pump_runs.items():
+            if pump in row:
+                setpoint, tolerance = SETPOINTS[pump]
+                value = row[pump]
+                runs['off'].update(value == 0, index, timestamp)
+                runs['out'].update(value != 0 and abs(setpoint - value) > tolerance, index, timestamp)
+                runs['on'].update(value != 0, index, timestamp)
+        for label, chart in self.drift.items():
+            if label in row:
+                # the agitation chart follows the ramp detected on this row
+                target = self.rpm if label == 'Agitation [rpm]' else SETPOINTS[label][0]
+                self.drift_starts[label] = chart.update(row[label], target, index, timestamp)
+
+        alerts = []
+        for label in LABELS:
+            if label not in SETPOINTS or label not in row:
+                continue
+            notify = None
+            start = None
+            if label == 'Agitation [rpm]':
+                start = self.deviation_start(self.agitation_runs[rpm_setpoint])
+            elif label in self.constant_runs:
+                start = self.deviation_start(self.constant_runs[label])
+            elif label == 'pH':
+                start = self.deviation_start(self.low_pH[self.rpm]) or self.deviation_start(self.high_pH[self.rpm])
+            else:
+                start, time_allowance = self.pump_state(label)
+                notify = timestamp - start > datetime.timedelta(minutes=time_allowance)
+            if start is not None and notify is None:
+                notify = timestamp - start > datetime.timedelta(minutes=ALLOWANCE)
+            if not notify and self.drift_starts.get(label) is not None:
+                notify = True
+                start = self.drift_starts[label]
+
+            if notify and label not in self.notified:
+                self.notified[label] = 0
+                alerts.append((label, start))
+
+            if label in self.notified and not notify:
+                self.notified[label] += 1
+                # if deviation doesn't occur again in the next FIXED_LOGS data logs it is counted as fixed
+                # NOTE: does not have to be consecutive logs
+                if self.notified[label] > FIXED_LOGS:
+                    del self.notified[label]
+        return alerts
+
+    def deviation_start(self, run):
+        """
+        Finds the start time of a parameter that is currently outside of its allowed range. Like check_constants and
+        check_pH, a deviation that has been occurring since the very first row is not reported.
+
+        :param run: the tracker of the out of range condition
+        :type run: RunTracker
+        :return: start time of the deviation, otherwise None
+        """
+        if run.active and run.start_index != 0:
+            return run.start_time
+        return None
+
+    def pump_state(self, pump):
+        """
+        Determines which of the three pump sequences (off, out of tolerance, or on) the newest row belongs to, in the
+        same way as check_pumps.
+
+        :param pump: The header of a pump as it is written in the reactor's csv file
+        :type pump: str
+        :return: start time of the current sequence and the number of minutes it is allowed to persist
+        :rtype: tuple containing a datetime.datetime object and an int
+        """
+        runs = self.pump_runs[pump]
+        if runs['off'].active:
+            if runs['off'].start_index == 0 or self.rpm == 1000:
+                return runs['off'].start_time, PRE_RAMP_ALLOWANCE
+            return runs['off'].start_time, PUMP_SPECS[pump]['off']
+        elif runs['out'].active:
+            return runs['out'].start_time, ALLOWANCE
+        return runs['on'].start_time, PUMP_SPECS[pump]['on']
+
+
+class ReactorMonitor:
+    """
+    Watches a single reactor by combining a LogTail of its csv file, or a ringbuffer.RingReader of the rows it
+    publishes to shared memory, with the reactor's own DeviationDetector, so any number of reactors can be monitored
+    by one process without sharing state.
+
+    :param file: path of the reactor's csv file, or the name of its ring buffer when a tail is given
+    :type file: str
+    :param name: name of the reactor, by default the file name without its extension
+    :type name: str
+    :param tail: reads the reactor's new rows, by default a LogTail of the csv file
+    :type tail: LogTail or ringbuffer.RingReader
+    :param drift: the drift charts of the detector, see DeviationDetector
+    :type drift: dict of label to dict
+    """
+
+    def __init__(self, file, name=None, tail=None, drift=None):
+        self.file = file
+        self.name = name if name is not None else os.path.splitext(os.path.basename(file))[0]
+        self.tail = tail if tail is not None else LogTail(file)
+        self.drift = drift
+        self.detector = DeviationDetector(self.name, drift)
+
+    def changed(self):
+        """
+        Checks if the reactor logged new rows since the last poll without reading them.
+        :return: True if there may be new rows, otherwise False
+        """
+        return self.tail.changed()
+
+    def poll(self):
+        """
+        Feeds the rows logged since the last poll to the detector. A new detector is created when the csv file was
+        recreated or the ring buffer was created again for a new run.
+
+        :return: the number of rows read and the failing parameters along with the start time of each deviation
+        :rtype: tuple containing an int and a list of tuples
+        """
+        rows = self.tail.read()
+        if self.tail.restarted:
+            self.detector = DeviationDetector(self.name, self.drift)
+
+        alerts = []
+        for row in rows:
+            alerts.extend(self.detector.update(row))
+        return len(rows), alerts
+
+
+# one monitor per csv file that check_deviations has been called with
+monitors = {}
+
+
+def check_deviations(file='dg1.csv', dispatcher=None):
+    """
+    This is the main function of this module. It reads the rows that were logged to the reactor's csv file since the
+    last call and feeds them one at a time to the reactor's DeviationDetector. If it is determined necessary to notify
+    the fermentation associate, the deviation is handed to the dispatcher which sends the email and text alerts in the
+    background.
+
+    :param file: path of the reactor's csv file
+    :type file: str
+    :param dispatcher: sends the email and text alerts, by default the deviations are only printed
+    :type dispatcher: alerts.AlertDispatcher
+    :return: None
+    """
+    if file not in monitors:
+        monitors[file] = ReactorMonitor(file)
+
+    rows, alerts = monitors[file].poll()
+    for label, start in alerts:
+        if dispatcher is not None:
+            dispatcher.submit(monitors[file].name, label, start)
+        print(f'{label} deviation at {start}')
@@ -0,0 +1,427 @@
+import csv
+import datetime
+import time
+import numpy as np
+from bioreactor import DEVIATIONS, HEADERS, NOISE_BANDS, NOISE_BLOCK
+from recipe import DEFAULT
+
+# deviation codes stored in the fleet's deviation arrays, 'up' and 'on' as well as 'down' and 'off' share a code
+NO_DEVIATION = 0
+ON = UP = 1
+OFF = DOWN = 2
+DEVIATION_CODES = {None: NO_DEVIATION, 'on': ON, 'up': UP, 'off': OFF, 'down': DOWN}
+
+
+class ReactorFleet:
+    """
+    Simulates many reactors at once by storing the state of every vessel in NumPy arrays and advancing all of them with
+    masked vectorized updates. Each step follows the same controllers, in the same order, as Reactor.log_data so every
+    vessel follows the same trajectory a Reactor with the same deviations would. All vessels share one simulation
+    clock which is kept as the number of minutes since the start of the run.
+
+    :param names: names of the reactors in the fleet, which are also used for their csv files
+    :type names: list of str
+    :param seed: seed of the first vessel's equipment noise, the following vessels use seed + 1, seed + 2, ... so every
+    vessel logs the same values as a Reactor with the same seed
+    :type seed: int
+    :param recipe: the process timing of the run shared by every vessel, by default the timing of a Reactor
+    :type recipe: recipe.Recipe
+    :param flush_rows: number of logged rows to buffer before they are flushed to the csv files, None to disable
+    :type flush_rows: int
+    :param flush_ms: maximum number of milliseconds logged rows are buffered before being flushed, None to disable
+    :type flush_ms: float
+    """
+
+    def __init__(self, names, seed=None, recipe=None, flush_rows=1, flush_ms=None):
+        self.names = list(names)
+        size = len(self.names)
+        self.pH = np.full(size, 7.20)
+        self.temp = np.full(size, 32.0)
+        self.agitation = np.full(size, 1000.0)
+        self.airflow = np.full(size, 60.0)
+        self.DO = np.full(size, 100.0)
+        self.recipe = recipe if recipe is not None else DEFAULT
+        self.final_eft = self.recipe.final_eft
+        self.eft = 0
+        self.active = False
+        self.start_time = None
+        self.files = [name + '.csv' for name in self.names]
+        self.feed_triggered = np.zeros(size, dtype=bool)
+        self.feeding = np.zeros(size, dtype=bool)
+        self.spiking = np.zeros(size, dtype=bool)
+        self.last_feed = np.full(size, np.nan)  # NaN stands in for a Reactor's last_feed of None
+        self.feed_pump = np.zeros(size)
+        self.base_pump = np.zeros(size)
+        self.antifoam_pump = np.zeros(size)
+
+        # all possible mechanical deviations stored as deviation codes
+        self.antifoam_deviation = np.zeros(size, dtype=np.int8)
+        self.agitation_deviation = np.zeros(size, dtype=np.int8)
+        self.feed_deviation = np.zeros(size, dtype=np.int8)
+        self.base_deviation = np.zeros(size, dtype=np.int8)
+        self.airflow_deviation = np.zeros(size, dtype=np.int8)
+        self.temp_deviation = np.zeros(size, dtype=np.int8)
+
+        # attributes to bring DO back to normal after an agitation or airflow deviation is fixed
+        self.fixed_motor = np.zeros(size)
+        self.fixed_airflow = np.zeros(size)
+
+        # every vessel owns a noise generator seeded like the reactors of a headless run and, like a Reactor, draws its
+        # noise in blocks of NOISE_BLOCK rows, all vessels log together so they share the position in the block
+        self.rngs = [np.random.default_rng(None if seed is None else seed + vessel) for vessel in range(size)]
+        self.noise_block = np.empty((size, 0, len(NOISE_BANDS)))
+        self.noise_index = 0
+
+        # the csv files follow the same flush policy as the csv file of a Reactor
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self.csvfiles = []
+        self.writers = []
+        self.pending_rows = 0
+        self.last_flush = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def start_run(self):
+        """
+        Activates the run and creates the fermentation start time shared by all vessels.
+        :return: None
+        """
+        self.active = True
+        self.start_time = datetime.datetime.now()
+        self.eft = 0
+
+    def end_run(self):
+        """
+        Once the final_eft time has been reached, the run will not be active and the csv files are closed.
+        :return: None
+        """
+        self.active = False
+        self.close()
+
+    def flush(self):
+        """
+        Writes any buffered rows to the csv files of every vessel so they are visible to other readers.
+        :return: None
+        """
+        for csvfile in self.csvfiles:
+            csvfile.flush()
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+
+    def flush_due(self):
+        """
+        Checks the flush policy to see if the buffered rows should be written to the csv files.
+        :return: True if either the row count or the time since the last flush has been exceeded, otherwise False
+        """
+        if self.flush_rows is not None and self.pending_rows >= self.flush_rows:
+            return True
+        if self.flush_ms is not None and (time.monotonic() - self.last_flush) * 1000 >= self.flush_ms:
+            return True
+        return False
+
+    def close(self):
+        """
+        Flushes and closes the csv files of every vessel. Calling this more than once has no effect.
+        :return: None
+        """
+        if self.csvfiles:
+            self.flush()
+        for csvfile in self.csvfiles:
+            csvfile.close()
+        self.csvfiles = []
+        self.writers = []
+
+    def set_deviation(self, vessel, parameter, deviation):
+        """
+        Starts or fixes a mechanical deviation of a single vessel, using the same names as the deviation buttons of
+        the simulatorpyqt module.
+
+        :param vessel: index of the vessel in the fleet
+        :type vessel: int
+        :param parameter: one of 'antifoam', 'agitation', 'feed', 'base', 'airflow' or 'temp'
+        :type parameter: str
+        :param deviation: 'on', 'off', 'up', 'down' or None to fix the deviation
+        :type deviation: str
+        :return: None
+        """
+        if parameter not in DEVIATIONS:
+            raise ValueError(f'Unknown deviation parameter {parameter}')
+        getattr(self, parameter + '_deviation')[vessel] = DEVIATION_CODES[deviation]
+
+    def values(self):
+        """
+        Collects the current process values of every vessel in the same column order as the reactor csv files.
+        :return: an array with one row per vessel and one column per process value
+        :rtype: numpy.ndarray
+        """
+        return np.column_stack((self.agitation, self.airflow, self.DO, self.temp, self.pH, self.feed_pump,
+                                self.base_pump, self.antifoam_pump))
+
+    def next_noise(self):
+        """
+        Hands out the next row of equipment noise of every vessel, generating a new block of NOISE_BLOCK rows for each
+        vessel when the current one has been used up. These are the rows Reactor.next_noise hands out.
+        :return: one uniform value in [-1, 1) for each of the 8 process values of every vessel
+        :rtype: numpy.ndarray
+        """
+        if self.noise_index >= self.noise_block.shape[1]:
+            self.noise_block = np.stack([rng.uniform(-1, 1, size=(NOISE_BLOCK, len(NOISE_BANDS))) for rng in self.rngs])
+            self.noise_index = 0
+        noise = self.noise_block[:, self.noise_index]
+        self.noise_index += 1
+        return noise
+
+    def noisy_values(self):
+        """
+        Adds equipment noise to the current process values using the noise bands of a Reactor, ±0.05% for the pH,
+        ±0.5% for all other parameters and no noise on the pumps.
+        :return: an array with one row per vessel and one column per process value
+        :rtype: numpy.ndarray
+        """
+        values = self.values()
+        values *= 1 + np.array(NOISE_BANDS) * self.next_noise()
+        values[:, :4] = values[:, :4].round(2)
+        values[:, 4] = values[:, 4].round(4)
+        return values
+
+    @staticmethod
+    def csv_row(values):
+        """
+        Converts the process values of one vessel to the values written to its csv file, pump rates are written as
+        whole numbers the same way a Reactor logs them.
+        :param values: the process values of the vessel in the same column order as the reactor csv files
+        :type values: numpy.ndarray
+        :return: the values of the csv row
+        :rtype: list
+        """
+        row = values.tolist()
+        row[5:] = [int(value) if value.is_integer() else value for value in row[5:]]
+        return row
+
+    def create_csv(self):
+        """
+        Creates the csv file of every vessel with column headers and the first row of data values.
+        :return: None
+        """
+        self.close()
+        values = self.values()
+        bands = np.where(np.array(NOISE_BANDS) > 0, 0.0005, 0)  # the first row has ±0.05% noise except on the pumps
+        values *= 1 + bands * self.next_noise()
+        values[:, :5] = values[:, :5].round(2)
+        for file, row in zip(self.files, values):
+            csvfile = open(file, 'w', newline='')
+            writer = csv.writer(csvfile, delimiter=',')
+            writer.writerow(HEADERS)
+            writer.writerow([self.start_time] + self.csv_row(row))
+            self.csvfiles.append(csvfile)
+            self.writers.append(writer)
+        self.flush()
+
+    def log_data(self):
+        """
+        Advances every vessel by one minute and, if the csv files were created, logs a row to each of them. The rows
+        are flushed according to the flush policy.
+        :return: None
+        """
+        if self.step() and self.writers:
+            eft = datetime.timedelta(minutes=self.eft)
+            timestamp = self.start_time + eft
+            for writer, row in zip(self.writers, self.noisy_values()):
+                writer.writerow([timestamp] + self.csv_row(row) + [eft])
+            self.pending_rows += 1
+            if self.flush_due():
+                self.flush()
+
+    def step(self):
+        """
+        Advances the state of every vessel by one minute using the same controllers as Reactor.log_data. When the final
+        EFT has been reached, this will call the end_run method and finish the fermentation run.
+        :return: True if the vessels were advanced, False if the run has finished
+        :rtype: bool
+        """
+        eft = self.eft + 1
+        if eft >= self.final_eft:
+            self.end_run()
+            return False
+
+        self.eft = eft
+        self.initial_DO(eft)
+        self.first_pulse(eft)
+        self.feed_spike(eft)
+        self.feed_controller(eft)
+        self.base_controller()
+        self.motor_controller()
+        self.antifoam_controller(eft)
+        self.airflow_controller()
+        self.temp_controller()
+        return True
+
+    def first_pulse(self, eft):
+        """
+        Vectorized version of Reactor.first_pulse.
+        :param eft: current Elapsed Fermentation Time (EFT) in minutes
+        :type eft: int
+        :return: None
+        """
+        if self.recipe.first_pulse[eft]:
+            pulse = ~self.feeding & ~self.feed_triggered & (self.feed_deviation != ON)
+            self.pH[pulse & (self.pH < 8)] += 0.002
+            self.DO[pulse & (self.DO < 100)] += 0.3
+            self.last_feed[pulse] = eft
+
+    def feed_spike(self, eft):
+        """
+        Vectorized version of Reactor.feed_spike.
+        :param eft: current Elapsed Fermentation Time (EFT) in minutes
+        :type eft: int
+        :return: None
+        """
+        spike = self.spiking & self.feed_triggered & (self.feed_deviation != ON)
+        self.last_feed[spike] = eft
+        self.pH[spike & (self.pH < 8)] += 0.002
+        self.DO[spike & (self.DO < 100)] += 0.3
+
+        interval = self.recipe.spike_interval[eft]
+        if not interval:
+            return
+        start = ~spike & ~np.isnan(self.last_feed)
+        # NaN comparisons are False so vessels that never pulsed are excluded
+        start &= (eft > self.last_feed + interval) | self.spiking
+        self.spiking[start] = True
+        self.last_feed[start] = eft
+
+    def initial_DO(self, eft):
+        """
+        Vectorized version of Reactor.initial_DO.
+        :param eft: current Elapsed Fermentation Time (EFT) in minutes
+        :type eft: int
+        :return: None
+        """
+        baseline = self.recipe.baseline_DO[eft]
+        if not np.isnan(baseline):
+            self.DO[:] = baseline
+
+    def antifoam_controller(self, eft):
+        """
+        Vectorized version of Reactor.antifoam_controller.
+        :param eft: current EFT in minutes
+        :type eft: int
+        :return: None
+        """
+        self.antifoam_pump[self.antifoam_deviation == NO_DEVIATION] = 1 if self.recipe.antifoam[eft] else 0
+
+        on = self.antifoam_deviation == ON
+        self.antifoam_pump[on] = 1
+        self.DO[on & (self.DO > 0)] -= 0.5
+
+        self.antifoam_pump[self.antifoam_deviation == OFF] = 0
+
+    def motor_controller(self):
+        """
+        Vectorized version of Reactor.motor_controller.
+        :return: None
+        """
+        change_DO = 0.3
+        normal = self.agitation_deviation == NO_DEVIATION
+        fixed = normal & (self.fixed_motor != 0) & (self.agitation != 0)
+        self.DO[fixed] -= self.fixed_motor[fixed]
+        self.fixed_motor[fixed] = 0
+        self.agitation[normal] = np.where(self.feed_triggered[normal], 1500, 1000)
+
+        up = self.agitation_deviation == UP
+        self.agitation[up] += 5
+        up &= self.feed_triggered
+        self.DO[up] += change_DO
+        self.fixed_motor[up] += change_DO
+
+        down = (self.agitation_deviation == DOWN) & (self.agitation > 0)
+        self.agitation[down] -= 5
+        down &= self.feed_triggered & (self.DO > 0)
+        self.DO[down] -= change_DO
+        self.fixed_motor[down] -= change_DO
+
+    def temp_controller(self):
+        """
+        Vectorized version of Reactor.temp_controller.
+        :return: None
+        """
+        self.temp[self.temp_deviation == NO_DEVIATION] = 32
+        self.temp[self.temp_deviation == UP] += 0.1
+        self.temp[self.temp_deviation == DOWN] -= 0.1
+
+    def airflow_controller(self):
+        """
+        Vectorized version of Reactor.airflow_controller.
+        :return: None
+        """
+        normal = self.airflow_deviation == NO_DEVIATION
+        self.airflow[normal] = 60
+        fixed = normal & (self.fixed_airflow != 0)
+        self.DO[fixed] -= self.fixed_airflow[fixed]
+        self.fixed_airflow[fixed] = 0
+
+        up = self.airflow_deviation == UP
+        self.airflow[up] += 0.1
+        self.DO[up] += 0.2
+        self.fixed_airflow[up] += 0.2
+
+        down = self.airflow_deviation == DOWN
+        self.airflow[down & (self.airflow > 0)] -= 0.1
+        down &= self.DO > 0
+        self.DO[down] -= 0.2
+        self.fixed_airflow[down] -= 0.2
+
+    def feed_controller(self, eft):
+        """
+        Vectorized version of Reactor.feed_controller. The masks of the first feed and the later feeds are both taken
+        before either is applied since only one of the two branches runs for a Reactor.
+        :param eft: current Elapsed Fermentation Time (EFT) in minutes
+        :type eft: int
+        :return: None
+        """
+        normal = (self.feed_deviation == NO_DEVIATION) & (self.base_deviation != ON)
+        self.feeding[normal & (self.pH < 7.19)] = False
+
+        first = normal & ((self.pH > 7.27) | self.feeding) & ~self.feed_triggered
+        later = normal & ((self.pH > 7.22) | self.feeding) & self.feed_triggered
+        idle = normal & ~first & ~later
+
+        self.pH[first] -= 0.002
+        self.DO[first & (self.DO > 0)] -= 0.4
+        self.feed_triggered[first & (self.pH < 7.20)] = True
+
+        self.pH[later] -= 0.002
+        self.DO[later & (self.DO > 0)] -= self.recipe.DO_uptake[eft]
+
+        feeding = first | later
+        self.feed_pump[feeding] = 40
+        self.feeding[feeding] = True
+        self.spiking[feeding] = False
+        self.feed_pump[idle] = 0
+
+        on = self.feed_deviation == ON
+        self.feed_pump[on] = 45
+        self.DO[on & (self.DO > 0)] -= 0.3
+        self.pH[on & (self.pH > 3)] -= 0.002
+
+        self.feed_pump[self.feed_deviation == OFF] = 0
+
+    def base_controller(self):
+        """
+        Vectorized version of Reactor.base_controller.
+        :return: None
+        """
+        normal = (self.base_deviation == NO_DEVIATION) & (self.feed_deviation != ON)
+        low = normal & (0 < self.pH) & (self.pH < 7.20)
+        self.feeding[low] = False
+        self.pH[low] += 0.001
+        self.base_pump[low] = 35
+        self.base_pump[normal & ~low] = 0
+
+        on = self.base_deviation == ON
+        self.base_pump[on] = 40
+        self.pH[on & (self.pH < 14)] += 0.005
+
+        self.base_pump[self.base_deviation == OFF] = 0
@@ -0,0 +1,561 @@
+import functools
+import importlib
+import json
+import math
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# every timed stage as the module, class (None for a module level function), function and histogram name
+STAGES = [('bioreactor', 'Reactor', 'log_data', 'reactor_log_data'),
+          ('bioreactor', 'Reactor', 'fast_forward', 'reactor_fast_forward'),
+          ('bioreactor', 'Reactor', 'flush', 'reactor_flush')] + \
+         [('bioreactor', 'Reactor', controller, 'reactor_' + controller) for controller in
+          ('initial_DO', 'first_pulse', 'feed_spike', 'feed_controller', 'base_controller', 'motor_controller',
+           'antifoam_controller', 'airflow_controller', 'temp_controller')] + \
+         [('deviation_notifier', None, 'read_csv', 'notifier_read_csv'),
+          ('deviation_notifier', None, 'check_deviations', 'notifier_check_deviations'),
+          ('deviation_notifier', 'LogTail', 'read', 'notifier_tail_read'),
+          ('deviation_notifier', 'DeviationDetector', 'update', 'notifier_detector_update'),
+          ('deviation_notifier', 'ReactorMonitor', 'poll', 'notifier_poll'),
+          ('ringbuffer', 'RingBuffer', 'append', 'ring_append'),
+          ('ringbuffer', 'RingReader', 'read_arrays', 'ring_read'),
+          ('alerts', 'AlertDispatcher', 'deliver', 'alerts_deliver'),
+          ('alerts', 'AlertDispatcher', 'send', 'alerts_send')]
+# counters updated from the result of a timed stage
+COUNTERS = {'reactor_log_data': [('rows_logged', lambda result: result is not None)],
+            'reactor_fast_forward': [('rows_logged', len)],
+            'notifier_detector_update': [('rows_checked', lambda result: 1), ('alerts_raised', len)],
+            'alerts_send': [('alerts_sent', bool), ('alerts_failed', lambda result: not result)]}
+# bounds of the buckets exported to Prometheus in seconds
+EXPORT_BOUNDS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                 5, 10, 30, 60)
+
+
+class Histogram:
+    """
+    A latency histogram in the style of HdrHistogram: every power of two of microseconds is split into SUB_BUCKETS
+    equal buckets, so any percentile is known to within 1 / SUB_BUCKETS of its value from 1 µs up to days, while
+    recording is a constant time increment of one bucket.
+
+    :param name: name of the histogram
+    :type name: str
+    """
+    SUB_BUCKETS = 16
+    EXPONENTS = 48
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * (self.EXPONENTS * self.SUB_BUCKETS + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """
+        Adds a single measurement to the histogram.
+        :param seconds: the measured time
+        :type seconds: float
+        :return: None
+        """
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+        mantissa, exponent = math.frexp(seconds * 1e6)
+        if exponent < 1:
+            index = 0
+        else:
+            index = min((exponent - 1) * self.SUB_BUCKETS + int((mantissa * 2 - 1) * self.SUB_BUCKETS) + 1,
+                        len(self.counts) - 1)
+        self.counts[index] += 1
+
+    def upper_bound(self, index):
+        """
+        :param index: index of a bucket
+        :type index: int
+        :return: the largest value in seconds that is counted in the bucket
+        :rtype: float
+        """
+        if index == 0:
+            return 1e-6
+        exponent, sub_bucket = divmod(index - 1, self.SUB_BUCKETS)
+        return 2 ** exponent * (1 + (sub_bucket + 1) / self.SUB_BUCKETS) * 1e-6
+
+    def percentile(self, percentile):
+        """
+        :param percentile: the percentile between 0 and 100
+        :type percentile: float
+        :return: the value in seconds that the given percent of the measurements do not exceed, None if empty
+        :rtype: float
+        """
+        if not self.count:
+            return None
+        target = max(1, math.ceil(self.count * percentile / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """
+        :param bounds: upper bounds in seconds in increasing order
+        :type bounds: tuple of floats
+        :return: the number of measurements that fall in the buckets up to each bound
+        :rtype: list of ints
+        """
+        counts = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            while index < len(self.counts) and self.upper_bound(index) <= bound:
+                seen += self.counts[index]
+                index += 1
+            counts.append(seen)
+        return counts
+
+    def summary(self):
+        """
+        :return: the count, sum and p50, p90, p99 and max of the measurements in seconds
+        :rtype: dict
+        """
+        return {'count': self.count, 'sum': self.sum, 'p50': self.percentile(50), 'p90': self.percentile(90),
+                'p99': self.percentile(99), 'max': self.max if self.count else None}
+
+
+class Registry:
+    """
+    Holds the histograms and counters of a process. Instruments register their histogram or counter once and update
+    it without any further lookups.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name):
+        """
+        :param name: name of the histogram
+        :type name: str
+        :return: the histogram with the name, which is created the first time it is asked for
+        :rtype: Histogram
+        """
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(name)
+            return self.histograms[name]
+
+    def count(self, name, amount=1):
+        """
+        Increases a counter, which is created the first time it is counted.
+        :param name: name of the counter
+        :type name: str
+        :param amount: amount to increase the counter by
+        :type amount: int
+        :return: None
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        """
+        Removes every histogram and counter.
+        :return: None
+        """
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """
+        :return: the summary of every histogram and the value of every counter
+        :rtype: dict
+        """
+        with self.lock:
+            histograms = list(self.histograms.values())
+            counters = dict(self.counters)
+        return {'histograms': {histogram.name: histogram.summary() for histogram in histograms},
+                'counters': counters}
+
+    def text(self):
+        """
+        :return: a table of the histograms in milliseconds followed by the counters
+        :rtype: str
+        """
+        snapshot = self.snapshot()
+        lines = [f'{"stage":<32}{"count":>9}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}{"total s":>10}']
+        for name, summary in sorted(snapshot['histograms'].items()):
+            if not summary['count']:
+                continue
+            lines.append(f'{name:<32}{summary["count"]:>9}{summary["p50"] * 1000:>10.3f}'
+                         f'{summary["p99"] * 1000:>10.3f}{summary["max"] * 1000:>10.3f}{summary["sum"]:>10.3f}')
+        lines.extend(f'{name:<32}{value:>9}' for name, value in sorted(snapshot['counters'].items()))
+        return '\n'.join(lines)
+
+    def json(self):
+        """
+        :return: the snapshot as json
+        :rtype: str
+        """
+        return json.dumps(self.snapshot(), indent=2)
+
+    def prometheus(self, prefix='bioreactor_'):
+        """
+        :param prefix: prefix of every metric name
+        :type prefix: str
+        :return: every histogram and counter in the Prometheus text exposition format
+        :rtype: str
+        """
+        lines = []
+        with self.lock:
+            histograms = list(self.histograms.values())
+            counters = dict(self.counters)
+        for histogram in sorted(histograms, key=lambda histogram: histogram.name):
+            name = f'{prefix}{histogram.name}_seconds'
+            lines.append(f'# TYPE {name} histogram')
+            for bound, count in zip(EXPORT_BOUNDS, histogram.cumulative(EXPORT_BOUNDS)):
+                lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum {histogram.sum}')
+            lines.append(f'{name}_count {histogram.count}')
+            lines.append(f'# TYPE {name}_max gauge')
+            lines.append(f'{name}_max {histogram.max}')
+        for counter, value in sorted(counters.items()):
+            name = f'{prefix}{counter}_total'
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+# the original function of every instrumented stage, empty while the instrumentation is off
+originals = {}
+# wall time in epoch seconds every row was logged at by (reactor, Timestamp), kept until a detector checks the row
+logged = {}
+# wall time the row that raised each alert was logged at by (reactor, label, start), kept until it is delivered
+alerts_logged = {}
+# the most rows or alerts kept waiting in logged and alerts_logged, the oldest are dropped beyond it (e.g. the rows of
+# a reactor whose detector runs in another process)
+PENDING = 10000
+
+
+def timed(function, name, budget=None):
+    """
+    Wraps a function so every call is recorded in the histogram of its stage along with the counters of the stage.
+
+    :param function: the function to time
+    :type function: function
+    :param name: name of the stage
+    :type name: str
+    :param budget: seconds a call is allowed to take, calls that take longer are counted as overruns of the stage
+    :type budget: float
+    :return: the wrapped function
+    :rtype: function
+    """
+    histogram = REGISTRY.histogram(name)
+    counters = COUNTERS.get(name, [])
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        histogram.record(elapsed)
+        if budget is not None and elapsed > budget:
+            REGISTRY.count(name + '_overruns')
+        for counter, amount in counters:
+            REGISTRY.count(counter, int(amount(result)))
+        return result
+    return wrapper
+
+
+def remember(table, key, value):
+    """
+    Keeps a wall time in one of the tables of pending rows and alerts, dropping the oldest entry once it is full.
+    :return: None
+    """
+    table[key] = value
+    if len(table) > PENDING:
+        del table[next(iter(table))]
+
+
+def track_log(function):
+    """
+    Wraps Reactor.log_data to keep the wall time every row was logged at for the detector that checks it.
+    """
+    @functools.wraps(function)
+    def wrapper(reactor, *args, **kwargs):
+        values = function(reactor, *args, **kwargs)
+        if values is not None:
+            remember(logged, (reactor.name, values[0]), time.time())
+        return values
+    return wrapper
+
+
+def track_fast_forward(function):
+    """
+    Wraps Reactor.fast_forward to keep the wall time the rows logged in bulk were logged at.
+    """
+    @functools.wraps(function)
+    def wrapper(reactor, *args, **kwargs):
+        rows = function(reactor, *args, **kwargs)
+        now = time.time()
+        for values in rows:
+            remember(logged, (reactor.name, values[0]), now)
+        return rows
+    return wrapper
+
+
+def track_update(function):
+    """
+    Wraps DeviationDetector.update to measure how long after its row was logged each alert was raised. The row was
+    logged in this process (see track_log), or published to a ring buffer, whose rows carry their publish time.
+    Rows read from a csv file written by another process have no time they were logged at and are not measured.
+    """
+    histogram = REGISTRY.histogram('alert_detection_latency')
+
+    @functools.wraps(function)
+    def wrapper(detector, row, *args, **kwargs):
+        alerts = function(detector, row, *args, **kwargs)
+        written = logged.pop((detector.name, row.get('Timestamp')), None)
+        if written is None:
+            written = row.get('_published')
+        if alerts and written is not None:
+            now = time.time()
+            for label, start in alerts:
+                histogram.record(max(now - written, 0))
+                remember(alerts_logged, (detector.name, label, start), written)
+        return alerts
+    return wrapper
+
+
+def track_deliver(function):
+    """
+    Wraps AlertDispatcher.deliver to measure how long after their rows were logged the alerts were sent.
+    """
+    histogram = REGISTRY.histogram('alert_end_to_end_latency')
+
+    @functools.wraps(function)
+    def wrapper(dispatcher, batch):
+        result = function(dispatcher, batch)
+        now = time.time()
+        for alert in batch:
+            written = alerts_logged.pop(alert, None)
+            if written is not None:
+                histogram.record(max(now - written, 0))
+        return result
+    return wrapper
+
+
+def replace(owner, attribute, old, new):
+    """
+    Replaces a function on its class, or on its module and every loaded module that imported it by name.
+    """
+    if isinstance(owner, type):
+        setattr(owner, attribute, new)
+        return
+    for module in list(sys.modules.values()):
+        if getattr(module, attribute, None) is old:
+            setattr(module, attribute, new)
+
+
+def modules(name):
+    """
+    Finds the loaded copies of a module, which includes __main__ when the module is run with python -m.
+    :param name: name of the module
+    :type name: str
+    :return: the module, imported if necessary, and __main__ if it is the same module
+    :rtype: list
+    """
+    try:
+        found = [importlib.import_module(name)]
+    except ImportError:
+        return []
+    main = sys.modules.get('__main__')
+    if getattr(getattr(main, '__spec__', None), 'name', None) == name:
+        found.append(main)
+    return found
+
+
+def enable():
+    """
+    Instruments every stage of the modules that can be imported. While the instrumentation is off the original
+    functions are in place, so it costs nothing. Callables that were bound before enable was called (e.g. a QTimer
+    connection) keep calling the original function, so enable should be called at startup.
+    :return: None
+    """
+    if originals:
+        return
+    wrappers = {('bioreactor', 'Reactor', 'log_data'): track_log,
+                ('bioreactor', 'Reactor', 'fast_forward'): track_fast_forward,
+                ('deviation_notifier', 'DeviationDetector', 'update'): track_update,
+                ('alerts', 'AlertDispatcher', 'deliver'): track_deliver}
+    for module_name, class_name, attribute, name in STAGES:
+        for module in modules(module_name):
+            owner = getattr(module, class_name) if class_name else module
+            original = owner.__dict__[attribute] if isinstance(owner, type) else getattr(owner, attribute)
+            if (id(owner), attribute) in originals:
+                continue
+            function = original
+            if (module_name, class_name, attribute) in wrappers:
+                function = wrappers[(module_name, class_name, attribute)](function)
+            replace(owner, attribute, original, timed(function, name))
+            originals[(id(owner), attribute)] = (owner, original)
+
+
+def disable():
+    """
+    Puts the original functions of every instrumented stage back.
+    :return: None
+    """
+    for (_, attribute), (owner, original) in originals.items():
+        current = owner.__dict__[attribute] if isinstance(owner, type) else getattr(owner, attribute)
+        replace(owner, attribute, current, original)
+    originals.clear()
+    logged.clear()
+    alerts_logged.clear()
+
+
+def enabled():
+    """
+    :return: True while the stages are instrumented
+    :rtype: bool
+    """
+    return bool(originals)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the Prometheus text format at /metrics and the json snapshot at /metrics.json.
+    """
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body, content_type = REGISTRY.prometheus(), 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body, content_type = REGISTRY.json(), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        body = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host='127.0.0.1'):
+    """
+    Serves the metrics from a background thread.
+    :param port: port to listen on, 0 picks a free port
+    :type port: int
+    :param host: address to listen on, only local connections by default
+    :type host: str
+    :return: the running server, stopped with its shutdown method
+    :rtype: ThreadingHTTPServer
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+class Reporter:
+    """
+    Writes the metrics every few seconds from a background thread, either as a text table or as json.
+
+    :param interval: seconds between two dumps
+    :type interval: float
+    :param file: path the latest dump is written to, by default it is printed to stderr
+    :type file: str
+    :param fmt: 'text' or 'json'
+    :type fmt: str
+    """
+
+    def __init__(self, interval, file=None, fmt='text'):
+        self.interval = interval
+        self.file = file
+        self.fmt = fmt
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.work, name='metrics-reporter', daemon=True)
+
+    def start(self):
+        """
+        :return: the reporter so it can be created and started in one line
+        :rtype: Reporter
+        """
+        self.thread.start()
+        return self
+
+    def dump(self):
+        """
+        Writes the current metrics once.
+        :return: None
+        """
+        output = REGISTRY.json() if self.fmt == 'json' else REGISTRY.text()
+        if self.file is None:
+            print(output, file=sys.stderr)
+        else:
+            with open(self.file, 'w') as dump_file:
+                dump_file.write(output + '\n')
+
+    def work(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        """
+        Stops the reporter after writing the final metrics.
+        :return: None
+        """
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.dump()
+
+
+def add_arguments(parser):
+    """
+    Adds the metrics options to a command line parser.
+    :param parser: the parser of a command line entry point
+    :type parser: argparse.ArgumentParser
+    :return: None
+    """
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='time every stage and serve the metrics on this local port (/metrics, /metrics.json)')
+    parser.add_argument('--metrics-dump', type=float, default=None,
+                        help='time every stage and print the metrics every this many seconds and at the end')
+    parser.add_argument('--metrics-file', default=None, help='write the dumps to this file instead of stderr')
+    parser.add_argument('--metrics-format', choices=('text', 'json'), default='text', help='format of the dumps')
+
+
+def start(args):
+    """
+    Turns the instrumentation on if the options of add_arguments ask for it.
+    :param args: the parsed command line arguments
+    :type args: argparse.Namespace
+    :return: a function that stops the server and reporter, which writes the final dump
+    :rtype: function
+    """
+    if args.metrics_port is None and args.metrics_dump is None:
+        return lambda: None
+    enable()
+    server = serve(args.metrics_port) if args.metrics_port is not None else None
+    reporter = Reporter(args.metrics_dump, args.metrics_file, args.metrics_format).start() \
+        if args.metrics_dump is not None else None
+
+    def stop():
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        if reporter is not None:
+            reporter.stop()
+    return stop
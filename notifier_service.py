@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+import asyncio
+import argparse
+import glob
+import os
+import time
+import metrics
+from deviation_notifier import ReactorMonitor, load_drift
+from ringbuffer import RingReader, ring_name
+from alerts import AlertDispatcher, EmailChannel, SmsChannel
+
+# prefix of a watched path that names a reactor publishing its rows to shared memory instead of a csv file
+SHARED_MEMORY = 'shm:'
+
+
+def print_alert(reactor, label, start):
+    """
+    Default alert of the notifier service which prints the deviation.
+    :param reactor: name of the reactor
+    :type reactor: str
+    :param label: the failing parameter written as it appears in the reactor's csv file
+    :type label: str
+    :param start: start time of the deviation
+    :type start: datetime.datetime object
+    :return: None
+    """
+    print(f'{reactor}: {label} deviation at {start}')
+
+
+class NotifierService:
+    """
+    Monitors the csv files of a whole fermentation suite from one process. Each reactor gets its own ReactorMonitor
+    and is tailed by its own asyncio task, which polls the size and modification time of the file and only reads the
+    rows appended since the last poll. Directories are rescanned periodically so reactors that start after the service
+    are picked up as well. A path of the form shm:<reactor> follows the reactor's shared memory ring buffer instead of
+    a csv file.
+
+    :param paths: csv files and/or directories containing csv files and/or shm:<reactor> names to watch
+    :type paths: list of str
+    :param interval: seconds between polls of each file
+    :type interval: float
+    :param pattern: glob pattern of the csv files inside a watched directory
+    :type pattern: str
+    :param alert: called with the reactor name, failing parameter and start time of every deviation
+    :type alert: function
+    :param rescan: seconds between scans of the watched directories for new csv files
+    :type rescan: float
+    :param drift: the drift charts of every reactor's detector, see deviation_notifier.DeviationDetector
+    :type drift: dict of label to dict
+    """
+
+    def __init__(self, paths, interval=0.2, pattern='*.csv', alert=print_alert, rescan=5.0, drift=None):
+        self.paths = list(paths)
+        self.interval = interval
+        self.pattern = pattern
+        self.alert = alert
+        self.rescan = rescan
+        self.drift = drift
+        self.monitors = {}
+        self.tasks = {}
+        self.rows = 0
+        self.alerts = 0
+        self.stopped = None
+
+    def discover(self):
+        """
+        Finds the csv files to watch that do not have a monitor yet.
+        :return: the newly found files
+        :rtype: list of str
+        """
+        files = []
+        for path in self.paths:
+            if os.path.isdir(path):
+                files.extend(sorted(glob.glob(os.path.join(path, self.pattern))))
+            else:
+                files.append(path)
+        new_files = [file for file in files if file not in self.monitors]
+        for file in new_files:
+            if file.startswith(SHARED_MEMORY):
+                name = file[len(SHARED_MEMORY):]
+                self.monitors[file] = ReactorMonitor(ring_name(name), name, RingReader(ring_name(name)), self.drift)
+            else:
+                self.monitors[file] = ReactorMonitor(file, drift=self.drift)
+        return new_files
+
+    def poll(self, monitor):
+        """
+        Processes the new rows of a single reactor and sends an alert for every deviation found.
+        :param monitor: the monitor of the reactor
+        :type monitor: ReactorMonitor
+        :return: None
+        """
+        if not monitor.changed():
+            return
+        rows, alerts = monitor.poll()
+        self.rows += rows
+        for label, start in alerts:
+            self.alerts += 1
+            self.alert(monitor.name, label, start)
+
+    async def watch(self, monitor):
+        """
+        Tails a single reactor until the service is stopped.
+        :param monitor: the monitor of the reactor
+        :type monitor: ReactorMonitor
+        :return: None
+        """
+        while not self.stopped.is_set():
+            self.poll(monitor)
+            try:
+                await asyncio.wait_for(self.stopped.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+        # pick up anything written between the last poll and the stop
+        self.poll(monitor)
+
+    async def run(self, duration=None):
+        """
+        Watches every reactor concurrently until stop is called or the duration has passed.
+        :param duration: number of seconds to run for, None to run until stopped
+        :type duration: float
+        :return: None
+        """
+        self.stopped = asyncio.Event()
+        end = None if duration is None else time.monotonic() + duration
+        while not self.stopped.is_set():
+            for file in self.discover():
+                self.tasks[file] = asyncio.ensure_future(self.watch(self.monitors[file]))
+            timeout = self.rescan
+            if end is not None:
+                timeout = min(timeout, end - time.monotonic())
+                if timeout <= 0:
+                    self.stop()
+                    break
+            try:
+                await asyncio.wait_for(self.stopped.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        await asyncio.gather(*self.tasks.values())
+
+    def stop(self):
+        """
+        Stops all the watching tasks after their current poll.
+        :return: None
+        """
+        if self.stopped is not None:
+            self.stopped.set()
+
+
+def main(argv=None):
+    """
+    Command line entry point of the notifier service, e.g. python notifier_service.py reactors/ --interval 0.2
+    :param argv: command line arguments, by default sys.argv
+    :type argv: list
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Monitor reactor csv files for deviations')
+    parser.add_argument('paths', nargs='+',
+                        help='reactor csv files, directories containing them and/or shm:<reactor> ring buffers')
+    parser.add_argument('--interval', type=float, default=0.2, help='seconds between polls of each file')
+    parser.add_argument('--pattern', default='*.csv', help='glob pattern of the csv files in a directory')
+    parser.add_argument('--duration', type=float, default=None, help='seconds to run for (default until stopped)')
+    parser.add_argument('--email', action='store_true', help='send email alerts (password in EMAIL_PASS)')
+    parser.add_argument('--sms', action='store_true', help='send text alerts (PHONE, TWILIO_SID, TWILIO_TOKEN)')
+    parser.add_argument('--drift', nargs='?', const='', default=None, metavar='JSON',
+                        help='also alert on slow drifts with CUSUM/EWMA charts, optionally configured per parameter in '
+                             'a json file (default deviation_notifier.DRIFT_SPECS)')
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    stop_metrics = metrics.start(args)
+
+    channels = []
+    if args.email:
+        channels.append(EmailChannel())
+    if args.sms:
+        channels.append(SmsChannel())
+    dispatcher = AlertDispatcher(channels).start() if channels else None
+
+    def alert(reactor, label, start):
+        print_alert(reactor, label, start)
+        if dispatcher is not None:
+            dispatcher.submit(reactor, label, start)
+
+    service = NotifierService(args.paths, interval=args.interval, pattern=args.pattern, alert=alert,
+                              drift=load_drift(args.drift))
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(service.run(args.duration))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.close()
+        if dispatcher is not None:
+            dispatcher.stop()
+        stop_metrics()
+    print(f'processed {service.rows} rows from {len(service.monitors)} reactor(s), {service.alerts} alert(s)')
+
+
+if __name__ == '__main__':
+    main()
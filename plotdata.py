@@ -0,0 +1,261 @@
+import numpy as np
+from runlog import VALUE_LABELS, from_epoch_ns, to_epoch_ns
+
+# number of buckets of a level of the decimation pyramid combined into one bucket of the next level
+FACTOR = 4
+
+
+class Level:
+    """
+    One level of a Pyramid: the EFT of the first row and the smallest and largest value of every column for each bucket
+    of size rows, in growable arrays like the ColumnCache. The values have a column per process value in the order of
+    VALUE_LABELS so all of them are reduced at once.
+
+    :param size: the number of rows in each bucket
+    :type size: int
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self.eft = np.empty(0)
+        self.low = np.empty((0, len(VALUE_LABELS)))
+        self.high = np.empty((0, len(VALUE_LABELS)))
+
+    def grow(self, size):
+        """
+        Makes sure the arrays have room for at least size buckets by doubling their capacity.
+
+        :param size: the number of buckets the arrays need to hold
+        :type size: int
+        :return: None
+        """
+        capacity = max(len(self.eft), 16)
+        if size <= len(self.eft):
+            return
+        while capacity < size:
+            capacity *= 2
+        self.eft = np.resize(self.eft, capacity)
+        self.low = np.resize(self.low, (capacity, len(VALUE_LABELS)))
+        self.high = np.resize(self.high, (capacity, len(VALUE_LABELS)))
+
+
+class Pyramid:
+    """
+    Min/max decimation pyramid of the columns of a ColumnCache. Level k holds the smallest and largest value of every
+    column for each bucket of FACTOR ** k rows, calculated from the level below it. Drawing the minimum and maximum of
+    each bucket keeps every spike and dip of the raw data visible, so a plot can pick the level with about one bucket
+    per pixel and its drawing cost depends on its width instead of the length of the run. The pyramid is updated
+    incrementally, only the buckets the new rows fall into are calculated again.
+    """
+
+    def __init__(self):
+        self.levels = []
+
+    def clear(self):
+        """
+        Removes every level, e.g. when the cache has been cleared for a new run.
+        :return: None
+        """
+        self.levels = []
+
+    def update(self, cache, start):
+        """
+        Calculates the buckets of every level that contain the rows of the cache from start onwards.
+
+        :param cache: the cache the pyramid belongs to
+        :type cache: ColumnCache
+        :param start: index of the first row that was added
+        :type start: int
+        :return: None
+        """
+        eft, count = cache.eft, cache.count
+        low = high = None
+        depth = 0
+        # a level is added once the level below has more than one bucket's worth of rows
+        while count > FACTOR:
+            if depth == len(self.levels):
+                self.levels.append(Level(FACTOR ** (depth + 1)))
+                start = 0
+            level = self.levels[depth]
+            first = start // FACTOR
+            buckets = -(-count // FACTOR)
+            level.grow(buckets)
+            offsets = np.arange(0, count - first * FACTOR, FACTOR)
+            level.eft[first:buckets] = eft[first * FACTOR:count:FACTOR]
+            if low is None:
+                low = high = np.column_stack([cache.columns[label][first * FACTOR:count] for label in VALUE_LABELS])
+            else:
+                low, high = low[first * FACTOR:count], high[first * FACTOR:count]
+            # fmin and fmax skip the missing values of a column
+            level.low[first:buckets] = np.fmin.reduceat(low, offsets)
+            level.high[first:buckets] = np.fmax.reduceat(high, offsets)
+            eft, low, high, count, start = level.eft, level.low, level.high, buckets, first
+            level.count = buckets
+            depth += 1
+
+    def view(self, cache, label, low=None, high=None, width=1000):
+        """
+        Selects the points to draw of a column between two EFTs for a plot of a given width.
+
+        :param cache: the cache the pyramid belongs to
+        :type cache: ColumnCache
+        :param label: the header of the column as it is written in the reactor's csv file
+        :type label: str
+        :param low: the first EFT in view in hours, None for the start of the run
+        :type low: float
+        :param high: the last EFT in view in hours, None for the end of the run
+        :type high: float
+        :param width: the width of the plot in pixels
+        :type width: int
+        :return: the EFTs and values to draw, the raw rows when there are no more than 2 per pixel, otherwise the
+        minimum and maximum of every bucket of the coarsest level with at least one bucket per pixel
+        :rtype: tuple containing two numpy arrays
+        """
+        eft = cache.eft[:cache.count]
+        first = 0 if low is None else max(int(np.searchsorted(eft, low)) - 1, 0)
+        last = cache.count if high is None else min(int(np.searchsorted(eft, high, 'right')) + 1, cache.count)
+        rows = last - first
+        width = max(int(width), 1)
+        if rows <= 2 * width or not self.levels:
+            return eft[first:last], cache.columns[label][first:last]
+
+        level = self.levels[0]
+        for candidate in self.levels:
+            if rows / candidate.size < width:
+                break
+            level = candidate
+        start, end = first // level.size, min(-(-last // level.size), level.count)
+        x = np.repeat(level.eft[start:end], 2)
+        column = VALUE_LABELS.index(label)
+        y = np.empty(len(x))
+        y[0::2] = level.low[start:end, column]
+        y[1::2] = level.high[start:end, column]
+        return x, y
+
+
+class ColumnCache:
+    """
+    Keeps every column of a reactor's run in growable NumPy arrays for plotting. Rows are appended as they are read
+    from the csv, so the plots never have to go back to the file for rows they have already seen and switching the
+    plotted trend only needs a different column of the cache. The arrays double in size when they are full, which makes
+    appending a row constant time on average.
+
+    :param capacity: number of rows to allocate room for initially
+    :type capacity: int
+    """
+
+    def __init__(self, capacity=1024):
+        self.count = 0
+        self.start_time = None
+        self.eft = np.empty(capacity)
+        self.columns = {label: np.empty(capacity) for label in VALUE_LABELS}
+        self.pyramid = Pyramid()
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        """
+        Removes all rows from the cache, e.g. when a new run has been started.
+        :return: None
+        """
+        self.count = 0
+        self.start_time = None
+        self.pyramid.clear()
+
+    def grow(self, size):
+        """
+        Makes sure the arrays have room for at least size rows by doubling their capacity.
+
+        :param size: the number of rows the arrays need to hold
+        :type size: int
+        :return: None
+        """
+        capacity = len(self.eft)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        eft = np.empty(capacity)
+        eft[:self.count] = self.eft[:self.count]
+        self.eft = eft
+        for label, column in self.columns.items():
+            grown = np.empty(capacity)
+            grown[:self.count] = column[:self.count]
+            self.columns[label] = grown
+
+    def extend(self, rows):
+        """
+        Appends rows read by deviation_notifier.LogTail to the cache. The EFT of each row is calculated in hours from
+        the timestamp of the first row of the run.
+
+        :param rows: rows keyed by the csv headers with a datetime.datetime Timestamp
+        :type rows: list of dicts
+        :return: the number of rows added
+        :rtype: int
+        """
+        if not rows:
+            return 0
+        if self.start_time is None:
+            self.start_time = rows[0]['Timestamp']
+        self.grow(self.count + len(rows))
+        end = self.count + len(rows)
+        self.eft[self.count:end] = [(row['Timestamp'] - self.start_time).total_seconds() / 3600 for row in rows]
+        for label, column in self.columns.items():
+            column[self.count:end] = [row.get(label, np.nan) for row in rows]
+        start, self.count = self.count, end
+        self.pyramid.update(self, start)
+        return len(rows)
+
+    def extend_arrays(self, timestamps, values):
+        """
+        Appends rows read by ringbuffer.RingReader.read_arrays to the cache, copying whole columns at once.
+
+        :param timestamps: the timestamp of each row in epoch nanoseconds
+        :type timestamps: numpy array of int64
+        :param values: the 8 process values of each row in the order of VALUE_LABELS
+        :type values: numpy.ndarray with a row per timestamp
+        :return: the number of rows added
+        :rtype: int
+        """
+        if not len(timestamps):
+            return 0
+        if self.start_time is None:
+            self.start_time = from_epoch_ns(int(timestamps[0]))
+        self.grow(self.count + len(timestamps))
+        end = self.count + len(timestamps)
+        self.eft[self.count:end] = (timestamps - to_epoch_ns(self.start_time)) / 3.6e12
+        for index, column in enumerate(self.columns.values()):
+            column[self.count:end] = values[:, index]
+        start, self.count = self.count, end
+        self.pyramid.update(self, start)
+        return len(timestamps)
+
+    def column(self, label):
+        """
+        Returns the valid rows of a column without copying them.
+
+        :param label: the header of the column as it is written in the reactor's csv file, or 'EFT'
+        :type label: str
+        :return: a view of the column's values
+        :rtype: numpy.ndarray
+        """
+        if label == 'EFT':
+            return self.eft[:self.count]
+        return self.columns[label][:self.count]
+
+
+def find_header(param):
+    """
+    Finds the csv header of a trend button, e.g. 'DO' -> 'DO [%]' and 'Feed' -> 'Feed Pump [ml/hr]'.
+
+    :param param: the text of the trend button
+    :type param: str
+    :return: the first header containing the text, otherwise None
+    :rtype: str
+    """
+    for label in VALUE_LABELS:
+        if param in label:
+            return label
+    return None
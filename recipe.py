@@ -0,0 +1,115 @@
+import copy
+import json
+import math
+import numpy as np
+
+# the process timing of the fed-batch run described in the Reactor docstring, every time is an EFT in minutes
+DEFAULT_RECIPE = {
+    'final_eft': 68 * 60,
+    # the DO follows 100 - e^(EFT in hours - shift) through the lag and growth phases until the end of the phase
+    'lag_phase': {'end': 7 * 60 + 36, 'shift': 3.5},
+    # the first pulse starts after this EFT
+    'first_pulse': 9 * 60,
+    # minutes between feed spikes inside each window, the start and end of a window are excluded
+    'feed_spikes': [{'start': 15 * 60, 'end': 30 * 60, 'interval': 90},
+                    {'start': 30 * 60, 'end': 55 * 60, 'interval': 30},
+                    {'start': 55 * 60, 'end': 66 * 60, 'interval': 120}],
+    # DO used up per minute of feeding once the EFT is past each step
+    'DO_uptake': [{'after': 0, 'rate': 0.5}, {'after': 25 * 60, 'rate': 0.25}, {'after': 45 * 60, 'rate': 0.2},
+                  {'after': 50 * 60, 'rate': 0.1}],
+    # the antifoam pump turns on every few hours for a few minutes, the start and end of every addition are included
+    'antifoam': {'start': 10 * 60, 'end': 68 * 60, 'every': 3 * 60, 'duration': 10},
+}
+
+
+class Recipe:
+    """
+    The process timing of a run compiled into lookup tables indexed by the EFT in whole minutes, so the controllers of
+    a Reactor or ReactorFleet only have to read a single value per minute instead of comparing timedeltas. A recipe
+    only has to give the parts of the timing that differ from DEFAULT_RECIPE.
+
+    :param spec: the process timing in the same layout as DEFAULT_RECIPE
+    :type spec: dict
+    """
+
+    def __init__(self, spec=None):
+        self.spec = copy.deepcopy(DEFAULT_RECIPE)
+        for key, value in (spec or {}).items():
+            if key not in DEFAULT_RECIPE:
+                raise ValueError(f'Unknown recipe entry {key}')
+            if isinstance(value, dict):
+                self.spec[key] = dict(self.spec[key], **value)
+            else:
+                self.spec[key] = value
+        self.compile()
+
+    @classmethod
+    def load(cls, file):
+        """
+        Reads a recipe from a json file, or a yaml file if PyYAML is installed.
+
+        :param file: path of the recipe
+        :type file: str
+        :return: the compiled recipe
+        :rtype: Recipe
+        """
+        with open(file) as recipe_file:
+            if file.endswith(('.yaml', '.yml')):
+                try:
+                    import yaml
+                except ImportError:
+                    raise ImportError('PyYAML is needed to read yaml recipes, use a json recipe instead')
+                return cls(yaml.safe_load(recipe_file))
+            return cls(json.load(recipe_file))
+
+    def compile(self):
+        """
+        Builds the lookup tables of the recipe, each with one entry for every minute from 0 to the final EFT.
+        :return: None
+        """
+        spec = self.spec
+        self.final_eft = int(spec['final_eft'])
+        if self.final_eft <= 0:
+            raise ValueError('The final EFT of a recipe has to be positive')
+        minutes = np.arange(self.final_eft + 1)
+
+        # math.exp rather than numpy so the values are exactly the ones computed per minute before
+        lag = spec['lag_phase']
+        self.baseline_DO = np.full(minutes.size, np.nan)
+        end = min(int(lag['end']), minutes.size)
+        self.baseline_DO[:end] = [-math.exp(eft * 60 / 3600 - lag['shift']) + 100 for eft in range(end)]
+
+        self.first_pulse = minutes > spec['first_pulse']
+
+        self.spike_interval = np.zeros(minutes.size, dtype=int)
+        for window in spec['feed_spikes']:
+            if window['interval'] <= 0:
+                raise ValueError('The interval between feed spikes has to be positive')
+            inside = (window['start'] < minutes) & (minutes < window['end']) & (self.spike_interval == 0)
+            self.spike_interval[inside] = window['interval']
+
+        steps = sorted(spec['DO_uptake'], key=lambda step: step['after'])
+        self.DO_uptake = np.full(minutes.size, float(steps[0]['rate']))
+        for step in steps:
+            self.DO_uptake[minutes > step['after']] = step['rate']
+
+        antifoam = spec['antifoam']
+        if antifoam['every'] <= 0:
+            raise ValueError('The antifoam interval has to be positive')
+        self.antifoam = np.zeros(minutes.size, dtype=bool)
+        for start in range(int(antifoam['start']), int(antifoam['end']), int(antifoam['every'])):
+            self.antifoam[start:start + int(antifoam['duration']) + 1] = True
+
+    def save(self, file):
+        """
+        Writes the full recipe to a json file.
+        :param file: path of the recipe
+        :type file: str
+        :return: None
+        """
+        with open(file, 'w') as recipe_file:
+            json.dump(self.spec, recipe_file, indent=2)
+
+
+# compiled once and shared by every reactor that does not load its own recipe
+DEFAULT = Recipe()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import metrics
+from bioreactor import parse_duration, parse_speed
+from deviation_notifier import ReactorMonitor, parse_timestamp
+from notifier_service import print_alert
+from alerts import AlertDispatcher, EmailChannel, SmsChannel
+
+
+class Replay:
+    """
+    Streams a recorded run back through the live alerting path. The rows of the recorded csv are appended to a new
+    csv file at the pace they were originally logged (or faster), and a ReactorMonitor tails that file exactly like
+    check_deviations and the notifier service do, so the replay exercises the csv tail, the DeviationDetector and the
+    alerts together. The detection latency of a row is the time from it being written to the detector having checked
+    it.
+
+    :param file: path of the recorded csv file
+    :type file: str
+    :param output: path of the csv file the rows are replayed into, which is overwritten
+    :type output: str
+    :param speed: speed-up factor over real time, e.g. 60 replays an hour of the run per minute, None for max
+    :type speed: float
+    :param start: EFT to start the replay at, the rows before it are only used to bring the detector up to date
+    :type start: datetime.timedelta object
+    :param batch: number of rows written at once
+    :type batch: int
+    :param alert: called with the reactor name, failing parameter and start time of every deviation
+    :type alert: function
+    :param name: name of the reactor, by default the recorded file name without its extension
+    :type name: str
+    """
+
+    def __init__(self, file, output, speed=None, start=None, batch=1, alert=print_alert, name=None):
+        if batch < 1:
+            raise ValueError('The batch size has to be at least one row')
+        self.file = file
+        self.output = output
+        self.speed = speed
+        self.start = start
+        self.batch = batch
+        self.alert = alert
+        self.name = name if name is not None else os.path.splitext(os.path.basename(file))[0]
+        self.alerts = []
+        self.latencies = []
+
+    def read(self):
+        """
+        Reads the recorded csv file as raw lines so the replayed file is byte for byte the same as the recording.
+        :return: the header line, and every row as its line and EFT in seconds
+        :rtype: tuple containing a str and a list of tuples
+        """
+        with open(self.file, newline='') as csvfile:
+            header = csvfile.readline()
+            rows = []
+            first = None
+            for line in csvfile:
+                if not line.strip():
+                    continue
+                timestamp = parse_timestamp(line.split(',', 1)[0])
+                first = timestamp if first is None else first
+                rows.append((line, (timestamp - first).total_seconds()))
+        return header, rows
+
+    def run(self):
+        """
+        Replays the recorded run.
+        :return: statistics of the replay, see report
+        :rtype: dict
+        """
+        header, rows = self.read()
+        skip = 0
+        if self.start is not None:
+            start = self.start.total_seconds()
+            skip = next((index for index, (_, eft) in enumerate(rows) if eft >= start), len(rows))
+        self.alerts = []
+        self.latencies = []
+
+        monitor = ReactorMonitor(self.output, self.name)
+        with open(self.output, 'w', newline='') as csvfile:
+            # the rows before the start EFT bring the detector up to date without alerting
+            csvfile.write(header + ''.join(line for line, _ in rows[:skip]))
+            csvfile.flush()
+            monitor.poll()
+
+            began = time.perf_counter()
+            first_eft = rows[skip][1] if skip < len(rows) else 0
+            for index in range(skip, len(rows), self.batch):
+                lines = rows[index:index + self.batch]
+                if self.speed is not None:
+                    due = began + (lines[0][1] - first_eft) / self.speed
+                    ahead = due - time.perf_counter()
+                    if ahead > 0:
+                        time.sleep(ahead)
+                csvfile.write(''.join(line for line, _ in lines))
+                csvfile.flush()
+                written = time.perf_counter()
+                count, alerts = monitor.poll()
+                checked = time.perf_counter()
+                self.latencies.extend([checked - written] * count)
+                for label, deviation_start in alerts:
+                    self.alerts.append((label, deviation_start, lines[-1][1]))
+                    self.alert(self.name, label, deviation_start)
+            seconds = time.perf_counter() - began
+        return self.report(len(rows) - skip, seconds, rows[-1][1] - first_eft if rows else 0)
+
+    def report(self, rows, seconds, simulated):
+        """
+        Summarizes a finished replay.
+
+        :param rows: number of rows replayed after the start EFT
+        :type rows: int
+        :param seconds: wall time of the replay
+        :type seconds: float
+        :param simulated: seconds of the recorded run that were replayed
+        :type simulated: float
+        :return: the number of rows, wall time, rows per second, achieved speed-up, detection latency percentiles in
+        milliseconds and the alerts
+        :rtype: dict
+        """
+        latencies = np.array(self.latencies) * 1000
+        return {'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds if seconds else None,
+                'speed': simulated / seconds if seconds else None,
+                'latency_ms': {f'p{percentile}': float(np.percentile(latencies, percentile)) if latencies.size else None
+                               for percentile in (50, 90, 99, 100)},
+                'alerts': [{'parameter': label, 'start': str(start), 'alert_eft_minutes': eft / 60}
+                           for label, start, eft in self.alerts]}
+
+
+def main(argv=None):
+    """
+    Command line entry point, e.g. python replay.py dg1.csv --speed 60 --start 10h
+    :param argv: command line arguments, by default sys.argv
+    :type argv: list
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Replay a recorded run through the deviation notifier')
+    parser.add_argument('file', help='recorded reactor csv file')
+    parser.add_argument('--speed', type=parse_speed, default=None,
+                        help="'max' or a speed-up factor over real time, e.g. 60 (default max)")
+    parser.add_argument('--start', type=parse_duration, default=None, help='EFT to start at, e.g. 20h (default 0)')
+    parser.add_argument('--batch', type=int, default=1, help='rows written at once (default 1)')
+    parser.add_argument('--output', help='csv file to replay into (default a temporary file)')
+    parser.add_argument('--email', action='store_true', help='send email alerts (password in EMAIL_PASS)')
+    parser.add_argument('--sms', action='store_true', help='send text alerts (PHONE, TWILIO_SID, TWILIO_TOKEN)')
+    parser.add_argument('--json', help='write the statistics and alerts to this file')
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    stop_metrics = metrics.start(args)
+
+    channels = []
+    if args.email:
+        channels.append(EmailChannel())
+    if args.sms:
+        channels.append(SmsChannel())
+    dispatcher = AlertDispatcher(channels).start() if channels else None
+
+    def alert(reactor, label, start):
+        print_alert(reactor, label, start)
+        if dispatcher is not None:
+            dispatcher.submit(reactor, label, start)
+
+    with tempfile.TemporaryDirectory() as directory:
+        output = args.output or os.path.join(directory, os.path.basename(args.file))
+        replay = Replay(args.file, output, args.speed, args.start, args.batch, alert)
+        try:
+            stats = replay.run()
+        finally:
+            if dispatcher is not None:
+                dispatcher.stop()
+            stop_metrics()
+
+    latency = stats['latency_ms']
+    print(f'replayed {stats["rows"]} rows in {stats["seconds"]:.2f} s ({stats["rows_per_second"] or 0:.0f} rows/s, '
+          f'{stats["speed"] or 0:.0f}x real time), {len(stats["alerts"])} alert(s)')
+    if latency['p50'] is not None:
+        print(f'detection latency p50 {latency["p50"]:.2f} ms, p99 {latency["p99"]:.2f} ms, '
+              f'max {latency["p100"]:.2f} ms')
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(stats, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
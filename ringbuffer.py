@@ -0,0 +1,264 @@
+import struct
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+from runlog import VALUE_LABELS, from_epoch_ns, to_epoch_ns
+
+MAGIC = b'BRRING02'
+# magic, capacity, number of rows published, start time in epoch nanoseconds and whether the writer has closed the
+# ring, padded to 64 bytes
+HEADER = struct.Struct('<8sqqqq24x')
+SEQUENCE_OFFSET = 16
+CLOSED_OFFSET = 32
+INT64 = struct.Struct('<q')
+ROW = struct.Struct('<' + 'd' * len(VALUE_LABELS))
+# rows kept in a ring, a little more than a full 68 h run
+CAPACITY = 4096
+# a reactor's ring is named after it so consumers can find it by the reactor name
+PREFIX = 'bioreactor_'
+# names of the rings created by this process, which stay registered with the resource tracker when read here as well
+created = set()
+
+
+def ring_name(reactor):
+    """
+    :param reactor: name of the reactor
+    :type reactor: str
+    :return: the name of the reactor's ring buffer
+    :rtype: str
+    """
+    return PREFIX + reactor
+
+
+def ring_size(capacity):
+    """
+    :param capacity: the number of rows the ring holds
+    :type capacity: int
+    :return: the size in bytes of the shared memory block of a ring, the header followed by an int64 timestamp column,
+    a float64 row of the 8 process values and the int64 wall time in epoch nanoseconds the row was published at for
+    every slot
+    :rtype: int
+    """
+    return HEADER.size + 8 * capacity + 8 * len(VALUE_LABELS) * capacity + 8 * capacity
+
+
+def map_ring(buffer, capacity):
+    """
+    Creates the views of the sequence counter, closed flag, timestamps, values and publish times on a ring's shared
+    memory.
+    :return: the five views
+    :rtype: tuple
+    """
+    sequence = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=SEQUENCE_OFFSET)
+    closed = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=CLOSED_OFFSET)
+    timestamps = np.ndarray((capacity,), dtype=np.int64, buffer=buffer, offset=HEADER.size)
+    values = np.ndarray((capacity, len(VALUE_LABELS)), dtype=np.float64, buffer=buffer,
+                        offset=HEADER.size + 8 * capacity)
+    published = np.ndarray((capacity,), dtype=np.int64, buffer=buffer,
+                           offset=HEADER.size + 8 * capacity + ROW.size * capacity)
+    return sequence, closed, timestamps, values, published
+
+
+class RingBuffer:
+    """
+    Publishes a reactor's rows to other processes through a block of shared memory. Each row is written into the next
+    slot of a fixed size ring along with the wall time it was published at, and the sequence counter in the header,
+    the total number of rows published, is only increased after the row has been written. Readers keep their own
+    position, so any number of them can follow the ring without the writer waiting on them, and a reader that falls
+    more than the capacity behind knows exactly how many rows it has lost.
+
+    :param name: name of the shared memory block
+    :type name: str
+    :param capacity: number of rows kept in the ring
+    :type capacity: int
+    """
+
+    def __init__(self, name, capacity=CAPACITY):
+        self.name = name
+        self.capacity = capacity
+        self.shm = None
+        self.sequence = 0
+
+    def create(self, start_time):
+        """
+        Creates the shared memory block, replacing a block with the same name that was left behind.
+
+        :param start_time: the fermentation start time
+        :type start_time: datetime.datetime object
+        :return: None
+        """
+        self.close()
+        try:
+            stale = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            pass
+        else:
+            stale.close()
+            stale.unlink()
+        self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=ring_size(self.capacity))
+        created.add(self.name)
+        self.shm.buf[:HEADER.size] = HEADER.pack(MAGIC, self.capacity, 0, to_epoch_ns(start_time), 0)
+        self.sequence_view, self.closed_view, self.timestamps, self.values, self.published = map_ring(self.shm.buf,
+                                                                                                      self.capacity)
+        self.sequence = 0
+
+    def append(self, timestamp, values):
+        """
+        Publishes a single row.
+
+        :param timestamp: the timestamp of the row
+        :type timestamp: datetime.datetime object
+        :param values: the 8 process values in the same order as the csv headers
+        :type values: list
+        :return: None
+        """
+        # packing into the buffer directly is several times faster than assigning to the numpy views for a single row
+        slot = self.sequence % self.capacity
+        INT64.pack_into(self.shm.buf, HEADER.size + 8 * slot, to_epoch_ns(timestamp))
+        ROW.pack_into(self.shm.buf, HEADER.size + 8 * self.capacity + ROW.size * slot, *values)
+        INT64.pack_into(self.shm.buf, HEADER.size + (8 + ROW.size) * self.capacity + 8 * slot, time.time_ns())
+        self.sequence += 1
+        INT64.pack_into(self.shm.buf, SEQUENCE_OFFSET, self.sequence)
+
+    def close(self):
+        """
+        Marks the ring as closed so readers know no more rows will come, and removes the shared memory block. Readers
+        that are attached keep their mapping until they detach. Calling this more than once has no effect.
+        :return: None
+        """
+        if self.shm is not None:
+            self.closed_view[0] = 1
+            del self.sequence_view, self.closed_view, self.timestamps, self.values, self.published
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+            created.discard(self.name)
+
+
+class RingReader:
+    """
+    Follows the rows a RingBuffer publishes, from the same or another process. It has the same read method and
+    restarted attribute as deviation_notifier.LogTail, so it can take the place of the csv tail of a ReactorMonitor or
+    the GUI. The reader attaches once the writer has created the ring, and when the writer closes the ring and a new
+    run creates it again, the reader moves on to the new ring with restarted set to True for that read.
+
+    :param name: name of the shared memory block
+    :type name: str
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.shm = None
+        self.capacity = 0
+        self.next = 0
+        self.lost = 0
+        self.rows_read = 0
+        self.restarted = False
+        self.publish_times = np.empty(0, dtype=np.int64)
+
+    def attach(self):
+        """
+        Maps the ring with the reader's name if the writer has created it.
+        :return: True if a ring was attached, otherwise False
+        :rtype: bool
+        """
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return False
+        # the block belongs to the writer, which removes it; without this the reader's exit would remove it as well
+        if self.name not in created:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        magic, capacity, _, start_ns, _ = HEADER.unpack(bytes(shm.buf[:HEADER.size]))
+        if magic != MAGIC:
+            shm.close()
+            raise ValueError(f'{self.name} is not a reactor ring buffer')
+        self.detach()
+        self.shm = shm
+        self.capacity = capacity
+        self.start_ns = start_ns
+        self.sequence_view, self.closed_view, self.timestamps, self.values, self.published = map_ring(shm.buf,
+                                                                                                      capacity)
+        self.next = 0
+        return True
+
+    def detach(self):
+        """
+        Releases the mapping of the ring.
+        :return: None
+        """
+        if self.shm is not None:
+            del self.sequence_view, self.closed_view, self.timestamps, self.values, self.published
+            self.shm.close()
+            self.shm = None
+
+    def changed(self):
+        """
+        :return: True if rows were published since the last read or the ring needs to be attached, otherwise False
+        """
+        return self.shm is None or bool(self.closed_view[0]) or int(self.sequence_view[0]) != self.next
+
+    def read_arrays(self):
+        """
+        Reads the rows published since the last read. Rows that were overwritten before they could be read are
+        counted in lost. As the writer fills the slot of the oldest row before it publishes the next one, only the
+        newest capacity - 1 rows can be read safely. The returned arrays are views of the shared memory when the new
+        rows do not wrap around the end of the ring, which stay valid until the writer has published another
+        capacity - 1 rows. The wall times the rows were published at are kept in publish_times.
+
+        :return: the timestamps in epoch nanoseconds and the 8 process values of each new row
+        :rtype: tuple containing two numpy arrays
+        """
+        self.restarted = False
+        if self.shm is None:
+            if not self.attach():
+                self.publish_times = np.empty(0, dtype=np.int64)
+                return np.empty(0, dtype=np.int64), np.empty((0, len(VALUE_LABELS)))
+        elif self.closed_view[0] and self.next >= self.sequence_view[0]:
+            # the run ended, move on once the reactor has created the ring for a new run
+            previous = self.shm
+            if self.attach():
+                self.restarted = previous is not self.shm
+
+        sequence = int(self.sequence_view[0])
+        # the slot of the row a full ring behind is the one the writer fills next
+        if sequence - self.next > self.capacity - 1:
+            self.lost += sequence - self.capacity + 1 - self.next
+            self.next = sequence - self.capacity + 1
+        first, last = self.next % self.capacity, sequence % self.capacity
+        if sequence == self.next:
+            timestamps, values, published = self.timestamps[:0], self.values[:0], self.published[:0]
+        elif first < last:
+            timestamps, values = self.timestamps[first:last], self.values[first:last]
+            published = self.published[first:last]
+        else:
+            timestamps = np.concatenate((self.timestamps[first:], self.timestamps[:last]))
+            values = np.concatenate((self.values[first:], self.values[:last]))
+            published = np.concatenate((self.published[first:], self.published[:last]))
+
+        # rows the writer started overwriting while they were read are dropped, including the row in the slot it is
+        # filling now
+        overwritten = int(self.sequence_view[0]) - self.capacity + 1 - self.next
+        if overwritten > 0:
+            self.lost += overwritten
+            timestamps, values, published = timestamps[overwritten:], values[overwritten:], published[overwritten:]
+        self.publish_times = published
+        self.next = sequence
+        self.rows_read += len(timestamps)
+        return timestamps, values
+
+    def read(self):
+        """
+        Reads the rows published since the last read in the same form as deviation_notifier.LogTail.
+        :return: each new row as a dictionary of header to value with a datetime.datetime Timestamp, and the wall time
+        in epoch seconds it was published at as _published
+        :rtype: list
+        """
+        timestamps, values = self.read_arrays()
+        rows = []
+        for timestamp, row, published in zip(timestamps.tolist(), values.tolist(), self.publish_times.tolist()):
+            row = dict(zip(VALUE_LABELS, row))
+            row['Timestamp'] = from_epoch_ns(timestamp)
+            row['_published'] = published / 1e9
+            rows.append(row)
+        return rows
@@ -0,0 +1,246 @@
+import csv
+import datetime
+import struct
+import numpy as np
+
+MAGIC = b'BRLOG001'
+# magic, capacity, number of valid rows and start time in epoch nanoseconds, padded to 64 bytes
+HEADER = struct.Struct('<8sqqq32x')
+COUNT_OFFSET = 16
+# the headers of the 8 process values in the order a reactor logs them, the csv adds the Timestamp before and the EFT
+# after them
+VALUE_LABELS = ('Agitation [rpm]', 'Airflow [mL/s]', 'DO [%]', 'Temp [C]', 'pH', 'Feed Pump [ml/hr]',
+                'Base Pump [mL/hr]', 'Antifoam Pump [mL/hr]')
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_epoch_ns(timestamp):
+    """
+    Converts a timestamp into nanoseconds since the epoch without applying a timezone, so naive timestamps convert
+    back exactly.
+
+    :param timestamp: the timestamp to convert
+    :type timestamp: datetime.datetime object
+    :return: nanoseconds since 1970-01-01 00:00:00
+    :rtype: int
+    """
+    return (timestamp - EPOCH) // datetime.timedelta(microseconds=1) * 1000
+
+
+def from_epoch_ns(nanoseconds):
+    """
+    Converts nanoseconds since the epoch back into a timestamp.
+
+    :param nanoseconds: nanoseconds since 1970-01-01 00:00:00
+    :type nanoseconds: int
+    :return: the timestamp
+    :rtype: datetime.datetime object
+    """
+    return EPOCH + datetime.timedelta(microseconds=int(nanoseconds) // 1000)
+
+
+def column_offsets(capacity):
+    """
+    Calculates the byte offset of every column in a binary run log. The timestamps are stored as int64 epoch
+    nanoseconds followed by the EFT in minutes and the 8 process values as float32, each column preallocated for the
+    capacity of the log.
+
+    :param capacity: the maximum number of rows in the log
+    :type capacity: int
+    :return: the offset of each column and the total size of the file in bytes
+    :rtype: tuple containing a dict and an int
+    """
+    offsets = {'Timestamp': HEADER.size, 'EFT': HEADER.size + 8 * capacity}
+    offset = offsets['EFT'] + 4 * capacity
+    for label in VALUE_LABELS:
+        offsets[label] = offset
+        offset += 4 * capacity
+    return offsets, offset
+
+
+class BinaryRunLog:
+    """
+    Writes a reactor run to a fixed width binary file next to the Dasgip style csv. The file is a header followed by
+    preallocated columns, so every row is written in place through a memory map and readers can map the valid prefix
+    of each column with read_run_log without parsing any text. The number of valid rows in the header is updated after
+    the values of a row are written.
+
+    :param file: path of the binary log
+    :type file: str
+    :param capacity: the maximum number of rows in the log
+    :type capacity: int
+    """
+
+    def __init__(self, file, capacity):
+        self.file = file
+        self.capacity = capacity
+        self.count = 0
+        self.start_ns = None
+        self.mmap = None
+        self.columns = {}
+        self.count_view = None
+
+    def create(self, start_time):
+        """
+        Creates the file with its header and preallocated columns.
+
+        :param start_time: the fermentation start time
+        :type start_time: datetime.datetime object
+        :return: None
+        """
+        self.close()
+        offsets, size = column_offsets(self.capacity)
+        self.mmap = np.memmap(self.file, dtype=np.uint8, mode='w+', shape=(size,))
+        self.start_ns = to_epoch_ns(start_time)
+        self.mmap[:HEADER.size] = np.frombuffer(HEADER.pack(MAGIC, self.capacity, 0, self.start_ns), dtype=np.uint8)
+        self.map_columns(offsets)
+        self.count = 0
+
+    def open(self, count):
+        """
+        Maps an existing log to continue writing it after its first rows, e.g. when a reactor is restored from a
+        checkpoint. Any rows after them are dropped.
+
+        :param count: number of rows of the log to keep
+        :type count: int
+        :return: None
+        """
+        self.close()
+        with open(self.file, 'rb') as binary_file:
+            magic, capacity, rows, start_ns = HEADER.unpack(binary_file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f'{self.file} is not a binary run log')
+        if count > rows:
+            raise ValueError(f'{self.file} only has {rows} rows')
+        self.capacity = capacity
+        offsets, size = column_offsets(capacity)
+        self.mmap = np.memmap(self.file, dtype=np.uint8, mode='r+', shape=(size,))
+        self.start_ns = start_ns
+        self.map_columns(offsets)
+        self.count = count
+        self.count_view[0] = count
+
+    def map_columns(self, offsets):
+        """
+        Creates the views of the row count and every column on the memory map.
+        :param offsets: the byte offset of every column
+        :type offsets: dict
+        :return: None
+        """
+        self.count_view = self.mmap[COUNT_OFFSET:COUNT_OFFSET + 8].view(np.int64)
+        self.columns['Timestamp'] = self.mmap[offsets['Timestamp']:offsets['EFT']].view(np.int64)
+        self.columns['EFT'] = self.mmap[offsets['EFT']:offsets['EFT'] + 4 * self.capacity].view(np.float32)
+        for label in VALUE_LABELS:
+            self.columns[label] = self.mmap[offsets[label]:offsets[label] + 4 * self.capacity].view(np.float32)
+
+    def append(self, timestamp, values):
+        """
+        Writes a single row to the log.
+
+        :param timestamp: the timestamp of the row
+        :type timestamp: datetime.datetime object
+        :param values: the 8 process values in the same order as the csv headers
+        :type values: list
+        :return: None
+        """
+        if self.count >= self.capacity:
+            raise ValueError(f'{self.file} is full, it was created for {self.capacity} rows')
+        nanoseconds = to_epoch_ns(timestamp)
+        self.columns['Timestamp'][self.count] = nanoseconds
+        self.columns['EFT'][self.count] = (nanoseconds - self.start_ns) / 60e9
+        for label, value in zip(VALUE_LABELS, values):
+            self.columns[label][self.count] = value
+        self.count += 1
+        self.count_view[0] = self.count
+
+    def flush(self):
+        """
+        Writes the memory mapped pages back to the file.
+        :return: None
+        """
+        if self.mmap is not None:
+            self.mmap.flush()
+
+    def close(self):
+        """
+        Flushes and releases the memory map. Calling this more than once has no effect.
+        :return: None
+        """
+        if self.mmap is not None:
+            self.flush()
+            self.mmap = None
+            self.columns = {}
+            self.count_view = None
+
+
+def read_run_log(file):
+    """
+    Memory maps the valid rows of a binary run log. The columns are read-only views of the file, so nothing is copied
+    or parsed and a reader can call this again to pick up rows written since.
+
+    :param file: path of the binary log
+    :type file: str
+    :return: the start time of the run and a dictionary of column name to NumPy array for the Timestamp (epoch ns), EFT
+    (minutes) and each process value
+    :rtype: tuple containing a datetime.datetime object and a dict
+    """
+    with open(file, 'rb') as binary_file:
+        magic, capacity, count, start_ns = HEADER.unpack(binary_file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f'{file} is not a binary run log')
+
+    offsets, size = column_offsets(capacity)
+    mmap = np.memmap(file, dtype=np.uint8, mode='r', shape=(size,))
+    columns = {'Timestamp': mmap[offsets['Timestamp']:offsets['Timestamp'] + 8 * count].view(np.int64),
+               'EFT': mmap[offsets['EFT']:offsets['EFT'] + 4 * count].view(np.float32)}
+    for label in VALUE_LABELS:
+        columns[label] = mmap[offsets[label]:offsets[label] + 4 * count].view(np.float32)
+    return from_epoch_ns(start_ns), columns
+
+
+def export_csv(file, csv_file):
+    """
+    Exports a binary run log to the same csv format written by Reactor.create_csv and Reactor.log_data.
+
+    :param file: path of the binary log
+    :type file: str
+    :param csv_file: path of the csv file to write
+    :type csv_file: str
+    :return: None
+    """
+    start_time, columns = read_run_log(file)
+    with open(csv_file, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=',')
+        writer.writerow(['Timestamp'] + list(VALUE_LABELS) + ['_EFT'])
+        values = np.column_stack([columns[label] for label in VALUE_LABELS]).tolist()
+        for row, (nanoseconds, minutes, row_values) in enumerate(zip(columns['Timestamp'], columns['EFT'], values)):
+            line = [from_epoch_ns(nanoseconds)]
+            for label, value in zip(VALUE_LABELS, row_values):
+                if 'Pump' in label and value.is_integer():
+                    line.append(int(value))
+                else:
+                    line.append(round(value, 4 if label == 'pH' else 2))
+            if row:  # the first row of a run has no EFT
+                line.append(datetime.timedelta(minutes=round(float(minutes))))
+            writer.writerow(line)
+
+
+def to_dataframe(file):
+    """
+    Reads a binary run log into a Pandas DataFrame with the same columns and types as deviation_notifier.read_csv,
+    including the _EFT strings of the csv.
+
+    :param file: path of the binary log
+    :type file: str
+    :return: a pandas dataframe of the reactor's run
+    """
+    import pandas as pd
+
+    start_time, columns = read_run_log(file)
+    data = {'Timestamp': pd.to_datetime(np.asarray(columns['Timestamp']), unit='ns')}
+    for label in VALUE_LABELS:
+        data[label] = np.asarray(columns[label], dtype=float)
+    # the first row of a run has no EFT
+    data['_EFT'] = [str(datetime.timedelta(minutes=round(float(minutes)))) if row else ''
+                    for row, minutes in enumerate(columns['EFT'])]
+    return pd.DataFrame(data)
@@ -3,22 +3,176 @@
 import pyqtgraph as pg
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
-import pandas as pd
-import numpy as np
+import collections
+import os
+import queue
 import sys
 from functools import partial
-from bioreactor import Reactor
-from deviation_notifier import check_deviations
+import metrics
+from bioreactor import HEADERS, Reactor
+from deviation_notifier import DeviationDetector
+from plotdata import ColumnCache, find_header
+from ringbuffer import RingReader
 
 
 class CustomPlot(pg.PlotWidget):
     """
-    A class that extends the PlotWidget to record what reactor trend is being plotted.
+    A class that extends the PlotWidget to record what reactor trend is being plotted. The trend is drawn by a single
+    persistent PlotDataItem whose data is replaced when new rows arrive instead of rebuilding the plot. The points are
+    taken from the cache's min/max decimation pyramid at the level that matches the width of the plot and the EFT range
+    in view, and are selected again on every zoom or pan, so drawing a long run costs about the same as a short one.
     """
 
     def __init__(self, param, *args, **kwargs):
         super(CustomPlot, self).__init__(*args, **kwargs)
         self.current_param = param
+        self.curve = self.plot()
+        self.cache = None
+        self.sigRangeChanged.connect(self.redraw)
+
+    def show_trend(self, cache):
+        """
+        Draws the current trend from the cached columns of the reactor.
+        :param cache: the columns of the reactor's run
+        :type cache: ColumnCache
+        :return: None
+        """
+        self.cache = cache
+        self.redraw()
+
+    def redraw(self, *args):
+        """
+        Draws the points of the current trend for the EFT range in view, the whole run while the plot follows the data.
+        :return: None
+        """
+        header = find_header(self.current_param)
+        if self.cache is None or header is None:
+            return
+        view_box = self.getViewBox()
+        low = high = None
+        if not view_box.autoRangeEnabled()[0]:
+            low, high = view_box.viewRange()[0]
+        self.curve.setData(*self.cache.pyramid.view(self.cache, header, low, high, view_box.width()))
+
+
+class SimulationWorker(QObject):
+    """
+    Runs the reactor and its deviation detector on their own thread so a slow tick or alert never freezes the buttons
+    and plots. The GUI thread only talks to the worker through the command queue, which is drained at the start of
+    every tick, and the rows the worker logs are collected in a buffer the GUI drains once per frame. Deviations found
+    by the detector are printed and emitted with the deviation signal.
+
+    :param reactor: the reactor to simulate, its run is started by the worker
+    :type reactor: bioreactor.Reactor
+    :param interval: milliseconds between logged rows
+    :type interval: int
+    :param buffer_rows: whether to collect the logged rows for the GUI, which is not needed when it reads them from
+    the reactor's ring buffer
+    :type buffer_rows: bool
+    :param dispatcher: sends the email and text alerts, by default the deviations are only printed
+    :type dispatcher: alerts.AlertDispatcher
+    """
+    deviation = pyqtSignal(str, object)
+
+    def __init__(self, reactor, interval=20, buffer_rows=True, dispatcher=None):
+        super(SimulationWorker, self).__init__()
+        self.reactor = reactor
+        self.interval = interval
+        self.dispatcher = dispatcher
+        self.detector = DeviationDetector(reactor.name)
+        self.commands = queue.Queue()
+        self.rows = collections.deque() if buffer_rows else None
+        self.timer = None
+
+    def submit(self, attribute, value):
+        """
+        Queues a change of one of the reactor's attributes, e.g. a deviation, from any thread. It is applied before the
+        next row is logged.
+
+        :param attribute: name of the reactor attribute, e.g. temp_deviation
+        :type attribute: str
+        :param value: the new value
+        :return: None
+        """
+        self.commands.put((attribute, value))
+
+    def drain(self):
+        """
+        Takes the rows logged since the last call out of the buffer.
+        :return: the rows keyed by the csv headers
+        :rtype: list of dicts
+        """
+        rows = []
+        while self.rows:
+            rows.append(self.rows.popleft())
+        return rows
+
+    def begin(self):
+        """
+        Starts the reactor's run and checks its first row.
+        :return: None
+        """
+        self.reactor.start_run()
+        self.check(self.reactor.create_csv())
+
+    @pyqtSlot()
+    def start(self):
+        """
+        Starts the run and the timer logging its rows. Called on the worker's thread so the timer belongs to it.
+        :return: None
+        """
+        self.begin()
+        tick = self.tick
+        if metrics.enabled():
+            tick = metrics.timed(tick, 'gui_tick', budget=self.interval / 1000)
+        self.timer = QTimer()
+        self.timer.timeout.connect(tick)
+        self.timer.start(self.interval)
+
+    @pyqtSlot()
+    def stop(self):
+        """
+        Stops logging and closes the reactor's logs.
+        :return: None
+        """
+        if self.timer is not None:
+            self.timer.stop()
+        self.reactor.close()
+
+    def tick(self):
+        """
+        Applies the queued commands, logs a new row of data and checks it for deviations.
+        :return: None
+        """
+        while True:
+            try:
+                attribute, value = self.commands.get_nowait()
+            except queue.Empty:
+                break
+            setattr(self.reactor, attribute, value)
+
+        values = self.reactor.log_data()
+        if values is None:
+            if self.timer is not None:
+                self.timer.stop()
+            return
+        self.check(values)
+
+    def check(self, values):
+        """
+        Passes a logged row to the GUI and the deviation detector.
+        :param values: the row in the same order as the csv headers
+        :type values: list
+        :return: None
+        """
+        row = dict(zip(HEADERS, values))
+        if self.rows is not None:
+            self.rows.append(row)
+        for label, start in self.detector.update(row):
+            print(f'{label} deviation at {start}')
+            if self.dispatcher is not None:
+                self.dispatcher.submit(self.reactor.name, label, start)
+            self.deviation.emit(label, start)
 
 
 class BioreactorSimulator(QMainWindow):
@@ -27,12 +181,21 @@ class BioreactorSimulator(QMainWindow):
     switched by clicking buttons of a different trend which will alternate between switching the top and bottom plot
     with the corresponding parameter of the clicked button. This GUI can also introduce mechanical deviations to the
     reactor upon user input via button clicks.
+
+    By default the window simulates its own reactor. Given the worker of a reactor that is already running, e.g. the
+    detailed view of a dashboard tile, it shows that reactor from the cache the worker's rows are collected in instead.
+
+    :param worker: the worker of a running reactor, by default a new reactor and worker are created
+    :type worker: SimulationWorker
+    :param cache: the cached columns of the running reactor, which are kept up to date by the owner of the worker
+    :type cache: ColumnCache
     """
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, worker=None, cache=None, **kwargs):
         super(BioreactorSimulator, self).__init__(*args, **kwargs)
 
         self.change_top_graph = True
-        self.setWindowTitle('Bioreactor Simulator')
+        title = 'Bioreactor Simulator'
+        self.setWindowTitle(title if worker is None else f'{title} - {worker.reactor.name}')
         layout = QGridLayout()
         self.top_plot = CustomPlot(param='DO', labels={'left': 'DO', 'bottom': 'EFT'})
         self.bottom_plot = CustomPlot(param='pH', labels={'left': 'pH', 'bottom': 'EFT'})
@@ -62,24 +225,78 @@ class BioreactorSimulator(QMainWindow):
         self.setCentralWidget(main)
         self.show()
 
-        # create a reactor object
-        self.reactor = Reactor(name='dg1')
-        self.reactor.start_run()
-        self.reactor.create_csv()
         self.headers = ('Agitation [rpm]', 'Airflow [mL/s]', 'DO [%]', 'Temp [C]', 'pH', 'Feed Pump [ml/hr]',
                         'Base Pump [mL/hr]', 'Antifoam Pump [mL/hr]')
+        self.drawn = 0
+        if worker is not None:
+            # the reactor is already running and its owner keeps the cache up to date
+            self.shared_memory = False
+            self.reactor = worker.reactor
+            self.tail = None
+            self.cache = cache
+            self.worker = worker
+            self.worker_thread = None
+            self.worker.deviation.connect(self.show_deviation)
+            for button in self.all_deviation_btns:
+                parameter, deviation = button.text().lower().split()
+                if getattr(self.reactor, parameter + '_deviation') == deviation:
+                    for btn in self.all_deviation_btns:
+                        btn.setEnabled(btn is button)
+        else:
+            # create a reactor object
+            # with BIOREACTOR_SHARED_MEMORY set the reactor publishes its rows to shared memory and the graphs read
+            # them from there, so other processes can follow the same run without reading the csv file
+            self.shared_memory = bool(os.environ.get('BIOREACTOR_SHARED_MEMORY'))
+            self.reactor = Reactor(name='dg1', shared_memory=self.shared_memory)
+            # only the rows added since the last refresh are taken from the worker (or ring buffer) and kept in the
+            # cache for every trend
+            self.tail = RingReader(self.reactor.ring_name) if self.shared_memory else None
+            self.cache = ColumnCache()
 
-        # create reoccurring event to log new data in the csv
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.reactor.log_data)
-        self.timer.timeout.connect(check_deviations)
-        self.timer.start(20)  # change int to desired speed
+            # the reactor logs new data on its own thread, change int to desired speed
+            self.worker = SimulationWorker(self.reactor, interval=20, buffer_rows=not self.shared_memory)
+            self.worker.deviation.connect(self.show_deviation)
+            self.worker_thread = QThread()
+            self.worker.moveToThread(self.worker_thread)
+            self.worker_thread.started.connect(self.worker.start)
+            self.worker_thread.start()
+
+        update_graph = self.update_graph
+        if metrics.enabled():
+            update_graph = metrics.timed(update_graph, 'gui_update_graph', budget=0.1)
 
         # create reoccurring event to update graph
         self.graph_timer = QTimer()
-        self.graph_timer.timeout.connect(self.update_graph)
+        self.graph_timer.timeout.connect(update_graph)
         self.graph_timer.start(100)  # change int to desired speed
 
+    def closeEvent(self, event):
+        """
+        Stops the worker and waits for its thread to finish before the window closes. A worker the window was given
+        keeps running.
+        :param event: a QCloseEvent object
+        :return: None
+        """
+        self.graph_timer.stop()
+        if self.worker_thread is not None:
+            QMetaObject.invokeMethod(self.worker, 'stop', Qt.BlockingQueuedConnection)
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+        else:
+            self.worker.deviation.disconnect(self.show_deviation)
+        super(BioreactorSimulator, self).closeEvent(event)
+
+    def show_deviation(self, label, start):
+        """
+        Shows a deviation found by the worker in the status bar.
+        :param label: the failing parameter
+        :type label: str
+        :param start: start time of the deviation
+        :type start: datetime.datetime object
+        :return: None
+        """
+        self.statusBar().showMessage(f'{label} deviation at {start}')
+
     def trend_click(self, instance):
         """
         On-click event for trend button instances which alternates between switching the top and bottom graph to
@@ -93,12 +310,14 @@ class BioreactorSimulator(QMainWindow):
             for header in self.headers:
                 if self.top_plot.current_param in header:
                     self.top_plot.setLabel(axis='left', text=header)
+            self.top_plot.show_trend(self.cache)
         else:
             self.bottom_plot.current_param = instance.text()
             self.change_top_graph = True
             for header in self.headers:
                 if self.bottom_plot.current_param in header:
                     self.bottom_plot.setLabel(axis='left', text=header)
+            self.bottom_plot.show_trend(self.cache)
 
     def deviation_click(self, instance):
         """
@@ -114,18 +333,8 @@ class BioreactorSimulator(QMainWindow):
         for button in self.all_deviation_btns:
             if not button.isEnabled():  # a deviation is already occurring so turn it off
 
-                if parameter == 'antifoam':
-                    self.reactor.antifoam_deviation = None
-                elif parameter == 'agitation':
-                    self.reactor.agitation_deviation = None
-                elif parameter == 'feed':
-                    self.reactor.feed_deviation = None
-                elif parameter == 'base':
-                    self.reactor.base_deviation = None
-                elif parameter == 'airflow':
-                    self.reactor.airflow_deviation = None
-                elif parameter == 'temp':
-                    self.reactor.temp_deviation = None
+                # the worker applies the change before its next row so the reactor is only touched by its thread
+                self.worker.submit(parameter + '_deviation', None)
 
                 for btn in self.all_deviation_btns:
                     if instance is not button:
@@ -137,50 +346,36 @@ class BioreactorSimulator(QMainWindow):
                 if instance is not btn:
                     btn.setEnabled(False)
 
-            if parameter == 'antifoam':
-                self.reactor.antifoam_deviation = deviation
-            elif parameter == 'agitation':
-                self.reactor.agitation_deviation = deviation
-            elif parameter == 'feed':
-                self.reactor.feed_deviation = deviation
-            elif parameter == 'base':
-                self.reactor.base_deviation = deviation
-            elif parameter == 'airflow':
-                self.reactor.airflow_deviation = deviation
-            elif parameter == 'temp':
-                self.reactor.temp_deviation = deviation
+            self.worker.submit(parameter + '_deviation', deviation)
 
     def update_graph(self):
         """
-        Uses the Pandas library to read the reactor's csv file and updates both the top and bottom graph of the main
-        widget.
+        Takes the rows the worker logged (or the ring buffer received) since the last refresh, appends them to the
+        cached columns and updates the data of both the top and bottom graph of the main widget.
         :return:None
         """
-        parameters = []
-        dtype = {'Timestamp': 'str'}
-        for header in self.headers:
-            if self.top_plot.current_param in header or self.bottom_plot.current_param in header:
-                parameters.append(header)
-                dtype[header] = 'float'
-        data = pd.read_csv(self.reactor.file,
-                           dtype=dtype,
-                           parse_dates=['Timestamp'], usecols=['Timestamp'] + parameters, low_memory=False,
-                           na_filter=False)
-        start_time = data['Timestamp'][0]
-        data.insert(loc=2, column='EFT', value=(data['Timestamp'] - start_time) / np.timedelta64(1, 'h'))
-
-        for label, content in data.iteritems():
-            if label == 'Timestamp' or label == 'EFT':
-                continue
-            elif self.top_plot.current_param in label:
-                self.top_plot.clear()
-                self.top_plot.plot(data['EFT'], content)
-            else:
-                self.bottom_plot.clear()
-                self.bottom_plot.plot(data['EFT'], content)
+        restarted = False
+        if self.shared_memory:
+            timestamps, values = self.tail.read_arrays()
+            restarted = self.tail.restarted
+            if restarted:
+                self.cache.clear()
+            added = self.cache.extend_arrays(timestamps, values)
+        elif self.worker_thread is None:
+            added = self.cache.count != self.drawn
+        else:
+            added = self.cache.extend(self.worker.drain())
+        self.drawn = self.cache.count
+        if added or restarted:
+            self.top_plot.show_trend(self.cache)
+            self.bottom_plot.show_trend(self.cache)
 
 
 if __name__ == '__main__':
+    # set BIOREACTOR_METRICS_PORT to time every stage of the tick and serve the metrics on that local port
+    if os.environ.get('BIOREACTOR_METRICS_PORT'):
+        metrics.enable()
+        metrics.serve(int(os.environ['BIOREACTOR_METRICS_PORT']))
     app = QApplication(sys.argv)
     ex = BioreactorSimulator()
     sys.exit(app.exec_())
@@ -0,0 +1,120 @@
+import unittest
+import datetime
+import socketserver
+import threading
+import time
+from alerts import AlertDispatcher, EmailChannel
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    A local SMTP stand-in that accepts every message and records it on the server.
+    """
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode().rstrip('\r\n')
+                    if data == '.':
+                        break
+                    lines.append(data)
+                self.server.messages.append('\n'.join(lines))
+                self.reply('250 ok')
+                if self.server.drop_after_message:
+                    return
+            else:
+                self.reply('250 ok')
+
+
+class TestAlertDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPHandler)
+        self.server.daemon_threads = True
+        self.server.messages = []
+        self.server.connections = 0
+        self.server.drop_after_message = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.channel = EmailChannel(host='127.0.0.1', port=self.server.server_address[1], sender='test@localhost',
+                                    password='', starttls=False, timeout=2)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_coalesce_and_reuse(self):
+        start = datetime.datetime(2019, 11, 7, 12, 0)
+        dispatcher = AlertDispatcher([self.channel], coalesce=0.2).start()
+        dispatcher.submit('dg1', 'Temp [C]', start)
+        dispatcher.submit('dg1', 'pH', start)
+        dispatcher.submit('dg2', 'Feed Pump [ml/hr]', start)
+        dispatcher.stop(timeout=5)
+
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertIn('dg1: Deviation with Temp [C] at 2019-11-07 12:00:00', self.server.messages[0])
+        self.assertIn('dg2: Deviation with Feed Pump [ml/hr]', self.server.messages[0])
+
+        # later messages go over the same session instead of logging in again
+        dispatcher = AlertDispatcher([self.channel], coalesce=0).start()
+        for count, label in enumerate(('Temp [C]', 'pH'), start=2):
+            dispatcher.submit('dg1', label, start)
+            deadline = time.monotonic() + 5
+            while len(self.server.messages) < count and time.monotonic() < deadline:
+                time.sleep(0.01)
+        dispatcher.stop(timeout=5)
+        self.assertEqual((len(self.server.messages), self.server.connections), (3, 2))
+
+    def test_reconnect(self):
+        self.server.drop_after_message = True
+        dispatcher = AlertDispatcher([self.channel], coalesce=0, backoff=0.01).start()
+        for count, label in enumerate(('Temp [C]', 'pH', 'Airflow [mL/s]'), start=1):
+            dispatcher.submit('dg1', label, datetime.datetime(2019, 11, 7, 12, 0))
+            deadline = time.monotonic() + 5
+            while len(self.server.messages) < count and time.monotonic() < deadline:
+                time.sleep(0.01)
+        dispatcher.stop(timeout=5)
+
+        # the server closes the session after every message so each one needs a new connection
+        self.assertEqual((len(self.server.messages), dispatcher.sent, dispatcher.failed), (3, 3, 0))
+        self.assertEqual(self.server.connections, 3)
+
+    def test_retry(self):
+        class FlakyChannel:
+            name = 'flaky'
+
+            def __init__(self):
+                self.attempts = 0
+
+            def send(self, subject, body):
+                self.attempts += 1
+                if self.attempts < 3:
+                    raise ConnectionError('not yet')
+
+            def close(self):
+                pass
+
+        channel = FlakyChannel()
+        dispatcher = AlertDispatcher([channel], coalesce=0, retries=3, backoff=0.01).start()
+        dispatcher.submit('dg1', 'pH', datetime.datetime(2019, 11, 7, 12, 0))
+        dispatcher.stop(timeout=5)
+
+        self.assertEqual((channel.attempts, dispatcher.sent, dispatcher.failed), (3, 1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import datetime
+import os
+import tempfile
+import numpy as np
+from archive import Archive, decode_column, encode_column
+from bioreactor import Reactor
+from deviation_notifier import read_csv
+from runlog import VALUE_LABELS
+
+# the recording shipped with the repo, which spells its feed column 'Feed pump [ml/hr]'
+RECORDING = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dg1.csv')
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = Archive(os.path.join(self.tmp.name, 'archive'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def log(self, name, minutes, deviation_at=None):
+        reactor = Reactor(name=name, seed=1)
+        reactor.file = os.path.join(self.tmp.name, reactor.file)
+        reactor.start_run()
+        reactor.create_csv()
+        for minute in range(1, minutes + 1):
+            if minute == deviation_at:
+                reactor.temp_deviation = 'up'
+            reactor.log_data()
+        reactor.close()
+        return reactor.file
+
+    def test_round_trip(self):
+        file = self.log('dg1', 600)
+        entry = self.archive.add(file)
+        self.assertEqual(entry['rows'], 601)
+
+        # a new Archive reads the index back from disk
+        result, = Archive(self.archive.directory).query(list(VALUE_LABELS))
+        data = read_csv(file)
+        self.assertTrue(np.array_equal(result['Timestamp'], data['Timestamp'].to_numpy('datetime64[ns]')))
+        for label in VALUE_LABELS:
+            self.assertTrue(np.array_equal(result[label], data[label].to_numpy(dtype=float)), label)
+        self.assertEqual(result['EFT'][-1], 10)
+
+    def test_range_query(self):
+        self.archive.add(self.log('dg1', 600))
+        self.archive.add(self.log('dg2', 600))
+        self.archive.add(self.log('dg3', 600))
+        results = self.archive.query(['pH'], ['dg1', 'dg3'], (datetime.timedelta(hours=2), datetime.timedelta(hours=4)))
+        self.assertEqual([result['reactor'] for result in results], ['dg1', 'dg3'])
+        for result in results:
+            self.assertEqual(len(result['pH']), 121)
+            self.assertEqual((result['EFT'][0], result['EFT'][-1]), (2, 4))
+            self.assertEqual(set(result), {'reactor', 'run', 'start', 'Timestamp', 'EFT', 'pH'})
+        # only the hourly chunks 2, 3 and 4 of each run were read
+        self.assertEqual(self.archive.chunks_read, 6)
+
+    def test_value_filter(self):
+        self.archive.add(self.log('dg1', 600, deviation_at=400))
+        self.archive.add(self.log('dg2', 600))
+        result, = self.archive.query(['pH'], values={'Temp [C]': (34, None)})
+        self.assertEqual(result['reactor'], 'dg1')
+        self.assertGreaterEqual(result['EFT'][0], 400 / 60)
+        # the run without a deviation and the chunks before it were skipped by their maximum
+        self.assertEqual(self.archive.chunks_read, 4)
+
+    def test_recording(self):
+        entry = self.archive.add(RECORDING)
+        self.assertEqual((entry['rows'], entry['missing']), (2569, []))
+        result, = self.archive.query(['Feed Pump [ml/hr]', 'pH'], values={'Feed Pump [ml/hr]': (1, None)})
+        data = read_csv(RECORDING)
+        feeding = data[data['Feed pump [ml/hr]'] >= 1]
+        self.assertTrue(np.array_equal(result['Feed Pump [ml/hr]'], feeding['Feed pump [ml/hr]'].to_numpy(dtype=float)))
+        self.assertTrue(np.array_equal(result['pH'], feeding['pH'].to_numpy(dtype=float)))
+
+    def test_missing_column(self):
+        file = self.log('dg1', 120)
+        data = read_csv(file).drop(columns=['Antifoam Pump [mL/hr]'])
+        data.to_csv(file, index=False)
+        entry = self.archive.add(file)
+        self.assertEqual(entry['missing'], ['Antifoam Pump [mL/hr]'])
+        result, = self.archive.query(['pH', 'Antifoam Pump [mL/hr]'])
+        self.assertEqual(len(result['pH']), 121)
+        self.assertTrue(np.all(np.isnan(result['Antifoam Pump [mL/hr]'])))
+        # a run without a column never matches a filter on it
+        self.assertEqual(self.archive.query(['pH'], values={'Antifoam Pump [mL/hr]': (None, None)}), [])
+
+    def test_encoding(self):
+        for values in (np.array([32.01, 31.98, 32.0, 0.0]), np.array([7.2013, 7.1999]), np.array([0.1 + 0.2, 1 / 3]),
+                       np.array([1_600_000_000_000_000_000, 1_600_000_060_000_000_000], dtype=np.int64)):
+            self.assertTrue(np.array_equal(decode_column(*encode_column(values)), values))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from bioreactor import Reactor
+from deviation_notifier import DeviationDetector, LogTail, read_csv
+from batch_report import alert_rows, deviation_episodes, analyze, main
+
+# the recording shipped with the repo, which spells its feed column 'Feed pump [ml/hr]'
+RECORDING = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dg1.csv')
+
+
+class TestBatchReport(unittest.TestCase):
+
+    def test_alert_rows(self):
+        notify = np.zeros(400, dtype=bool)
+        notify[10:20] = True
+        notify[100:110] = True  # within 120 logs of the first alert so it is not notified again
+        notify[300:310] = True
+
+        self.assertEqual(alert_rows(notify), [10, 300])
+
+    def test_temp_episode(self):
+        start = datetime.datetime(2019, 11, 7, 12, 0)
+        temp = np.full(30, 32.0)
+        temp[10:14] = 35  # too short to alert
+        temp[20:] = 35
+        data = pd.DataFrame({'Timestamp': [start + datetime.timedelta(minutes=minute) for minute in range(30)],
+                             'Temp [C]': temp})
+
+        episodes = deviation_episodes(data)
+        self.assertEqual([(episode['start'], episode['duration [min]'], episode['alerted']) for episode in episodes],
+                         [(start + datetime.timedelta(minutes=10), 3, False),
+                          (start + datetime.timedelta(minutes=20), 9, True)])
+        self.assertEqual(episodes[1]['alert time'], start + datetime.timedelta(minutes=26))
+
+    def test_matches_detector(self):
+        with tempfile.TemporaryDirectory() as directory:
+            reactor = Reactor(name='dg1', flush_rows=4096, seed=3)
+            reactor.file = os.path.join(directory, reactor.file)
+            reactor.start_run()
+            reactor.create_csv()
+            for minute in range(1, 2000):
+                if minute == 400:
+                    reactor.temp_deviation = 'up'
+                elif minute == 900:
+                    reactor.temp_deviation = None
+                    reactor.base_deviation = 'off'
+                reactor.log_data()
+            reactor.close()
+
+            detector = DeviationDetector(reactor.name)
+            expected = [alert for row in LogTail(reactor.file).read() for alert in detector.update(row)]
+            episodes = deviation_episodes(read_csv(reactor.file), reactor.name)
+            [(file, rows, file_episodes, error, missing)] = analyze([reactor.file])
+
+        self.assertEqual(sorted((episode['parameter'], episode['start']) for episode in episodes
+                                if episode['alerted']), sorted(expected))
+        self.assertIn('Temp [C]', [label for label, start in expected])
+        self.assertEqual((rows, len(file_episodes), error, missing), (2000, len(episodes), None, []))
+
+    def test_missing_columns(self):
+        # the feed pump of the recording is checked in spite of the case of its header
+        [(file, rows, episodes, error, missing)] = analyze([RECORDING])
+        self.assertEqual((rows, error, missing), (2569, None, []))
+        self.assertIn('Feed Pump [ml/hr]', [episode['parameter'] for episode in episodes])
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'dg1.csv')
+            read_csv(RECORDING).drop(columns=['Feed pump [ml/hr]']).to_csv(file, index=False)
+            [(_, rows, reduced, error, missing)] = analyze([file])
+            self.assertEqual(missing, ['Feed Pump [ml/hr]'])
+            self.assertEqual([episode for episode in episodes if episode['parameter'] != 'Feed Pump [ml/hr]'],
+                             [dict(episode, file=RECORDING) for episode in reduced])
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                main([file])
+            self.assertIn(f'{file} has no Feed Pump [ml/hr] column, which was not checked', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import tempfile
+import benchmarks
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_compare(self):
+        baseline = {'log_data@1h': 1e-5, 'check_pH': 2e-5, 'removed': 1e-5}
+        results = {'log_data@1h': 1.2e-5, 'check_pH': 3e-5, 'added': 1.0}
+        self.assertEqual(list(benchmarks.compare(results, baseline, 0.25)), ['check_pH'])
+        self.assertEqual(benchmarks.compare(results, baseline, 0.6), {})
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'results.json')
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(benchmarks.main(['--repeat', '1', '--json', file]), 0)
+            with open(file) as json_file:
+                stored = json.load(json_file)
+            self.assertIn('log_data@68h', stored['results'])
+
+            # a baseline a thousand times faster than this run is a regression of every benchmark
+            stored['results'] = {name: seconds / 1000 for name, seconds in stored['results'].items()}
+            baseline = os.path.join(directory, 'baseline.json')
+            with open(baseline, 'w') as json_file:
+                json.dump(stored, json_file)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(benchmarks.main(['--repeat', '1', '--baseline', baseline]), 1)
+            self.assertIn('REGRESSION log_data@68h', output.getvalue())
+
+    def test_repeat(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                benchmarks.main(['--repeat', str(benchmarks.MAX_REPEAT + 1)])
+            with self.assertRaises(SystemExit):
+                benchmarks.main(['--repeat', '0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
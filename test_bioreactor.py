@@ -0,0 +1,179 @@
+import unittest
+import contextlib
+import csv
+import filecmp
+import io
+import os
+import pickle
+import tempfile
+import time
+from bioreactor import Reactor, main, run_headless
+from runlog import export_csv
+
+
+def read_values(file):
+    """
+    Reads the process values of a reactor csv without the timestamps, which depend on when the run was started.
+    """
+    with open(file, newline='') as csvfile:
+        return [row[1:9] for row in csv.reader(csvfile)]
+
+
+class TestReactor(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def run_reactor(self, name, minutes, seed):
+        reactor = Reactor(name=name, seed=seed)
+        reactor.start_run()
+        reactor.create_csv()
+        for minute in range(minutes):
+            if minute == 700:
+                reactor.feed_deviation = 'on'
+            reactor.log_data()
+        reactor.close()
+        return read_values(reactor.file)
+
+    def test_flush_policy(self):
+        def lines_on_disk():
+            with open('dg1.csv') as csvfile:
+                return len(csvfile.readlines())
+
+        # rows reach the file once flush_rows of them are buffered
+        reactor = Reactor(name='dg1', flush_rows=5, seed=1)
+        reactor.start_run()
+        reactor.create_csv()
+        written = lines_on_disk()
+        for _ in range(4):
+            reactor.log_data()
+        self.assertEqual(lines_on_disk(), written)
+        reactor.log_data()
+        self.assertEqual(lines_on_disk(), written + 5)
+        # and on close
+        reactor.log_data()
+        reactor.close()
+        self.assertEqual(lines_on_disk(), written + 6)
+
+        # or once flush_ms have passed since the last flush
+        reactor = Reactor(name='dg1', flush_rows=None, flush_ms=500, seed=1)
+        reactor.start_run()
+        reactor.create_csv()
+        written = lines_on_disk()
+        reactor.log_data()
+        self.assertEqual(lines_on_disk(), written)
+        time.sleep(0.55)
+        reactor.log_data()
+        self.assertEqual(lines_on_disk(), written + 2)
+        reactor.close()
+
+    def test_seeded_replay(self):
+        # runs longer than one block of noise with the same seed are identical
+        first = self.run_reactor('dg1', 1500, seed=7)
+        self.assertEqual(first, self.run_reactor('dg2', 1500, seed=7))
+        self.assertNotEqual(first, self.run_reactor('dg3', 1500, seed=8))
+
+    def test_noise_bands(self):
+        values = self.run_reactor('dg1', 600, seed=1)[2:]
+        for row in values:
+            agitation, airflow, DO, temp, _, feed, base, antifoam = row
+            self.assertLessEqual(abs(float(agitation) - 1000), 5.01)
+            self.assertLessEqual(abs(float(temp) - 32), 0.17)
+            # pumps are logged without noise
+            self.assertIn(feed, ('0', '40'))
+            self.assertEqual(base, '0')
+
+    def test_fork_and_restore(self):
+        reactor = Reactor(name='dg1', flush_rows=100, seed=4, binary_log=True)
+        reactor.start_run()
+        reactor.create_csv()
+        for _ in range(1500):
+            reactor.log_data()
+        state = pickle.loads(pickle.dumps(reactor.snapshot()))
+        branch = reactor.fork('dg2')
+        reseeded = Reactor.from_snapshot(state, 'dg3', seed=99)
+
+        # a what-if on the reactor itself, which is then rewound to the snapshot
+        reactor.feed_deviation = 'off'
+        for _ in range(300):
+            reactor.log_data()
+        reactor.restore(state)
+        for run in (reactor, branch, reseeded):
+            for _ in range(1000):
+                run.log_data()
+            run.close()
+
+        self.assertTrue(filecmp.cmp('dg1.csv', 'dg2.csv', shallow=False))
+        self.assertNotEqual(read_values('dg1.csv')[-1], read_values('dg3.csv')[-1])
+        self.assertEqual(read_values('dg1.csv')[:1502], read_values('dg3.csv')[:1502])
+        export_csv('dg2.bin', 'dg2_binary.csv')
+        self.assertTrue(filecmp.cmp('dg2.csv', 'dg2_binary.csv', shallow=False))
+        self.assertEqual(len(read_values('dg1.csv')), 2502)
+
+    def test_fork_without_csv(self):
+        reactor = Reactor(name='dg1', seed=4)
+        reactor.start_run()
+        reactor.create_csv()
+        for _ in range(200):
+            reactor.log_data()
+        state = reactor.snapshot()
+        branch = Reactor.from_snapshot(state, 'dg2', csv_log=False)
+        self.assertFalse(os.path.exists('dg2.csv'))
+        # the branch logs the same rows as the reactor without writing them
+        rows = [branch.log_data() for _ in range(50)]
+        self.assertEqual(rows, [reactor.log_data() for _ in range(50)])
+        branch.close()
+        reactor.close()
+        self.assertFalse(os.path.exists('dg2.csv'))
+        self.assertEqual(len(read_values('dg1.csv')), 252)
+
+    def test_fast_forward(self):
+        # the quiet stretches logged in bulk are the rows stepping the controllers would log, including the binary log
+        stepped = Reactor(name='dg1', seed=5, binary_log=True)
+        forwarded = Reactor(name='dg2', seed=5, binary_log=True)
+        bulk = []
+        for reactor in (stepped, forwarded):
+            reactor.start_run()
+            reactor.create_csv()
+            while reactor.active:
+                if reactor.minute == 1500:
+                    reactor.temp_deviation = 'up'
+                elif reactor.minute == 1530:
+                    reactor.temp_deviation = None
+                rows = []
+                if reactor is forwarded:
+                    rows = reactor.fast_forward(1500 if reactor.minute < 1500 else None)
+                    bulk.append(len(rows))
+                if not rows:
+                    reactor.log_data()
+        self.assertEqual(read_values('dg1.csv'), read_values('dg2.csv'))
+        export_csv('dg2.bin', 'dg2_binary.csv')
+        self.assertEqual(read_values('dg2.csv'), read_values('dg2_binary.csv'))
+        # the batch phase up to the first pulse is a single stretch and most of the run is skipped
+        self.assertEqual(bulk[0], 540)
+        self.assertGreater(sum(bulk), 2500)
+        # a deviation is never fast forwarded
+        forwarded.temp_deviation = 'up'
+        self.assertEqual(forwarded.quiet_minutes(), 0)
+
+    def test_headless_reactors(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            main(['run', '--reactors', '2', '--until', '2h', '--seed', '1'])
+        self.assertIn('simulated 240 reactor-minutes across 2 reactor(s)', output.getvalue())
+        self.assertTrue(os.path.exists('dg2.csv'))
+        # a run needs at least one reactor
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                main(['run', '--reactors', '0'])
+        with self.assertRaises(ValueError):
+            run_headless(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from campaign import AFTER_FIX, DEVIATIONS, classify, generate_scenarios, run_campaign, summarize
+
+
+class TestCampaign(unittest.TestCase):
+
+    def test_generate_scenarios(self):
+        scenarios = generate_scenarios(200, seed=5, min_onset=120, max_duration=300)
+        self.assertEqual(scenarios, generate_scenarios(200, seed=5, min_onset=120, max_duration=300))
+        self.assertNotEqual(scenarios, generate_scenarios(200, seed=6, min_onset=120, max_duration=300))
+        self.assertEqual([scenario['id'] for scenario in scenarios], list(range(200)))
+        for scenario in scenarios:
+            self.assertIn(scenario['deviation'], DEVIATIONS)
+            self.assertGreaterEqual(scenario['onset'], 120)
+            self.assertLessEqual(scenario['fix'] - scenario['onset'], 300)
+            self.assertLessEqual(scenario['fix'], 68 * 60)
+
+    def test_classify(self):
+        result = {'deviation': 'Feed Off', 'onset': 100, 'fix': 200,
+                  'alerts': [(50, 'Temp [C]'), (110, 'pH'), (115, 'Feed Pump [ml/hr]'), (400, 'Feed Pump [ml/hr]')]}
+        self.assertEqual(classify(result), ('detected', 15, ['Temp [C]'], ['pH']))
+        # alerts after the fix are not detections
+        result = dict(result, fix=500, alerts=[(120, 'pH'), (510, 'Feed Pump [ml/hr]')])
+        self.assertEqual(classify(result), ('late', None, [], ['pH']))
+        self.assertEqual(classify(dict(result, alerts=[(120, 'pH')])), ('missed', None, [], ['pH']))
+        # a feed pump may stay off for longer than this scenario lasted
+        self.assertEqual(classify(dict(result, fix=400, alerts=[])), ('undetectable', None, [], []))
+        self.assertEqual(classify(dict(result, deviation='Temp Up', fix=125, alerts=[])),
+                         ('undetectable', None, [], []))
+        self.assertEqual(classify(dict(result, deviation='Temp Up', fix=126, alerts=[])), ('missed', None, [], []))
+
+    def test_campaign(self):
+        scenarios = [{'id': 0, 'seed': 1, 'deviation': 'Temp Up', 'onset': 600, 'fix': 700},
+                     {'id': 1, 'seed': 2, 'deviation': 'Airflow Down', 'onset': 300, 'fix': 360}]
+        results = run_campaign(scenarios, processes=1)
+        # a slow drift only alerts once it has been out of its tolerance for the allowance
+        self.assertEqual([classify(result) for result in results], [('detected', 25, [], []), ('detected', 37, [], [])])
+        self.assertLess(max(minute for result in results for minute, _ in result['alerts']), 700 + AFTER_FIX)
+
+        summary = summarize(results)
+        self.assertEqual(summary['deviations']['Temp Up'],
+                         {'scenarios': 1, 'detected': 1, 'late': 0, 'undetectable': 0, 'missed': 0, 'false_alarms': 0,
+                          'knock_on': 0, 'missed_rate': 0.0, 'delay_p50': 25.0, 'delay_p90': 25.0, 'delay_p99': 25.0})
+        self.assertEqual(summary['deviations']['Feed On']['missed_rate'], None)
+        self.assertEqual((summary['false_alarms'], summary['scenarios_with_false_alarm']), ({}, 0))
+
+    def test_summarize_outcomes(self):
+        results = [{'deviation': 'Feed Off', 'onset': 100, 'fix': 500, 'alerts': [(150, 'Feed Pump [ml/hr]')]},
+                   {'deviation': 'Feed Off', 'onset': 100, 'fix': 500, 'alerts': [(510, 'Feed Pump [ml/hr]')]},
+                   {'deviation': 'Feed Off', 'onset': 100, 'fix': 500, 'alerts': []},
+                   {'deviation': 'Feed Off', 'onset': 100, 'fix': 105, 'alerts': []}]
+        stats = summarize(results)['deviations']['Feed Off']
+        self.assertEqual([stats[key] for key in ('scenarios', 'detected', 'late', 'undetectable', 'missed')],
+                         [4, 1, 1, 1, 1])
+        # the undetectable scenario is left out of the missed alert rate
+        self.assertAlmostEqual(stats['missed_rate'], 1 / 3)
+        self.assertEqual(stats['delay_p50'], 50.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import os
+import tempfile
+from PyQt5.QtWidgets import QApplication
+from bioreactor import Reactor
+from dashboard import Dashboard
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+
+class TestDashboard(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.app = QApplication.instance() or QApplication([])
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_render(self):
+        reactors = [Reactor(name=f'dg{number}', seed=number) for number in range(1, 4)]
+        dashboard = Dashboard(reactors)
+        # drive the suite from this thread instead of starting its timer
+        suite = dashboard.suite
+        for worker in suite.workers:
+            worker.begin()
+        reactors[1].temp_deviation = 'up'
+        for minute in range(120):
+            suite.tick()
+        self.assertEqual(dashboard.render(), 3)
+        self.assertEqual([len(cache) for cache in dashboard.caches.values()], [121] * 3)
+        # nothing was logged since the last frame, so no tile is redrawn
+        self.assertEqual(dashboard.render(), 0)
+        reactors[0].active = False
+        suite.tick()
+        self.assertEqual(dashboard.render(), 2)
+
+        self.assertEqual(dashboard.tiles['dg1'].status.text(), 'OK')
+        self.assertTrue(dashboard.tiles['dg2'].status.text().startswith('Temp [C] since'))
+        dashboard.open_detail('dg2')
+        self.assertIs(dashboard.details['dg2'].cache, dashboard.caches['dg2'])
+        suite.stop()
+        dashboard.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
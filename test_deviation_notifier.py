@@ -1,8 +1,11 @@
 import unittest
+import os
+import tempfile
 import pandas as pd
 import numpy as np
 import deviation_notifier
 import datetime
+from bioreactor import Reactor
 
 
 class TestNotifier(unittest.TestCase):
@@ -58,6 +61,13 @@ class TestNotifier(unittest.TestCase):
 
         self.assertEqual(deviation_notifier.check_pH(missed_trigger, max_ph=7.27), 34)
 
+    def test_run_starts(self):
+        mask = np.array([True, True, False, True, False, False, True, True, True])
+
+        self.assertEqual(deviation_notifier.run_start(mask), 6)
+        self.assertEqual(deviation_notifier.run_start(mask[:2]), 0)
+        self.assertEqual(deviation_notifier.run_starts(mask).tolist(), [0, 0, -1, 3, -1, -1, 6, 6, 6])
+
     def test_check_time(self):
         timestamps = pd.Series(np.array([
             datetime.datetime(2019, 11, 7, 12, 1),
@@ -74,5 +84,122 @@ class TestNotifier(unittest.TestCase):
         self.assertFalse(deviation_notifier.check_time(timestamps, 3))
         self.assertTrue(deviation_notifier.check_time(timestamps, 0, minutes=7))
 
+
+def make_rows(minutes, **overrides):
+    """
+    Creates rows of normal reactor data where any parameter can be replaced by a function of the row number.
+    """
+    start = datetime.datetime(2019, 11, 7, 12, 0, 0, 125564)
+    normal = {'Agitation [rpm]': 1000.0, 'Airflow [mL/s]': 60.0, 'DO [%]': 100.0, 'Temp [C]': 32.0, 'pH': 7.2,
+              'Feed Pump [ml/hr]': 0.0, 'Base Pump [mL/hr]': 0.0, 'Antifoam Pump [mL/hr]': 0.0}
+    rows = []
+    for minute in range(minutes):
+        row = {'Timestamp': start + datetime.timedelta(minutes=minute)}
+        for label, value in normal.items():
+            row[label] = overrides[label](minute) if label in overrides else value
+        rows.append(row)
+    return rows
+
+
+class TestDeviationDetector(unittest.TestCase):
+
+    def feed(self, rows):
+        detector = deviation_notifier.DeviationDetector()
+        alerts = {}
+        for idx, row in enumerate(rows):
+            for label, start in detector.update(row):
+                alerts[label] = (idx, start)
+        return detector, alerts
+
+    def test_temp_drift(self):
+        rows = make_rows(60, **{'Temp [C]': lambda minute: 32.0 + max(0, minute - 10) * 0.1})
+        detector, alerts = self.feed(rows)
+
+        # out of tolerance once the temp passes 34 at minute 31 and notified after more than 5 minutes
+        self.assertEqual(alerts, {'Temp [C]': (37, rows[31]['Timestamp'])})
+
+    def test_drift_charts(self):
+        # the same drift is caught within a few minutes of its start and only alerted once
+        rng = np.random.default_rng(0)
+        noise = rng.uniform(-0.16, 0.16, size=120)
+        rows = make_rows(120, **{'Temp [C]': lambda minute: 32.0 + noise[minute] + max(0, minute - 10) * 0.1,
+                                 'Agitation [rpm]': lambda minute: 1500.0 if minute >= 50 else 1000.0})
+        for chart in ('cusum', 'ewma'):
+            drift = dict(deviation_notifier.DRIFT_SPECS, **{'Agitation [rpm]': {'chart': chart, 'sigma': 3.0}})
+            drift['Temp [C]'] = dict(drift['Temp [C]'], chart=chart)
+            if chart == 'ewma':
+                del drift['Temp [C]']['allowance'], drift['Temp [C]']['threshold']
+            detector = deviation_notifier.DeviationDetector(drift=drift)
+            alerts = [(index, label, start) for index, row in enumerate(rows) for label, start in detector.update(row)]
+            # the agitation ramp does not alarm the agitation chart
+            (index, label, start), = alerts
+            self.assertEqual(label, 'Temp [C]')
+            self.assertLessEqual(index, 16)
+            # the start is estimated from where the chart last left the setpoint, which the noise can move a little
+            self.assertLessEqual(abs(start - rows[10]['Timestamp']), datetime.timedelta(minutes=5))
+
+        # noise alone does not alarm
+        rows = make_rows(600, **{'Temp [C]': lambda minute: 32.0 + rng.uniform(-0.16, 0.16)})
+        detector = deviation_notifier.DeviationDetector(drift=deviation_notifier.DRIFT_SPECS)
+        self.assertFalse([alert for row in rows for alert in detector.update(row)])
+
+    def test_pump_on_too_long(self):
+        rows = make_rows(20, **{'Base Pump [mL/hr]': lambda minute: 35.0 if minute >= 2 else 0.0})
+        detector, alerts = self.feed(rows)
+
+        self.assertEqual(alerts, {'Base Pump [mL/hr]': (8, rows[2]['Timestamp'])})
+
+    def test_agitation_ramp(self):
+        rows = make_rows(30, **{'Agitation [rpm]': lambda minute: 1500.0 if minute >= 10 else 1000.0,
+                                'pH': lambda minute: 7.25 if minute else 7.2})
+        detector, alerts = self.feed(rows)
+
+        # pH is allowed up to 7.27 before the ramp and 7.22 after it, which is tracked from the start of the run
+        self.assertEqual(detector.rpm, 1500)
+        self.assertNotIn('Agitation [rpm]', alerts)
+        self.assertEqual(alerts, {'pH': (10, rows[1]['Timestamp'])})
+
+    def test_matches_check_functions(self):
+        rows = make_rows(50, **{'Feed Pump [ml/hr]': lambda minute: 40.0 + max(0, minute - 20) * 0.5,
+                                'Airflow [mL/s]': lambda minute: 60.0 - max(0, minute - 30) * 0.3})
+        detector = deviation_notifier.DeviationDetector()
+        for row in rows:
+            detector.update(row)
+        data = pd.DataFrame(rows)
+
+        idx, allowance = deviation_notifier.check_pumps('Feed Pump [ml/hr]', data['Feed Pump [ml/hr]'], 40, 3)
+        self.assertEqual(detector.pump_state('Feed Pump [ml/hr]'), (rows[idx]['Timestamp'], allowance))
+        idx = deviation_notifier.check_constants(data['Airflow [mL/s]'], 60, 3)
+        self.assertEqual(detector.deviation_start(detector.constant_runs['Airflow [mL/s]']), rows[idx]['Timestamp'])
+
+
+class TestLogTail(unittest.TestCase):
+
+    def test_new_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            reactor = Reactor(name='dg1', flush_rows=1, seed=2)
+            reactor.file = os.path.join(directory, reactor.file)
+            tail = deviation_notifier.LogTail(reactor.file)
+            reactor.start_run()
+            reactor.create_csv()
+            self.assertEqual(len(tail.read()), 1)
+            for _ in range(10):
+                reactor.log_data()
+            self.assertEqual((len(tail.read()), tail.restarted), (10, False))
+            reactor.log_data()
+            self.assertEqual((len(tail.read()), tail.restarted), (1, False))
+
+            # the new run has grown past the offset of the old one by the next read
+            reactor.start_run()
+            reactor.create_csv()
+            for _ in range(30):
+                reactor.log_data()
+            reactor.close()
+            rows = tail.read()
+            self.assertTrue(tail.restarted)
+            self.assertEqual((len(rows), tail.rows_read), (31, 31))
+            self.assertEqual(rows[0]['Timestamp'], reactor.start_time)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+import os
+import csv
+import tempfile
+import numpy as np
+from bioreactor import Reactor
+from fleet import ReactorFleet
+
+# (minute the deviation starts, minute it is fixed, parameter, deviation) for each vessel in the fleet
+SCHEDULES = [
+    [],
+    [(600, 700, 'feed', 'on'), (1500, 1560, 'temp', 'up')],
+    [(300, 420, 'agitation', 'down'), (2000, 2100, 'agitation', 'up')],
+    [(1200, 1300, 'base', 'on'), (2500, 2600, 'airflow', 'down')],
+    [(800, 1100, 'feed', 'off'), (3000, 3050, 'antifoam', 'on')],
+    [(700, 760, 'airflow', 'up'), (3500, 3900, 'base', 'off'), (1900, 1950, 'antifoam', 'off')],
+]
+
+
+class TestReactorFleet(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_matches_reactor(self):
+        reactors = [Reactor(name=f'dg{idx}', seed=idx) for idx in range(len(SCHEDULES))]
+        fleet = ReactorFleet([f'fleet{idx}' for idx in range(len(SCHEDULES))], seed=0)
+        fleet.start_run()
+        fleet.create_csv()
+        for reactor in reactors:
+            reactor.start_run()
+            reactor.start_time = fleet.start_time
+            reactor.create_csv()
+
+        minute = 0
+        while fleet.active:
+            minute += 1
+            for vessel, schedule in enumerate(SCHEDULES):
+                for start, end, parameter, deviation in schedule:
+                    if minute in (start, end):
+                        deviation = deviation if minute == start else None
+                        setattr(reactors[vessel], parameter + '_deviation', deviation)
+                        fleet.set_deviation(vessel, parameter, deviation)
+            for reactor in reactors:
+                reactor.log_data()
+            fleet.log_data()
+
+            expected = np.array([[reactor.agitation, reactor.airflow, reactor.DO, reactor.temp, reactor.pH,
+                                  reactor.feed_pump, reactor.base_pump, reactor.antifoam_pump] for reactor in reactors])
+            np.testing.assert_array_equal(fleet.values(), expected, err_msg=f'minute {minute}')
+            self.assertEqual(fleet.feed_triggered.tolist(), [reactor.feed_triggered for reactor in reactors])
+            self.assertEqual(fleet.spiking.tolist(), [reactor.spiking for reactor in reactors])
+
+        self.assertEqual(minute, 68 * 60)
+        self.assertFalse(any(reactor.active for reactor in reactors))
+        fleet.close()
+        for vessel in range(len(SCHEDULES)):
+            with open(f'dg{vessel}.csv') as reactor_csv, open(f'fleet{vessel}.csv') as fleet_csv:
+                expected = list(csv.reader(reactor_csv))
+                rows = list(csv.reader(fleet_csv))
+            self.assertEqual(len(rows), 68 * 60 + 1)
+            # every vessel logs exactly the rows of the Reactor with the same seed
+            self.assertEqual(rows, expected, msg=f'vessel {vessel}')
+
+    def test_flush_policy(self):
+        fleet = ReactorFleet(['fleet0', 'fleet1'], seed=0, flush_rows=60)
+        fleet.start_run()
+        fleet.create_csv()
+        for _ in range(59):
+            fleet.log_data()
+        for file in fleet.files:
+            with open(file) as csvfile:
+                self.assertEqual(len(csvfile.readlines()), 2)
+        fleet.log_data()
+        for file in fleet.files:
+            with open(file) as csvfile:
+                self.assertEqual(len(csvfile.readlines()), 62)
+        fleet.log_data()
+        fleet.close()
+        fleet.close()
+        for file in fleet.files:
+            with open(file) as csvfile:
+                self.assertEqual(len(csvfile.readlines()), 63)
+
+
+if __name__ == '__main__':
+    unittest.main()
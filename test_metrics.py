@@ -0,0 +1,126 @@
+import unittest
+import os
+import tempfile
+import urllib.request
+import metrics
+import deviation_notifier
+from alerts import AlertDispatcher
+from bioreactor import HEADERS, Reactor
+from deviation_notifier import DeviationDetector, ReactorMonitor
+from metrics import REGISTRY, Histogram
+from ringbuffer import RingReader
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = Histogram('test')
+        for microseconds in range(1, 10001):
+            histogram.record(microseconds * 1e-6)
+
+        self.assertEqual(histogram.count, 10000)
+        for percentile in (50, 90, 99):
+            # within the precision of a bucket
+            self.assertAlmostEqual(histogram.percentile(percentile), percentile * 1e-4, delta=percentile * 1e-4 / 16)
+        self.assertEqual(histogram.percentile(100), 0.01)
+        below, total = histogram.cumulative((1e-3, 1.0))
+        self.assertAlmostEqual(below, 1000, delta=1000 / 16)
+        self.assertEqual(total, 10000)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        REGISTRY.reset()
+
+    def tearDown(self):
+        metrics.disable()
+        REGISTRY.reset()
+        deviation_notifier.monitors.clear()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_enable_and_disable(self):
+        log_data = Reactor.log_data
+        check_deviations = deviation_notifier.check_deviations
+        metrics.enable()
+        self.assertIsNot(Reactor.log_data, log_data)
+
+        sent = []
+
+        class Channel:
+            name = 'test'
+
+            def send(self, subject, body):
+                sent.append(body)
+
+            def close(self):
+                pass
+
+        dispatcher = AlertDispatcher([Channel()], coalesce=0).start()
+        reactor = Reactor(name='dg1', seed=2)
+        reactor.start_run()
+        reactor.create_csv()
+        for minute in range(1, 40):
+            if minute == 10:
+                reactor.temp_deviation = 'up'
+            reactor.log_data()
+            deviation_notifier.check_deviations('dg1.csv', dispatcher)
+        dispatcher.stop(timeout=5)
+        reactor.close()
+
+        snapshot = REGISTRY.snapshot()
+        self.assertEqual(snapshot['counters']['rows_logged'], 39)
+        self.assertEqual(snapshot['counters']['rows_checked'], 40)
+        self.assertEqual((snapshot['counters']['alerts_raised'], snapshot['counters']['alerts_sent'], len(sent)),
+                         (1, 1, 1))
+        self.assertEqual(snapshot['histograms']['reactor_temp_controller']['count'], 39)
+        self.assertEqual(snapshot['histograms']['alert_end_to_end_latency']['count'], 1)
+
+        server = metrics.serve(0)
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+            with urllib.request.urlopen(url, timeout=5) as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn('bioreactor_reactor_log_data_seconds_count 39', body)
+        self.assertIn('bioreactor_rows_logged_total 39', body)
+
+        metrics.disable()
+        self.assertIs(Reactor.log_data, log_data)
+        self.assertIs(deviation_notifier.check_deviations, check_deviations)
+        self.assertFalse(metrics.enabled())
+
+    def test_alert_latency(self):
+        # rows checked in the process that logged them, like the headless runner and the GUI worker
+        metrics.enable()
+        reactor = Reactor(name='dg1', seed=2, csv_log=False, shared_memory=True)
+        reactor.start_run()
+        reactor.create_csv()
+        detector = DeviationDetector(reactor.name)
+        ring = ReactorMonitor(reactor.ring_name, reactor.name, RingReader(reactor.ring_name))
+        alerts = []
+        for minute in range(1, 40):
+            if minute == 10:
+                reactor.temp_deviation = 'up'
+            alerts.extend(detector.update(dict(zip(HEADERS, reactor.log_data()))))
+        detection = REGISTRY.histogram('alert_detection_latency')
+        self.assertEqual((len(alerts), detection.count), (1, 1))
+        self.assertLess(detection.max, 1)
+        self.assertEqual(list(metrics.alerts_logged), [(reactor.name,) + alerts[0]])
+        self.assertEqual(metrics.logged, {})
+
+        # rows read from the ring buffer in another process carry the time they were published at
+        self.assertEqual(ring.poll()[1], alerts)
+        self.assertEqual(detection.count, 2)
+        self.assertLess(detection.max, 1)
+        reactor.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
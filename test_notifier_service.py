@@ -0,0 +1,52 @@
+import unittest
+import asyncio
+import os
+import tempfile
+from bioreactor import Reactor
+from notifier_service import NotifierService
+
+
+class TestNotifierService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def log(self, name, minutes, deviation_at=None):
+        reactor = Reactor(name=name)
+        reactor.file = os.path.join(self.tmp.name, reactor.file)
+        reactor.start_run()
+        reactor.create_csv()
+        for minute in range(1, minutes + 1):
+            if minute == deviation_at:
+                reactor.temp_deviation = 'up'
+            reactor.log_data()
+        reactor.close()
+        return reactor
+
+    def test_watches_directory(self):
+        self.log('dg1', 120)
+        reactor = self.log('dg2', 120, deviation_at=30)
+        alerts = []
+        service = NotifierService([self.tmp.name], interval=0.01,
+                                  alert=lambda *alert: alerts.append(alert))
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(service.run(duration=0.3))
+        finally:
+            loop.close()
+
+        self.assertEqual(sorted(monitor.name for monitor in service.monitors.values()), ['dg1', 'dg2'])
+        self.assertEqual(service.rows, 2 * 121)
+        self.assertEqual(len(alerts), 1)
+        name, label, start = alerts[0]
+        self.assertEqual((name, label), ('dg2', 'Temp [C]'))
+        # the temp rises 0.1 °C a minute from minute 30 and leaves the ±2 °C band after about 20 minutes
+        self.assertAlmostEqual((start - reactor.start_time).total_seconds() / 60, 50, delta=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import datetime
+import numpy as np
+from plotdata import ColumnCache, VALUE_LABELS, find_header
+
+# one row every 15 seconds
+NS_PER_ROW = 15 * 10 ** 9
+
+
+class TestColumnCache(unittest.TestCase):
+
+    def test_extend(self):
+        # rows appended in batches past the initial capacity are kept in order, with the EFT in hours
+        start = datetime.datetime(2019, 11, 1, 12)
+        rows = [dict(zip(VALUE_LABELS, [minute + index for index in range(len(VALUE_LABELS))]),
+                     Timestamp=start + datetime.timedelta(minutes=minute)) for minute in range(300)]
+        cache = ColumnCache(capacity=16)
+        for batch in range(0, 300, 7):
+            cache.extend(rows[batch:batch + 7])
+        self.assertEqual(len(cache), 300)
+        self.assertEqual(cache.start_time, start)
+        self.assertTrue(np.allclose(cache.column('EFT'), np.arange(300) / 60))
+        self.assertTrue(np.array_equal(cache.column('pH'), np.arange(300) + 4))
+        self.assertEqual(cache.extend([]), 0)
+
+        # the arrays variant appends the same rows
+        arrays = ColumnCache(capacity=16)
+        timestamps = np.arange(300, dtype=np.int64) * 60 * 10 ** 9 + 1572609600 * 10 ** 9
+        arrays.extend_arrays(timestamps, np.column_stack([cache.column(label) for label in VALUE_LABELS]))
+        self.assertEqual(arrays.start_time, start)
+        for label in ('EFT',) + VALUE_LABELS:
+            self.assertTrue(np.allclose(arrays.column(label), cache.column(label)))
+
+    def test_find_header(self):
+        self.assertEqual(find_header('DO'), 'DO [%]')
+        self.assertEqual(find_header('Feed'), 'Feed Pump [ml/hr]')
+        self.assertIsNone(find_header('Pressure'))
+
+
+class TestPyramid(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.rows = 50000
+        self.timestamps = np.arange(self.rows, dtype=np.int64) * NS_PER_ROW
+        self.values = rng.normal(size=(self.rows, len(VALUE_LABELS)))
+        self.cache = ColumnCache()
+        start = 0
+        while start < self.rows:
+            end = start + int(rng.integers(1, 500))
+            self.cache.extend_arrays(self.timestamps[start:end], self.values[start:end])
+            start = end
+
+    def test_incremental(self):
+        rebuilt = ColumnCache()
+        rebuilt.extend_arrays(self.timestamps, self.values)
+        self.assertEqual(len(self.cache.pyramid.levels), len(rebuilt.pyramid.levels))
+        for level, expected in zip(self.cache.pyramid.levels, rebuilt.pyramid.levels):
+            self.assertEqual(level.count, expected.count)
+            self.assertTrue(np.array_equal(level.low[:level.count], expected.low[:level.count]))
+            self.assertTrue(np.array_equal(level.high[:level.count], expected.high[:level.count]))
+
+    def test_view(self):
+        # the whole run is drawn with a few points per pixel and keeps the extremes of the raw data
+        eft, pH = self.cache.pyramid.view(self.cache, 'pH', width=500)
+        self.assertLessEqual(len(eft), 8 * 500)
+        self.assertEqual((pH.min(), pH.max()), (self.values[:, 4].min(), self.values[:, 4].max()))
+        self.assertTrue(np.all(np.diff(eft) >= 0))
+
+        # zoomed in far enough, the raw rows in view are drawn
+        eft, pH = self.cache.pyramid.view(self.cache, 'pH', 10, 11, width=500)
+        self.assertEqual(len(eft), 243)
+        self.assertTrue(np.array_equal(pH, self.values[2399:2642, 4]))
+
+        self.cache.clear()
+        self.assertEqual(self.cache.pyramid.levels, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
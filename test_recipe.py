@@ -0,0 +1,48 @@
+import unittest
+import datetime
+import json
+import math
+import os
+import tempfile
+from recipe import DEFAULT, Recipe
+
+
+class TestRecipe(unittest.TestCase):
+
+    def test_default_tables(self):
+        # the tables of the default recipe give the same timing as the original timedelta comparisons
+        for minute in range(DEFAULT.final_eft):
+            eft = datetime.timedelta(minutes=minute)
+            self.assertEqual(bool(DEFAULT.antifoam[minute]), any(
+                datetime.timedelta(hours=hour) <= eft <= datetime.timedelta(hours=hour, minutes=10)
+                for hour in range(10, 68, 3)))
+            self.assertEqual(bool(DEFAULT.first_pulse[minute]), datetime.timedelta(hours=9) < eft)
+            if eft < datetime.timedelta(hours=7, minutes=36):
+                self.assertEqual(DEFAULT.baseline_DO[minute], -math.exp(eft.total_seconds() / 3600 - 3.5) + 100)
+            else:
+                self.assertTrue(math.isnan(DEFAULT.baseline_DO[minute]))
+
+        self.assertEqual([DEFAULT.spike_interval[minute] for minute in (900, 901, 1799, 1800, 1801, 3959, 3960)],
+                         [0, 90, 90, 0, 30, 120, 0])
+        self.assertEqual([DEFAULT.DO_uptake[minute] for minute in (1500, 1501, 2701, 3001)], [0.5, 0.25, 0.2, 0.1])
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'recipe.json')
+            with open(file, 'w') as recipe_file:
+                json.dump({'final_eft': 600, 'antifoam': {'start': 60, 'duration': 5}}, recipe_file)
+            recipe = Recipe.load(file)
+
+        self.assertEqual((recipe.final_eft, len(recipe.antifoam)), (600, 601))
+        # the entries that are not given keep the default timing
+        self.assertEqual(recipe.spec['antifoam']['every'], 180)
+        self.assertEqual([bool(recipe.antifoam[minute]) for minute in (59, 60, 65, 66, 240)], [False, True, True,
+                                                                                               False, True])
+
+    def test_unknown_entry(self):
+        with self.assertRaises(ValueError):
+            Recipe({'feed_spike': []})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import datetime
+import filecmp
+import os
+import tempfile
+from bioreactor import Reactor
+from deviation_notifier import DeviationDetector, LogTail
+from replay import Replay
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        reactor = Reactor(name='dg1', flush_rows=4096, seed=5)
+        reactor.file = os.path.join(self.tmp.name, reactor.file)
+        reactor.start_run()
+        reactor.create_csv()
+        for minute in range(1, 900):
+            if minute == 300:
+                reactor.temp_deviation = 'up'
+            reactor.log_data()
+        reactor.close()
+        self.file = reactor.file
+        self.output = os.path.join(self.tmp.name, 'replay.csv')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_replay(self):
+        detector = DeviationDetector()
+        expected = [alert for row in LogTail(self.file).read() for alert in detector.update(row)]
+        alerts = []
+        stats = Replay(self.file, self.output, batch=7, alert=lambda *alert: alerts.append(alert)).run()
+
+        self.assertEqual(alerts, [('dg1', label, start) for label, start in expected])
+        self.assertIn('Temp [C]', [label for _, label, _ in alerts])
+        self.assertEqual((stats['rows'], len(stats['alerts'])), (900, len(expected)))
+        self.assertTrue(filecmp.cmp(self.file, self.output, shallow=False))
+
+    def test_start_and_speed(self):
+        alerts = []
+        replay = Replay(self.file, self.output, speed=60 * 600, start=datetime.timedelta(hours=6), batch=10,
+                        alert=lambda *alert: alerts.append(alert))
+        stats = replay.run()
+
+        # the temperature deviation started before the replay so it was already notified while catching up
+        self.assertEqual((stats['rows'], alerts), (540, []))
+        self.assertAlmostEqual(stats['speed'], 60 * 600, delta=60 * 100)
+        self.assertEqual(len(replay.latencies), 540)
+
+
+if __name__ == '__main__':
+    unittest.main()
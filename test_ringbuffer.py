@@ -0,0 +1,140 @@
+import unittest
+import datetime
+import multiprocessing
+import os
+import tempfile
+import time
+from bioreactor import Reactor
+from deviation_notifier import LogTail, ReactorMonitor
+from ringbuffer import RingBuffer, RingReader
+
+
+def follow(name, rows, queue):
+    """
+    Reads a ring from another process until the given number of rows has arrived.
+    """
+    reader = RingReader(name)
+    read = []
+    while len(read) < rows:
+        read.extend(reader.read())
+    queue.put((len(read), read[-1]['pH'], reader.lost))
+    reader.detach()
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.name = f'test{os.getpid()}'
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_matches_csv(self):
+        reactor = Reactor(name=self.name, shared_memory=True, seed=1)
+        reactor.start_run()
+        reactor.create_csv()
+        reader = RingReader(reactor.ring_name)
+        monitor = ReactorMonitor(reactor.ring_name, self.name, RingReader(reactor.ring_name))
+        csv_monitor = ReactorMonitor(reactor.file)
+        alerts = []
+        for minute in range(1, 601):
+            if minute == 200:
+                reactor.temp_deviation = 'up'
+            reactor.log_data()
+            if minute % 50 == 0:
+                alerts.extend(monitor.poll()[1])
+        reactor.flush()
+
+        rows = reader.read()
+        expected = LogTail(reactor.file).read()
+        self.assertEqual(len(rows), 601)
+        # every row carries the wall time it was published at
+        published = [row.pop('_published') for row in rows]
+        self.assertEqual(published, sorted(published))
+        self.assertLess(abs(published[-1] - time.time()), 60)
+        self.assertEqual(rows, [{label: value for label, value in row.items() if label != '_EFT'} for row in expected])
+        # the detector fed from shared memory raises the same alerts as the one tailing the csv
+        self.assertTrue(alerts)
+        self.assertEqual(alerts, csv_monitor.poll()[1])
+        reactor.close()
+
+    def test_other_process(self):
+        reactor = Reactor(name=self.name, shared_memory=True, csv_log=False, seed=1)
+        reactor.start_run()
+        reactor.create_csv()
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=follow, args=(reactor.ring_name, 301, queue))
+        process.start()
+        for minute in range(300):
+            values = reactor.log_data()
+        rows, pH, lost = queue.get(timeout=30)
+        process.join()
+        reactor.close()
+        self.assertEqual((rows, pH, lost), (301, values[5], 0))
+        self.assertFalse(os.path.exists(reactor.file))
+
+    def test_overrun(self):
+        start = datetime.datetime(2020, 1, 1)
+        ring = RingBuffer(self.name, capacity=8)
+        ring.create(start)
+        reader = RingReader(self.name)
+        reader.read()
+        for minute in range(20):
+            ring.append(start + datetime.timedelta(minutes=minute), [minute] * 8)
+        rows = reader.read()
+        # only the last capacity - 1 rows can be read, the others are counted as lost
+        self.assertEqual(reader.lost, 13)
+        self.assertEqual([row['pH'] for row in rows], list(range(13, 20)))
+        self.assertEqual(rows[0]['Timestamp'], start + datetime.timedelta(minutes=13))
+
+        ring.append(start + datetime.timedelta(minutes=20), [20] * 8)
+        timestamps, values = reader.read_arrays()
+        self.assertEqual(values[:, 4].tolist(), [20])
+        self.assertFalse(reader.changed())
+        reader.detach()
+        ring.close()
+
+    def test_torn_row(self):
+        # a reader a full ring behind never reads the slot the writer is filling before it publishes the row
+        start = datetime.datetime(2020, 1, 1)
+        ring = RingBuffer(self.name, capacity=8)
+        ring.create(start)
+        reader = RingReader(self.name)
+        reader.read()
+        for minute in range(8):
+            ring.append(start + datetime.timedelta(minutes=minute), [minute] * 8)
+        ring.timestamps[0] = 0
+        ring.values[0] = -1
+        rows = reader.read()
+        self.assertEqual([row['pH'] for row in rows], list(range(1, 8)))
+        self.assertEqual(reader.lost, 1)
+        reader.detach()
+        ring.close()
+
+    def test_new_run(self):
+        reactor = Reactor(name=self.name, shared_memory=True, csv_log=False)
+        reactor.start_run()
+        reactor.create_csv()
+        reader = RingReader(reactor.ring_name)
+        for minute in range(10):
+            reactor.log_data()
+        self.assertEqual(len(reader.read()), 11)
+
+        # the rows logged before the end of the run are still read, then the reader moves on to the new run
+        reactor.log_data()
+        reactor.start_run()
+        reactor.create_csv()
+        self.assertEqual(len(reader.read()), 1)
+        self.assertFalse(reader.restarted)
+        self.assertEqual(len(reader.read()), 1)
+        self.assertTrue(reader.restarted)
+        reader.detach()
+        reactor.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
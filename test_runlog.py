@@ -0,0 +1,58 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import runlog
+from bioreactor import HEADERS, Reactor
+from deviation_notifier import read_csv
+
+
+class TestRunLog(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_export_matches_csv(self):
+        reactor = Reactor(name='dg1', binary_log=True)
+        reactor.start_run()
+        reactor.create_csv()
+        for minute in range(600):
+            reactor.log_data()
+
+        # readers see the rows logged so far while the run is still being written
+        start_time, columns = runlog.read_run_log('dg1.bin')
+        self.assertEqual(start_time, reactor.start_time)
+        self.assertEqual(len(columns['pH']), 601)
+        self.assertEqual(columns['EFT'][-1], 600)
+
+        reactor.close()
+        runlog.export_csv('dg1.bin', 'export.csv')
+        with open('dg1.csv') as original, open('export.csv') as export:
+            self.assertEqual(original.read(), export.read())
+
+    def test_dataframe_matches_csv(self):
+        reactor = Reactor(name='dg1', binary_log=True)
+        reactor.start_run()
+        reactor.create_csv()
+        for minute in range(120):
+            reactor.log_data()
+        reactor.close()
+
+        csv_data, binary_data = read_csv('dg1.csv'), read_csv('dg1.bin')
+        self.assertEqual(list(binary_data.columns), HEADERS)
+        self.assertEqual(list(binary_data.columns), list(csv_data.columns))
+        self.assertEqual(list(binary_data['Timestamp']), list(csv_data['Timestamp']))
+        self.assertEqual(list(binary_data['_EFT']), list(csv_data['_EFT']))
+        for label in runlog.VALUE_LABELS:
+            # the binary log stores the values as float32
+            self.assertTrue(np.allclose(binary_data[label], csv_data[label], atol=1e-3))
+
+
+if __name__ == '__main__':
+    unittest.main()
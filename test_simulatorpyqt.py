@@ -0,0 +1,44 @@
+import unittest
+import os
+import tempfile
+from bioreactor import Reactor
+from deviation_notifier import ReactorMonitor
+from simulatorpyqt import SimulationWorker
+
+
+class TestSimulationWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_commands_and_rows(self):
+        worker = SimulationWorker(Reactor(name='dg1', seed=1))
+        alerts = []
+        worker.deviation.connect(lambda label, start: alerts.append((label, start)))
+        worker.reactor.start_run()
+        worker.check(worker.reactor.create_csv())
+        for minute in range(1, 121):
+            if minute in (30, 90):
+                worker.submit('temp_deviation', 'up' if minute == 30 else None)
+                # the command is only applied by the worker's next tick
+                self.assertEqual(worker.reactor.temp_deviation, None if minute == 30 else 'up')
+            worker.tick()
+        self.assertIsNone(worker.reactor.temp_deviation)
+
+        rows = worker.drain()
+        self.assertEqual(len(rows), 121)
+        self.assertEqual(worker.drain(), [])
+        # the worker's detector raises the same alerts as tailing the csv file
+        worker.stop()
+        self.assertTrue(alerts)
+        self.assertEqual(alerts, ReactorMonitor('dg1.csv').poll()[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
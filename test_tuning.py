@@ -0,0 +1,77 @@
+import unittest
+import datetime
+import os
+import tempfile
+import numpy as np
+from campaign import DEVIATIONS, generate_scenarios
+from deviation_notifier import DeviationDetector, LABELS, PUMP_SPECS
+from tuning import GRIDS, Corpus, current, evaluate, frontier, rpm_setpoints, score_constant, score_pump
+
+
+class TestTuning(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.scenarios = generate_scenarios(24, seed=3, max_duration=240)
+        cls.corpus = Corpus.build(cls.scenarios, processes=1)
+
+    def test_matches_detector(self):
+        # at the current thresholds, the vectorized scores are the first alerts of the DeviationDetector
+        start = datetime.datetime(2019, 11, 7, 12)
+        for index, scenario in enumerate(self.scenarios):
+            run = self.corpus.run(index)
+            detector = DeviationDetector()
+            alerts = {}
+            for row, values in enumerate(zip(*(run[label] for label in LABELS))):
+                row_dict = dict(zip(LABELS, values), Timestamp=start + datetime.timedelta(minutes=row))
+                for label, _ in detector.update(row_dict):
+                    alerts.setdefault(label, []).append(row)
+            onset = scenario['onset']
+            rpm_before, rpm_after = rpm_setpoints(run['Agitation [rpm]'])
+            for label in GRIDS:
+                if label in PUMP_SPECS:
+                    before, delay = score_pump(label, run[label], onset, rpm_after)
+                else:
+                    before, delay = score_constant(label, run[label], onset, rpm_before)
+                position = tuple(int(np.flatnonzero(np.isclose(values, value))[0])
+                                 for values, value in zip(GRIDS[label].values(), current(label)))
+                rows = alerts.get(label, [])
+                self.assertEqual(before[position], any(row < onset for row in rows), (index, label))
+                if not before[position]:
+                    after = [row - onset for row in rows if row >= onset]
+                    self.assertEqual(delay[position], after[0] if after else -1, (index, label))
+
+    def test_frontier(self):
+        result = evaluate(self.corpus, 'Temp [C]')
+        self.assertEqual(result['positives'], sum(DEVIATIONS[s['deviation']] == 'Temp [C]' for s in self.scenarios))
+        self.assertEqual(result['precision'].shape, (GRIDS['Temp [C]']['tolerance'].size,
+                                                     GRIDS['Temp [C]']['allowance'].size))
+        points = frontier(result)
+        self.assertTrue(points)
+        # a longer allowance never detects earlier
+        self.assertTrue(np.all(np.diff(np.nan_to_num(result['delay_p50'], nan=np.inf), axis=1) >= 0))
+        # no point of the frontier is dominated by a point of the grid
+        precision = np.nan_to_num(result['precision'], nan=0)
+        recall = np.nan_to_num(result['recall'], nan=0)
+        delay = np.nan_to_num(result['delay_p50'], nan=np.inf)
+        for scores in points:
+            p, r, d = (scores['precision'] or 0, scores['recall'] or 0,
+                       np.inf if scores['delay_p50'] is None else scores['delay_p50'])
+            at_least = (precision >= p) & (recall >= r) & (delay <= d)
+            better = (precision > p) | (recall > r) | (delay < d)
+            self.assertFalse(np.any(at_least & better))
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'corpus.npz')
+            self.corpus.save(file)
+            loaded = Corpus.load(file)
+        self.assertEqual(loaded.labels, self.corpus.labels)
+        self.assertTrue(np.array_equal(loaded.offsets, self.corpus.offsets))
+        for label in LABELS:
+            self.assertTrue(np.array_equal(loaded.columns[label], self.corpus.columns[label]))
+        self.assertEqual(len(self.corpus.run(3)['pH']), self.scenarios[3]['fix'] + 61)
+
+
+if __name__ == '__main__':
+    unittest.main()
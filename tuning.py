@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import warnings
+import numpy as np
+from batch_report import rpm_setpoints
+from bioreactor import Reactor
+from campaign import AFTER_FIX, DEVIATIONS, generate_scenarios
+from deviation_notifier import ALLOWANCE, LABELS, PRE_RAMP_ALLOWANCE, PUMP_SPECS, SETPOINTS, run_starts
+
+# the grid swept for every parameter, the tolerance around the setpoint and the minutes a constant parameter may stay
+# out of it, or the minutes a pump may stay on and off after the agitation ramp. Every grid contains the current value
+GRIDS = {'Agitation [rpm]': {'tolerance': np.arange(8, 31, 2), 'allowance': np.arange(0, 11)},
+         'Airflow [mL/s]': {'tolerance': np.arange(0.5, 5.01, 0.5), 'allowance': np.arange(0, 11)},
+         'Temp [C]': {'tolerance': np.arange(0.5, 3.01, 0.25), 'allowance': np.arange(0, 11)},
+         'Feed Pump [ml/hr]': {'on': np.arange(20, 121, 10), 'off': np.arange(70, 491, 30)},
+         'Base Pump [mL/hr]': {'on': np.arange(1, 21), 'off': np.arange(70, 491, 30)},
+         'Antifoam Pump [mL/hr]': {'on': np.arange(10, 61, 5), 'off': np.arange(60, 301, 20)}}
+
+
+def current(label):
+    """
+    The thresholds the DeviationDetector uses for a parameter, in the axes of its grid.
+
+    :param label: header of the parameter
+    :type label: str
+    :return: the current value of each axis
+    :rtype: tuple
+    """
+    if label in PUMP_SPECS:
+        return PUMP_SPECS[label]['on'], PUMP_SPECS[label]['off']
+    return SETPOINTS[label][1], ALLOWANCE
+
+
+def simulate(scenario):
+    """
+    Runs a campaign scenario without writing any log and keeps every row, including the first one a csv file would
+    start with, so the row number is the EFT in minutes. The stretches between the onset and fix of the deviation are
+    fast forwarded.
+
+    :param scenario: one of the scenarios from campaign.generate_scenarios
+    :type scenario: dict
+    :return: the process values of every row in the order of LABELS
+    :rtype: numpy array of shape (rows, 8)
+    """
+    parameter, deviation = scenario['deviation'].lower().split()
+    reactor = Reactor(name='tuning', seed=scenario['seed'], csv_log=False)
+    reactor.start_run()
+    rows = [reactor.create_csv()]
+    end = scenario['fix'] + AFTER_FIX
+    while reactor.active and reactor.minute < end:
+        minute = reactor.minute + 1
+        if minute == scenario['onset']:
+            setattr(reactor, parameter + '_deviation', deviation)
+        elif minute == scenario['fix']:
+            setattr(reactor, parameter + '_deviation', None)
+        # the row of the next onset or fix is stepped after its deviation is toggled
+        toggle = scenario['onset'] if minute < scenario['onset'] else scenario['fix'] if minute < scenario['fix'] \
+            else end + 1
+        logged = reactor.fast_forward(min(toggle - 1, end))
+        if not logged:
+            values = reactor.log_data()
+            if values is None:
+                break
+            logged = [values]
+        rows.extend(logged)
+    reactor.close()
+    return np.array([row[1:9] for row in rows], dtype=float)
+
+
+class Corpus:
+    """
+    The process values of many labeled runs in one columnar cache. Every column holds the rows of all runs back to
+    back and the offsets give where each run begins, so a run is a set of views into the columns and the whole corpus
+    can be saved to and loaded from a single file instead of simulating it again.
+
+    :param values: the process values of every row of every run in the order of LABELS
+    :type values: numpy array of shape (rows, 8)
+    :param offsets: the first row of every run followed by the total number of rows
+    :type offsets: numpy array of ints
+    :param labels: the scenario of every run, with its deviation, onset and fix in minutes
+    :type labels: list of dicts
+    """
+
+    def __init__(self, values, offsets, labels):
+        self.columns = {label: np.ascontiguousarray(values[:, column]) for column, label in enumerate(LABELS)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.labels = list(labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    @classmethod
+    def build(cls, scenarios, processes=None):
+        """
+        Simulates the scenarios across a pool of processes.
+
+        :param scenarios: the scenarios from campaign.generate_scenarios
+        :type scenarios: list of dicts
+        :param processes: number of worker processes, by default one per core
+        :type processes: int
+        :return: the corpus of the scenarios
+        :rtype: Corpus
+        """
+        if processes == 1:
+            runs = [simulate(scenario) for scenario in scenarios]
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                runs = pool.map(simulate, scenarios, chunksize=4)
+        offsets = np.concatenate(([0], np.cumsum([len(run) for run in runs])))
+        return cls(np.concatenate(runs), offsets, scenarios)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Reads a corpus saved with save.
+
+        :param file: path of the corpus
+        :type file: str
+        :return: the corpus
+        :rtype: Corpus
+        """
+        with np.load(file) as cache:
+            return cls(cache['values'], cache['offsets'], json.loads(str(cache['labels'])))
+
+    def save(self, file):
+        """
+        Writes the corpus to a compressed npz file.
+        :param file: path of the corpus
+        :type file: str
+        :return: None
+        """
+        values = np.column_stack([self.columns[label] for label in LABELS])
+        np.savez_compressed(file, values=values, offsets=self.offsets, labels=json.dumps(self.labels))
+
+    def run(self, index):
+        """
+        The columns of a single run.
+        :param index: number of the run
+        :type index: int
+        :return: a view of every column of the run
+        :rtype: dict of label to numpy array
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return {label: column[start:end] for label, column in self.columns.items()}
+
+
+def durations(mask, first=False):
+    """
+    Minutes every row has been part of its run of True values (rows are logged once a minute).
+
+    :param mask: the condition of every row, one row per candidate threshold
+    :type mask: numpy array of bools
+    :param first: whether a run starting on the first row counts, which it does not for a deviation from a setpoint
+    :type first: bool
+    :return: the minutes since the start of the run of each row, -1 for rows that are not in a run
+    :rtype: numpy array of ints
+    """
+    starts = run_starts(mask)
+    counted = starts >= 0 if first else starts > 0
+    return np.where(counted, np.arange(mask.shape[-1]) - starts, -1)
+
+
+def first_alerts(lasted, allowances, onset):
+    """
+    Scores every allowance of every candidate at once: a row alerts when its deviation has lasted longer than the
+    allowance, so the first alert after the onset is where the running maximum of the durations first exceeds it.
+
+    :param lasted: minutes each row's deviation has lasted (-1 without one), one row per candidate threshold
+    :type lasted: 2D numpy array of ints
+    :param allowances: the candidate allowances in minutes
+    :type allowances: numpy array
+    :param onset: row of the onset of the labeled deviation
+    :type onset: int
+    :return: whether an alert was raised before the onset, and the minutes from the onset to the first alert after it
+    (-1 if there is none), for every candidate and allowance
+    :rtype: tuple of 2D numpy arrays
+    """
+    before = lasted[:, :onset].max(axis=1, initial=-1)[:, None] > allowances
+    peaks = np.maximum.accumulate(lasted[:, onset:], axis=1)
+    delay = (peaks[:, :, None] <= allowances).sum(axis=1)
+    return before, np.where(delay < peaks.shape[1], delay, -1)
+
+
+def score_constant(label, values, onset, rpm_before):
+    """
+    Scores the tolerance x allowance grid of a parameter held at a setpoint (temp, airflow and agitation).
+
+    :param label: header of the parameter
+    :type label: str
+    :param values: the recorded values of the parameter
+    :type values: numpy array
+    :param onset: row of the onset of the labeled deviation
+    :type onset: int
+    :param rpm_before: the agitation setpoint of every row before the ramp detection, see batch_report.rpm_setpoints
+    :type rpm_before: numpy array
+    :return: see first_alerts
+    :rtype: tuple of 2D numpy arrays
+    """
+    tolerances = GRIDS[label]['tolerance'][:, None]
+    if label == 'Agitation [rpm]':
+        lasted = np.where(rpm_before == 1000, durations(np.abs(1000 - values) > tolerances),
+                          durations(np.abs(1500 - values) > tolerances))
+    else:
+        lasted = durations(np.abs(SETPOINTS[label][0] - values) > tolerances)
+    return first_alerts(lasted, GRIDS[label]['allowance'], onset)
+
+
+def score_pump(label, values, onset, rpm_after):
+    """
+    Scores the on x off allowance grid of a pump. A pump alerts when it has been on longer than the on allowance, off
+    longer than the off allowance after the agitation ramp (PRE_RAMP_ALLOWANCE before it), or out of its tolerance
+    longer than ALLOWANCE, and the first of these alerts counts.
+
+    :param label: header of the pump
+    :type label: str
+    :param values: the recorded values of the pump
+    :type values: numpy array
+    :param onset: row of the onset of the labeled deviation
+    :type onset: int
+    :param rpm_after: the agitation setpoint of every row after the ramp detection, see batch_report.rpm_setpoints
+    :type rpm_after: numpy array
+    :return: see first_alerts
+    :rtype: tuple of 2D numpy arrays
+    """
+    setpoint, tolerance = SETPOINTS[label]
+    off = values == 0
+    out = ~off & (np.abs(setpoint - values) > tolerance)
+    off_lasted = durations(off, first=True)
+    pre_ramp = (run_starts(off) == 0) | (rpm_after == 1000)
+
+    on_before, on_delay = first_alerts(np.where(off | out, -1, durations(~off, first=True))[None],
+                                       GRIDS[label]['on'], onset)
+    off_before, off_delay = first_alerts(np.where(pre_ramp, -1, off_lasted)[None], GRIDS[label]['off'], onset)
+    fixed = (off & pre_ramp & (off_lasted > PRE_RAMP_ALLOWANCE)) | (durations(out, first=True) > ALLOWANCE)
+    fixed_delay = np.flatnonzero(fixed[onset:])
+
+    before = on_before.T | off_before | fixed[:onset].any()
+    never = np.iinfo(np.int64).max
+    delays = [np.where(delay < 0, never, delay) for delay in (on_delay.T, off_delay)]
+    delay = np.minimum(np.minimum(*delays), fixed_delay[0] if fixed_delay.size else never)
+    return before, np.where(delay == never, -1, delay)
+
+
+def evaluate(corpus, label):
+    """
+    Scores the whole grid of a parameter on every run of the corpus. An alert before the onset of a run's deviation
+    is a false alarm, and the first alert after the onset of a deviation of this parameter is its detection. Alerts
+    on other parameters' deviations after their onset are knock-on effects and are not counted, like in the campaign.
+
+    :param corpus: the labeled runs
+    :type corpus: Corpus
+    :param label: header of the parameter
+    :type label: str
+    :return: the axes of the grid and the precision, recall, detection delay percentiles and false alarms of every
+    grid point
+    :rtype: dict
+    """
+    axes = list(GRIDS[label])
+    shape = tuple(GRIDS[label][axis].size for axis in axes)
+    false_alarms = np.zeros(shape, dtype=int)
+    delays = []
+    for index, scenario in enumerate(corpus.labels):
+        run = corpus.run(index)
+        rpm_before, rpm_after = rpm_setpoints(run['Agitation [rpm]'])
+        if label in PUMP_SPECS:
+            before, delay = score_pump(label, run[label], scenario['onset'], rpm_after)
+        else:
+            before, delay = score_constant(label, run[label], scenario['onset'], rpm_before)
+        false_alarms += before
+        if DEVIATIONS[scenario['deviation']] == label:
+            delays.append(np.where(delay >= 0, delay, np.nan))
+
+    delays = np.array(delays).reshape(-1, *shape)
+    detected = np.sum(~np.isnan(delays), axis=0)
+    alerts = detected + false_alarms
+    with np.errstate(invalid='ignore', divide='ignore'):
+        precision = np.where(alerts > 0, detected / alerts, np.nan)
+        recall = detected / len(delays) if len(delays) else np.full(shape, np.nan)
+    percentiles = {}
+    for percentile in (50, 90):
+        percentiles[percentile] = np.full(shape, np.nan)
+        if len(delays):
+            # grid points that detected nothing have no delay
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                percentiles[percentile] = np.nanpercentile(delays, percentile, axis=0)
+    return {'axes': axes, 'grid': [GRIDS[label][axis] for axis in axes], 'positives': len(delays),
+            'precision': precision, 'recall': recall, 'delay_p50': percentiles[50], 'delay_p90': percentiles[90],
+            'false_alarms': false_alarms}
+
+
+def point(result, position):
+    """
+    The scores of a single grid point.
+    :param result: the scores of a parameter from evaluate
+    :type result: dict
+    :param position: index of the point in every axis
+    :type position: tuple of ints
+    :return: the value of every axis along with the scores of the point
+    :rtype: dict
+    """
+    scores = {axis: values[index].item() for axis, values, index in zip(result['axes'], result['grid'], position)}
+    for key in ('precision', 'recall', 'delay_p50', 'delay_p90', 'false_alarms'):
+        value = result[key][position].item()
+        scores[key] = None if isinstance(value, float) and np.isnan(value) else value
+    return scores
+
+
+def frontier(result):
+    """
+    Finds the grid points that are not dominated by another one, i.e. no other point has at least the same precision
+    and recall and at most the same median detection delay while being better in one of them.
+
+    :param result: the scores of a parameter from evaluate
+    :type result: dict
+    :return: the points of the frontier from the highest recall and lowest delay down
+    :rtype: list of dicts
+    """
+    precision = np.nan_to_num(result['precision'], nan=0).ravel()
+    recall = np.nan_to_num(result['recall'], nan=0).ravel()
+    delay = np.nan_to_num(result['delay_p50'], nan=np.inf).ravel()
+    at_least = (precision[:, None] >= precision) & (recall[:, None] >= recall) & (delay[:, None] <= delay)
+    better = (precision[:, None] > precision) | (recall[:, None] > recall) | (delay[:, None] < delay)
+    dominated = (at_least & better).any(axis=0)
+    # of points with the same scores only the first (smallest thresholds) is kept
+    scores = np.column_stack((precision, recall, delay))
+    _, first = np.unique(scores, axis=0, return_index=True)
+    kept = np.zeros(precision.size, dtype=bool)
+    kept[first] = True
+    indices = np.flatnonzero(~dominated & kept)
+    indices = indices[np.lexsort((delay[indices], -recall[indices]))]
+    shape = result['precision'].shape
+    return [point(result, np.unravel_index(index, shape)) for index in indices]
+
+
+def format_point(scores, axes):
+    """
+    One line of the frontier table.
+    """
+    cells = ''.join(f'{scores[axis]:>10g}' for axis in axes)
+    for key, width in (('precision', 11), ('recall', 8)):
+        cells += f'{scores[key]:>{width}.1%}' if scores[key] is not None else f'{"-":>{width}}'
+    for key in ('delay_p50', 'delay_p90'):
+        cells += f'{scores[key]:>7.0f}' if scores[key] is not None else f'{"-":>7}'
+    return cells + f'{scores["false_alarms"]:>7}'
+
+
+def main(argv=None):
+    """
+    Command line entry point, e.g. python tuning.py --corpus corpus.npz --scenarios 1000 --json frontier.json
+    :param argv: command line arguments, by default sys.argv
+    :type argv: list
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Sweep the detection thresholds over a corpus of labeled runs')
+    parser.add_argument('--corpus', default='corpus.npz',
+                        help='cache of the labeled runs, simulated from campaign scenarios if it does not exist')
+    parser.add_argument('--rebuild', action='store_true', help='simulate the corpus again even if the cache exists')
+    parser.add_argument('--scenarios', type=int, default=500, help='number of scenarios of a new corpus (default 500)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the scenario generator (default 0)')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default one per core)')
+    parser.add_argument('--parameters', nargs='+', default=list(GRIDS), choices=list(GRIDS), metavar='PARAMETER',
+                        help='parameters to tune (default all of them)')
+    parser.add_argument('--json', help='write the frontier and current thresholds of every parameter to this file')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if os.path.exists(args.corpus) and not args.rebuild:
+        corpus = Corpus.load(args.corpus)
+        print(f'loaded {len(corpus)} runs ({corpus.offsets[-1]} rows) from {args.corpus} '
+              f'in {time.perf_counter() - start:.1f} s')
+    else:
+        corpus = Corpus.build(generate_scenarios(args.scenarios, args.seed), args.processes)
+        corpus.save(args.corpus)
+        print(f'simulated {len(corpus)} runs ({corpus.offsets[-1]} rows) into {args.corpus} '
+              f'in {time.perf_counter() - start:.1f} s')
+
+    report = {}
+    for label in args.parameters:
+        start = time.perf_counter()
+        result = evaluate(corpus, label)
+        axes = result['axes']
+        position = tuple(int(np.flatnonzero(np.isclose(values, value))[0])
+                         for values, value in zip(result['grid'], current(label)))
+        report[label] = {'axes': axes, 'positives': result['positives'], 'current': point(result, position),
+                         'frontier': frontier(result)}
+        print(f'\n{label}: {result["precision"].size} grid points on {result["positives"]} deviations in '
+              f'{time.perf_counter() - start:.2f} s')
+        print(''.join(f'{axis:>10}' for axis in axes) + f'{"precision":>11}{"recall":>8}{"p50":>7}{"p90":>7}'
+              f'{"false":>7}')
+        print(format_point(report[label]['current'], axes) + '  (current)')
+        for scores in report[label]['frontier']:
+            print(format_point(scores, axes))
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()